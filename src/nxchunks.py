@@ -0,0 +1,676 @@
+import atexit
+import os
+import threading
+import zlib
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, parallel reads fall back to reading in this process
+    shared_memory = None
+
+# Upper bound on the size of a single block read from a dataset
+DEFAULT_BUFFER_BYTES = 64 * 1024 * 1024
+# Blocks drawn when sampling are at least this big, so contiguous datasets are not sampled row by row
+SAMPLE_BLOCK_BYTES = 1024 * 1024
+
+
+def block_shape(dset, max_bytes=DEFAULT_BUFFER_BYTES):
+    """
+    Choose the shape of the blocks used to walk through a dataset.
+
+    Blocks are whole multiples of the storage chunk shape (or of a single row
+    for contiguous datasets), grown from the fastest varying dimension outwards
+    until they would exceed max_bytes.
+
+    :param dset: h5py dataset
+    :param max_bytes: Upper bound on the size of a block in bytes
+    :return: Tuple with the block size along each dimension
+    """
+    shape = dset.shape
+    if dset.chunks is not None:
+        block = list(dset.chunks)
+    else:
+        block = [1] + list(shape[1:])
+    max_elements = max(1, max_bytes // max(1, dset.dtype.itemsize))
+    for axis in reversed(range(len(shape))):
+        factor = max(1, max_elements // max(1, int(np.prod(block))))
+        block[axis] = min(shape[axis], block[axis] * factor)
+        if block[axis] < shape[axis]:
+            break
+    return tuple(max(1, size) for size in block)
+
+
+def iter_chunk_slices(dset, max_bytes=DEFAULT_BUFFER_BYTES, start=0, stop=None):
+    """
+    Yield tuples of slices which together cover the dataset, in storage chunk order.
+
+    :param dset: h5py dataset
+    :param max_bytes: Upper bound on the size of the block selected by each tuple of slices
+    :param start: First row (index in the first dimension) to cover
+    :param stop: Row to stop before, defaults to the end of the dataset
+    :return: Generator of tuples of slices
+    """
+    shape = dset.shape
+    if shape is None or len(shape) == 0:
+        yield ()
+        return
+    stop = shape[0] if stop is None else min(stop, shape[0])
+    if 0 in shape or start >= stop:
+        return
+    block = block_shape(dset, max_bytes)
+    # Block boundaries in the first dimension stay aligned to the chunk grid even for a partial range
+    first_rows = list(range(start - start % block[0], stop, block[0]))
+    grid = [range(0, size, step) for size, step in zip(shape, block)]
+    grid[0] = first_rows
+    for corner in np.ndindex(*[len(axis) for axis in grid]):
+        starts = [grid[axis][index] for axis, index in enumerate(corner)]
+        selection = [slice(begin, min(begin + step, size)) for begin, step, size in zip(starts, block, shape)]
+        selection[0] = slice(max(selection[0].start, start), min(selection[0].stop, stop))
+        yield tuple(selection)
+
+
+def iter_chunks(dset, max_bytes=DEFAULT_BUFFER_BYTES):
+    """
+    Read a dataset block by block with memory bounded by max_bytes.
+
+    :param dset: h5py dataset
+    :param max_bytes: Upper bound on the size of each block in bytes
+    :return: Generator of (tuple of slices, numpy array) pairs
+    """
+    for selection in iter_chunk_slices(dset, max_bytes):
+        yield selection, np.asarray(dset[selection])
+
+
+def search_sorted(dset, value, side='left', max_bytes=DEFAULT_BUFFER_BYTES):
+    """
+    numpy.searchsorted of a value in a sorted one dimensional dataset, reading single values to halve the
+    rows searched until they fit in a block of max_bytes, and then that block, rather than the whole dataset
+
+    :param dset: h5py dataset, sorted
+    :param value: Value to search for
+    :param side: 'left' for the first index whose value is not less than value, 'right' for the first greater
+    :param max_bytes: Upper bound on the size of the block read at the end
+    :return: The index
+    """
+    low, high = 0, dset.shape[0]
+    rows = block_shape(dset, max_bytes)[0]
+    while high - low > rows:
+        middle = (low + high) // 2
+        found = dset[middle]
+        if found < value or (side == 'right' and found == value):
+            low = middle + 1
+        else:
+            high = middle
+    return low + int(np.searchsorted(dset[low:high], value, side=side))
+
+
+class DatasetReduction(object):
+    """
+    Running reductions over the blocks of a dataset.
+
+    Holds the minimum and maximum (leaving out NaNs), sum and number of elements seen so far.
+    For one dimensional datasets it also tracks whether the values are monotonically
+    non-decreasing, a NaN counting as a decrease (monotonic is None for other datasets),
+    and if limits (minimum, maximum) are given, whether every value lies between them
+    inclusive. The first offending index is recorded for both.
+    """
+
+    def __init__(self, limits=None):
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.count = 0
+        self.total = None
+        self.monotonic = True
+        self.first_decrease = None
+        self.limits = limits
+        self.within_limits = True
+        self.first_outside_limits = None
+        self._last = None
+
+    def update(self, block, selection=()):
+        """
+        Fold a block of data into the running reductions
+
+        :param block: numpy array read from the dataset
+        :param selection: Tuple of slices the block was read from
+        """
+        block = np.asarray(block)
+        self.count += block.size
+        if block.size == 0:
+            return
+        starts = [s.start or 0 for s in selection]
+
+        values = block
+        if block.dtype.kind in 'fc':
+            nans = np.isnan(block)
+            if nans.any():
+                values = block[~nans]
+        if values.size > 0 and block.dtype.kind in 'biuf':
+            block_min = values.min()
+            block_max = values.max()
+            self.min = block_min if self.min is None else min(self.min, block_min)
+            self.max = block_max if self.max is None else max(self.max, block_max)
+            self.sum += values.sum(dtype=np.float64 if block.dtype.kind == 'f' else None)
+
+        if block.ndim == 1 and block.dtype.kind in 'biuf':
+            if self.monotonic:
+                # Compared without subtracting so unsigned values can't wrap, and so that NaNs fail
+                if self._last is not None and not block[0] >= self._last:
+                    self.monotonic = False
+                    self.first_decrease = starts[0] if starts else 0
+                else:
+                    decreases = np.flatnonzero(~(block[1:] >= block[:-1]))
+                    if decreases.size > 0:
+                        self.monotonic = False
+                        self.first_decrease = (starts[0] if starts else 0) + int(decreases[0]) + 1
+            self._last = block[-1]
+        elif block.ndim != 1:
+            self.monotonic = None
+
+        if self.limits is not None and self.within_limits:
+            outside = ~((block >= self.limits[0]) & (block <= self.limits[1]))
+            if outside.any():
+                self.within_limits = False
+                self.first_outside_limits = _first_index(outside, starts)
+
+    def __str__(self):
+        return "min={}, max={}, sum={}, count={}, monotonic={}, within_limits={}".format(
+            self.min, self.max, self.sum, self.count, self.monotonic, self.within_limits)
+
+    __repr__ = __str__
+
+    @property
+    def failed(self):
+        """
+        Whether the values decrease, or one of them is outside the limits
+        """
+        return self.monotonic is False or not self.within_limits
+
+    @property
+    def coverage(self):
+        """
+        :return: Fraction of the dataset the reductions are based on
+        """
+        if not self.total:
+            return 1.0
+        return self.count / float(self.total)
+
+
+def _first_index(mask, starts):
+    """
+    Index in the dataset of the first True value of a mask of a block, a number for one dimensional datasets
+    """
+    position = np.unravel_index(int(np.argmax(mask)), mask.shape)
+    index = tuple(start + offset for start, offset in zip(starts, position)) if starts else position
+    return index[0] if len(index) == 1 else index
+
+
+class Sampling(object):
+    """
+    Statistical sampling of large datasets for content checks.
+
+    Datasets bigger than min_bytes are checked on a random, chunk aligned subset of about
+    fraction of their blocks; smaller ones are always read in full. The subset depends only
+    on the seed and the path of the dataset in the file, so repeated runs give the same verdict.
+    The number of elements read and the number available are accumulated so the coverage
+    can be reported alongside the result.
+    """
+
+    def __init__(self, fraction, seed=0, min_bytes=DEFAULT_BUFFER_BYTES):
+        if not 0 < fraction <= 1:
+            raise ValueError("The sample fraction must be greater than 0 and at most 1, not {}".format(fraction))
+        self.fraction = fraction
+        self.seed = seed
+        self.min_bytes = min_bytes
+        self.elements_read = 0
+        self.elements_total = 0
+
+    def select(self, dset):
+        """
+        Choose the blocks of a dataset to read
+
+        :param dset: h5py dataset
+        :return: Generator of tuples of slices in storage order, or None if the whole dataset should be read
+        """
+        if dset.size * dset.dtype.itemsize <= self.min_bytes:
+            return None
+        # The blocks of iter_chunk_slices, numbered in the order it gives them, of which only the chosen
+        # numbers are kept
+        shape = dset.shape
+        block = block_shape(dset, SAMPLE_BLOCK_BYTES)
+        grid = [-(-size // step) for size, step in zip(shape, block)]
+        n_total = int(np.prod(grid))
+        random = np.random.RandomState((self.seed + zlib.crc32(dset.name.encode('utf8'))) % 2 ** 32)
+        chosen = _choose(random, n_total, max(1, int(round(self.fraction * n_total))))
+        return (tuple(slice(corner * step, min((corner + 1) * step, size))
+                      for corner, step, size in zip(np.unravel_index(index, grid), block, shape))
+                for index in chosen)
+
+    def record(self, elements_read, elements_total):
+        self.elements_read += elements_read
+        self.elements_total += elements_total
+
+    def reset_coverage(self):
+        self.elements_read = 0
+        self.elements_total = 0
+
+    def coverage(self):
+        """
+        :return: Fraction of the elements of the checked datasets which were read, None if none were checked
+        """
+        if self.elements_total == 0:
+            return None
+        return self.elements_read / float(self.elements_total)
+
+
+def _choose(random, n_total, n_chosen):
+    """
+    n_chosen distinct numbers below n_total, sorted, using memory for the numbers chosen only (Floyd's algorithm)
+    """
+    chosen = set()
+    for last in range(n_total - n_chosen, n_total):
+        number = int(random.randint(0, last + 1))
+        chosen.add(last if number in chosen else number)
+    return sorted(chosen)
+
+
+# Checks may run in several threads, each with its own Sampling
+_state = threading.local()
+
+
+def set_sampling(sampling):
+    """
+    Set the Sampling used by content checks in this thread, None to always read datasets in full
+    """
+    _state.sampling = sampling
+
+
+def get_sampling():
+    return getattr(_state, 'sampling', None)
+
+
+def set_content_checks(enabled):
+    """
+    Set whether recipes run their optional checks of the values of large datasets in this thread,
+    the ones which are too slow to run by default
+    """
+    _state.content_checks = enabled
+
+
+def get_content_checks():
+    return getattr(_state, 'content_checks', False)
+
+
+def reduce_dataset(dset, max_bytes=DEFAULT_BUFFER_BYTES, sampling=None, limits=None, stop_at_failure=False):
+    """
+    Compute summary values of a dataset without reading it into memory all at once.
+
+    The dataset is read in blocks aligned to its storage chunks, so memory use is
+    bounded by max_bytes however large the dataset is. When sampling, only a random
+    subset of the blocks of a large dataset is read and the results describe that subset.
+
+    :param dset: h5py dataset
+    :param max_bytes: Upper bound on the size of each block read in bytes
+    :param sampling: Sampling to use, defaults to the one given to set_sampling; False forces a full scan
+    :param limits: Optional (minimum, maximum) the values of the dataset must lie between
+    :param stop_at_failure: Stop reading once the reduction has failed, see DatasetReduction.failed, leaving
+                            the other reductions and the coverage to the blocks read so far
+    :return: DatasetReduction holding the results
+    """
+    if sampling is None:
+        sampling = get_sampling()
+    reduction = DatasetReduction(limits)
+    reduction.total = dset.size
+    selections = sampling.select(dset) if sampling else None
+    if selections is None:
+        selections = iter_chunk_slices(dset, max_bytes)
+    for selection in selections:
+        reduction.update(dset[selection], selection)
+        if stop_at_failure and reduction.failed:
+            break
+    if sampling:
+        sampling.record(reduction.count, reduction.total)
+    return reduction
+
+
+class Reservation(object):
+    """
+    Memory taken from a MemoryBudget, given back by release() or at the end of a with block
+    """
+
+    def __init__(self, budget, nbytes):
+        self.budget = budget
+        self.nbytes = nbytes
+
+    def release(self):
+        if self.budget is not None and self.nbytes:
+            self.budget._give_back(self.nbytes)
+        self.nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MemoryBudget(object):
+    """
+    Memory shared by all the reads of a run, across threads and the worker processes.
+
+    Readers reserve memory before large reads. A reservation blocks until enough of the
+    budget is free, and may be granted less than asked for so that readers which can
+    split their work use smaller batches instead of waiting. The budget can be handed
+    to worker processes when they are started (e.g. through a pool initializer).
+    """
+
+    def __init__(self, total_bytes):
+        import multiprocessing
+        if total_bytes <= 0:
+            raise ValueError("The memory budget must be positive, not {}".format(total_bytes))
+        self.total = total_bytes
+        self._free = multiprocessing.Value('q', total_bytes, lock=False)
+        self._condition = multiprocessing.Condition()
+
+    @property
+    def free(self):
+        return self._free.value
+
+    def reserve(self, nbytes, minimum=None, timeout=None):
+        """
+        Take up to nbytes from the budget, waiting until at least minimum bytes are free
+
+        :param nbytes: Bytes wanted, limited to the whole budget
+        :param minimum: Bytes needed to make progress, by default all of nbytes
+        :param timeout: Seconds to wait at most, then take minimum anyway so large reads cannot stall forever
+        :return: Reservation for the bytes granted, at least minimum and at most nbytes
+        """
+        nbytes = min(int(nbytes), self.total)
+        minimum = nbytes if minimum is None else min(int(minimum), nbytes)
+        with self._condition:
+            self._condition.wait_for(lambda: self._free.value >= minimum, timeout)
+            granted = max(minimum, min(nbytes, self._free.value))
+            self._free.value -= granted
+        return Reservation(self, granted)
+
+    def _give_back(self, nbytes):
+        with self._condition:
+            self._free.value += nbytes
+            self._condition.notify_all()
+
+
+_memory_budget = None
+
+
+def set_memory_budget(budget):
+    """
+    Set the MemoryBudget of this process, None for no limit
+    """
+    global _memory_budget
+    _memory_budget = budget
+
+
+def set_thread_memory_budget(budget):
+    """
+    Set a MemoryBudget for the reads of this thread only, in place of the one of the process,
+    None to go back to the budget of the process
+    """
+    _state.memory_budget = budget
+
+
+def get_memory_budget():
+    """
+    The MemoryBudget the reads of this thread take from, None if there is no limit
+    """
+    budget = getattr(_state, 'memory_budget', None)
+    return _memory_budget if budget is None else budget
+
+
+def reserve_memory(nbytes, minimum=None, timeout=None):
+    """
+    Reserve memory from the budget of this process, see MemoryBudget.reserve.
+    Without a budget all of nbytes is granted straight away.
+    """
+    budget = get_memory_budget()
+    if budget is None:
+        return Reservation(None, int(nbytes))
+    return budget.reserve(nbytes, minimum, timeout)
+
+
+def parse_size(size):
+    """
+    Number of bytes in a size such as 512M, 4G or 1000000
+
+    :param size: Number with an optional K, M, G or T suffix (powers of 1024)
+    :return: The size in bytes
+    """
+    size = size.strip().upper().rstrip("B")
+    factor = 1
+    if size and size[-1] in "KMGT":
+        factor = 1024 ** ("KMGT".index(size[-1]) + 1)
+        size = size[:-1]
+    return int(float(size) * factor)
+
+
+def selection_nbytes(dset, selection=Ellipsis):
+    """
+    Size in bytes of the array read by dset[selection]
+    """
+    # indexing a zero-strided view gives the shape of the selection without reading anything
+    try:
+        shape = np.broadcast_to(np.empty((), dtype=np.bool_), dset.shape)[selection].shape
+    except Exception:
+        # selections only h5py understands, assume the worst
+        shape = dset.shape
+    return int(np.prod(shape)) * dset.dtype.itemsize
+
+
+def read_dataset(dset, selection=Ellipsis, timeout=None):
+    """
+    dset[selection], waiting until the memory budget of the process can hold it, or at most
+    timeout seconds. The reservation only throttles the read: the array returned belongs to the caller.
+    """
+    with reserve_memory(selection_nbytes(dset, selection), timeout=timeout):
+        return dset[selection]
+
+
+def memory_map(dset):
+    """
+    Give zero-copy, read only access to a dataset stored contiguously and unfiltered.
+
+    Such datasets are a plain run of bytes in the file, so they can be mapped with
+    numpy.memmap and repeated reads are served from the operating system's page cache.
+    Any other dataset (chunked, compressed, compact, external or not of a simple numeric
+    or fixed length string type) is returned unchanged, so the result can be sliced
+    the same way in either case.
+
+    :param dset: h5py dataset
+    :return: numpy.memmap of the dataset, or the h5py dataset itself
+    """
+    if dset.chunks is not None or dset.external is not None or len(dset.shape) == 0 or dset.size == 0:
+        return dset
+    if dset.dtype.kind not in 'biufcS' or dset.file.driver not in ('sec2', 'stdio'):
+        return dset
+    offset = dset.id.get_offset()
+    # Space is not allocated in the file until something is written, reads then give the fill value
+    if offset is None or dset.id.get_storage_size() < dset.size * dset.dtype.itemsize:
+        return dset
+    if not os.path.isfile(dset.file.filename):
+        return dset
+    return np.memmap(dset.file.filename, mode='r', dtype=dset.dtype, offset=offset, shape=dset.shape)
+
+
+def read_rows(group, name, start, stop, workers=None, mapped=None):
+    """
+    Read rows start to stop of a dataset in a group: with read_parallel if workers are given, otherwise by
+    slicing the memory_map of the dataset.
+
+    :param group: h5py group holding the dataset
+    :param name: Name of the dataset in the group
+    :param start: First row read
+    :param stop: Row after the last one read
+    :param workers: Number of processes decompressing the rows, None or 0 to read them in this process
+    :param mapped: Optional dict from dataset name to memory_map result, filled as datasets are first read
+    so that a dataset read repeatedly is only mapped once
+    :return: numpy array, or numpy.memmap slice, of the rows
+    """
+    if workers:
+        return read_parallel(group[name], start, stop, workers=workers)
+    if mapped is None:
+        return memory_map(group[name])[start:stop]
+    if name not in mapped:
+        mapped[name] = memory_map(group[name])
+    return mapped[name][start:stop]
+
+
+class SharedArray(np.ndarray):
+    """
+    numpy array backed by a multiprocessing.shared_memory block.
+
+    The array keeps the block alive; it is released when the last view of the array is.
+    """
+    shared_memory = None
+
+    def __array_finalize__(self, obj):
+        self.shared_memory = getattr(obj, 'shared_memory', None)
+
+
+def _read_blocks_into_shared_memory(filename, dataset_name, shared_memory_name, shape, dtype, start, selections):
+    """
+    Worker side of read_parallel: open the file independently and decode
+    the given blocks straight into the shared memory buffer.
+    """
+    import h5py
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+    try:
+        destination = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        with h5py.File(filename, 'r') as nx_file:
+            dset = nx_file[dataset_name]
+            for selection in selections:
+                target = (slice(selection[0].start - start, selection[0].stop - start),) + tuple(selection[1:])
+                dset.read_direct(destination, source_sel=selection, dest_sel=target)
+        del destination
+    finally:
+        block.close()
+    return len(selections)
+
+
+# Process pools of read_parallel, by process and number of workers, kept between reads
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def worker_pool(workers):
+    """
+    The process pool read_parallel uses for a number of workers, started on first use and then kept
+    until shutdown_pools or the end of the program, so the worker processes are only spawned once
+
+    :param workers: Number of worker processes
+    :return: concurrent.futures.ProcessPoolExecutor
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    # A forked child must not use the pools of its parent
+    key = (os.getpid(), workers)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[key]
+
+
+def shutdown_pools():
+    """
+    Stop the worker processes of the pools started by worker_pool
+    """
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_pools)
+
+
+def _discard_pool(pool):
+    with _pools_lock:
+        for key in [key for key, value in _pools.items() if value is pool]:
+            del _pools[key]
+
+
+def read_parallel(dset, start=0, stop=None, workers=None, max_bytes=DEFAULT_BUFFER_BYTES, pool=None):
+    """
+    Read rows start:stop of a dataset using a pool of processes.
+
+    Decompressing filtered chunks is CPU bound and h5py does it in a single thread, so the
+    chunk grid is split between worker processes. Each one opens the file itself and decodes
+    its chunks directly into a shared memory block, which is returned to the caller as a
+    numpy array without copying.
+
+    Falls back to an ordinary read when only one worker is requested, shared memory is
+    not available, the file is not on disk or the dataset cannot live in a flat buffer
+    (for example variable length strings).
+
+    :param dset: h5py dataset
+    :param start: First row to read
+    :param stop: Row to stop before, defaults to the end of the dataset
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param max_bytes: Upper bound on the size of the block each worker decodes at once, smaller reads are
+                      split into about four blocks for each worker
+    :param pool: Process pool to read with, by default the one worker_pool keeps for this number of workers
+    :return: numpy array (SharedArray when read in parallel)
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(dset.shape) == 0:
+        return dset[()]
+    stop = dset.shape[0] if stop is None else min(stop, dset.shape[0])
+    start = min(start, stop)
+    # Blocks small enough to give every worker a few of them, but never less than a storage chunk
+    chunk_bytes = int(np.prod(block_shape(dset, 1))) * dset.dtype.itemsize
+    total_bytes = (stop - start) * int(np.prod(dset.shape[1:])) * dset.dtype.itemsize
+    block_bytes = min(max_bytes, max(chunk_bytes, total_bytes // (max(workers, 1) * 4)))
+    selections = list(iter_chunk_slices(dset, block_bytes, start, stop))
+    if workers <= 1 or len(selections) <= 1 or shared_memory is None or dset.dtype.hasobject \
+            or not os.path.isfile(dset.file.filename):
+        return dset[start:stop]
+
+    shape = (stop - start,) + tuple(dset.shape[1:])
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dset.dtype.itemsize))
+    try:
+        # Give each worker several contiguous runs of blocks to balance the load
+        n_tasks = min(len(selections), workers * 4)
+        tasks = [list(task) for task in np.array_split(np.arange(len(selections)), n_tasks)]
+        if pool is None:
+            pool = worker_pool(workers)
+        futures = [pool.submit(_read_blocks_into_shared_memory, dset.file.filename, dset.name, block.name,
+                               shape, dset.dtype, start, [selections[i] for i in task])
+                   for task in tasks]
+        try:
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            # A worker died, start a new pool next time
+            _discard_pool(pool)
+            raise
+        except BaseException:
+            # The workers must be done with the shared memory before it goes
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+            raise
+        array = np.ndarray(shape, dtype=dset.dtype, buffer=block.buf).view(SharedArray)
+        array.shared_memory = block
+    except Exception:
+        block.close()
+        raise
+    finally:
+        # The mapping stays valid after unlinking, this only removes the name
+        block.unlink()
+    return array
@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+"""
+Validation plans generated from NXDL application definitions.
+
+The NXDL XML files are not part of this repository; point load_plan at local copies,
+for instance from a checkout of the nexusformat definitions:
+
+    plan = load_plan("definitions/applications/NXtomo.nxdl.xml")
+    values, fails = plan.run(nx_entry)
+
+The plan is an nxschema.Plan for the paths below the NXentry of the definition, like
+the tables written by hand in the recipes. Groups without a name get the default NeXus
+name (their type without the NX prefix). Fields and groups are required unless marked
+optional or recommended, or with minOccurs="0", and everything inside an optional group
+is optional. Fields get dtype checks for the numeric NeXus types, a dimension check
+when the rank is a number and a SameLength check grouped by symbol when the first
+dimension is given by one. Attributes marked optional="false" are required.
+
+Compiled plans are cached on disk keyed by the hash of the NXDL file, so the XML is
+only parsed again when the file changes.
+"""
+
+import hashlib
+import os
+import pickle
+from xml.etree import ElementTree
+
+from nxschema import compile_schema, Attr, Dims, Dtype, SameLength
+
+# changes whenever the plans generated from the same file would change
+GENERATOR_VERSION = 1
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "nxfeature", "nxdl")
+
+NXDL_NAMESPACE = "{http://definition.nexusformat.org/nxdl/3.1}"
+
+_INTS = ["int8", "int16", "int32", "int64"]
+_UINTS = ["uint8", "uint16", "uint32", "uint64"]
+_FLOATS = ["float32", "float64"]
+NXDL_DTYPES = {
+    "NX_FLOAT": _FLOATS,
+    "NX_INT": _INTS,
+    "NX_UINT": _UINTS,
+    "NX_POSINT": _INTS + _UINTS,
+    "NX_NUMBER": _INTS + _UINTS + _FLOATS,
+    "NX_BOOLEAN": ["bool", "int8", "uint8"],
+}
+
+
+def _tag(element):
+    return element.tag[len(NXDL_NAMESPACE):] if element.tag.startswith(NXDL_NAMESPACE) else element.tag
+
+
+def _children(element, tag):
+    return [child for child in element if _tag(child) == tag]
+
+
+def _optional(element):
+    return (element.get("optional") == "true" or element.get("recommended") == "true"
+            or element.get("minOccurs") == "0")
+
+
+def _field_checks(field):
+    checks = []
+    dtypes = NXDL_DTYPES.get(field.get("type", "NX_CHAR"))
+    if dtypes is not None:
+        checks.append(Dtype(dtypes, message="'{item}' is of type {dtype}, expected " + field.get("type")))
+    for dimensions in _children(field, "dimensions"):
+        rank = dimensions.get("rank", "")
+        if rank.isdigit():
+            checks.append(Dims(int(rank), message="'{item}' has {dims} dimensions, expected {expected}"))
+        for dim in _children(dimensions, "dim"):
+            value = dim.get("value", "")
+            if dim.get("index") == "1" and value and not value.isdigit():
+                checks.append(SameLength(group=value, message="'{item}' does not have the same " + value +
+                                         " as '{reference}'"))
+    for attribute in _children(field, "attribute"):
+        if attribute.get("optional") == "false":
+            checks.append(Attr(attribute.get("name")))
+    return checks
+
+
+def nxdl_table(nxdl_file):
+    """
+    The validation table for an NXDL application definition, see compile_schema
+
+    :param nxdl_file: Path of the .nxdl.xml file
+    :return: name of the definition and table of (optional, checks) keyed by path below the NXentry
+    """
+    definition = ElementTree.parse(nxdl_file).getroot()
+    entries = [group for group in _children(definition, "group") if group.get("type") in ("NXentry", "NXsubentry")]
+    if len(entries) == 0:
+        raise ValueError("{} does not define an NXentry".format(nxdl_file))
+    table = {}
+
+    def visit(group, prefix, optional):
+        for child in group:
+            tag = _tag(child)
+            if tag == "group":
+                name = child.get("name") or child.get("type")[2:]
+                table[prefix + name] = (optional or _optional(child), [])
+                visit(child, prefix + name + "/", optional or _optional(child))
+            elif tag == "field":
+                table[prefix + child.get("name")] = (optional or _optional(child), _field_checks(child))
+
+    visit(entries[0], "", False)
+    return definition.get("name"), table
+
+
+def compile_nxdl(nxdl_file):
+    """
+    Compile an NXDL application definition into a Plan, without the cache
+    """
+    name, table = nxdl_table(nxdl_file)
+    return compile_schema(table, missing="'" + name + "/{item}' is missing from the " + name + " entry")
+
+
+def load_plan(nxdl_file, cache=DEFAULT_CACHE):
+    """
+    The Plan for an NXDL application definition, from the cache when the file has been compiled before
+
+    :param nxdl_file: Path of the .nxdl.xml file
+    :param cache: Directory of the cache, None to always compile
+    :return: the nxschema.Plan
+    """
+    if cache is None:
+        return compile_nxdl(nxdl_file)
+    with open(nxdl_file, "rb") as file:
+        digest = hashlib.sha1(file.read())
+    digest.update(str(GENERATOR_VERSION).encode("utf8"))
+    cache_file = os.path.join(cache, digest.hexdigest() + ".pickle")
+    try:
+        with open(cache_file, "rb") as file:
+            return pickle.load(file)
+    except Exception:
+        pass
+    plan = compile_nxdl(nxdl_file)
+    try:
+        os.makedirs(cache, exist_ok=True)
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        with open(tmp_file, "wb") as file:
+            pickle.dump(plan, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+    return plan
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the validation tables generated from NXDL files")
+    parser.add_argument("--cache", dest="cache", default=DEFAULT_CACHE, metavar="DIR",
+                        help="Directory caching the compiled plans")
+    parser.add_argument("nxdlfile", help="NXDL application definition", nargs='+')
+    args = parser.parse_args()
+
+    for nxdl_file in args.nxdlfile:
+        plan = load_plan(nxdl_file, args.cache)
+        print(nxdl_file)
+        for item, optional, checks in plan.rules:
+            print("\t{}{}: {}".format(item, " (optional)" if optional else "",
+                                      ", ".join(type(check).__name__ for check in checks)))
@@ -5,44 +5,24 @@ import numpy
 import importlib
 import sys
 import os
+import traceback
+
+import nxchunks
+import nxindex
+import nxreport
 
 RECIPE_DIR = os.path.dirname(os.path.realpath(__file__)) + "/recipes"
 sys.path.append(RECIPE_DIR)
 
 
-class TestBody:
-    def __init__(self, failure_type="", failure_message=""):
-        self.failure = failure_type
-        self.message = failure_message
-
-    def get_str(self):
-        return "\n\t\t\t<failure type=\"{}\">{}</failure>".format(self.failure, self.message) if (self.failure and self.message) else "\n"
-
-
-class TestCase:
-    def __init__(self, class_name, name, body=TestBody()):
-        self.class_name = class_name
-        self.name = name
-        self.body = body
-
-    def get_str(self):
-        return "\t\t<testcase classname=\"{}\" name=\"{}\">{}\n\t\t</testcase>".format(self.class_name, self.name, self.body.get_str())
-
-
-class JUnitFactory:
-    def __init__(self):
-        self.test_cases = []
-
-    def write(self, xml_file):
-        output_str = "<testsuites>\n\t<testsuite name=\"features\" tests=\"" + str(len(self.test_cases)) + "\">\n"
-        for test in self.test_cases:
-            output_str += test.get_str() + "\n"
-        output_str += "\t</testsuite>\n</testsuites>"
-        with open(xml_file, "w+") as file:
-            file.write(output_str)
-
-    def add_test_case(self, feat, message, failure_type=None, failure_message=None):
-        self.test_cases.append(TestCase(feat, message, TestBody(failure_type, failure_message)))
+def open_nexus_file(nxsfile, swmr=False):
+    """
+    Open a NeXus file for reading, optionally in SWMR mode so that data appended
+    by a writer can be picked up with Dataset.refresh()
+    """
+    if swmr:
+        return h5py.File(nxsfile, 'r', libver='latest', swmr=True)
+    return h5py.File(nxsfile, 'r')
 
 
 class InsaneEntryWithFeatures:
@@ -54,10 +34,23 @@ class InsaneEntryWithFeatures:
     def features(self):
         return self.featurearray
 
+    def feature_recipe(self, featureid):
+        featuremodule = importlib.import_module("{:0>16X}.recipe".format(featureid))
+        return featuremodule.recipe(self.nxsfile, self.entrypath)
+
     def feature_response(self, featureid):
+        return self.feature_recipe(featureid).process()
+
+    def feature_monitors(self, featureid):
+        """
+        Monitors for incremental validation of a file being written in SWMR mode,
+        None if the recipe does not support it
+        """
         featuremodule = importlib.import_module("{:0>16X}.recipe".format(featureid))
         r = featuremodule.recipe(self.nxsfile, self.entrypath)
-        return r.process()
+        if not hasattr(r, "monitor"):
+            return None
+        return r.monitor()
 
     def feature_title(self, featureid):
         featuremodule = importlib.import_module("{:0>16X}.recipe".format(featureid))
@@ -65,56 +58,657 @@ class InsaneEntryWithFeatures:
         return r.title
 
 
+_recipe_features = None
+
+
+def recipe_features():
+    """
+    The ids of all the recipes, read from the recipe directory once per process
+    """
+    global _recipe_features
+    if _recipe_features is None:
+        features = []
+        try:
+            for feat in os.listdir(RECIPE_DIR):
+                try:
+                    features.append(int(feat, 16))
+                except:
+                    print("Could not parse feature with name {}".format(feat))
+        except:
+            print("No features in {}".format(RECIPE_DIR))
+        _recipe_features = features
+    return _recipe_features
+
+
 class InsaneFeatureDiscoverer:
-    def __init__(self, nxsfile):
-        self.file = h5py.File(nxsfile, 'r')
+    def __init__(self, nxsfile, swmr=False):
+        self.file = open_nexus_file(nxsfile, swmr)
 
     def entries(self):
-        ent = []
+        """
+        Yield the entries listing their features, as they are found
+        """
+        skipped = 0
         for entry in self.file.keys():
             path = "/{}/features".format(entry)
             try:
                 features = self.file[path]
-                if features.dtype == numpy.dtype("uint64"):
-                    ent.append(InsaneEntryWithFeatures(self.file, entry, features))
+                listed = features.dtype == numpy.dtype("uint64")
             except:
-                print("No features in {}".format(path))
-        return ent
+                skipped += 1
+                continue
+            if listed:
+                yield InsaneEntryWithFeatures(self.file, entry, features)
+        if skipped:
+            print("No features in {} entr{} of {}".format(skipped, "y" if skipped == 1 else "ies", self.file.filename))
 
 
 class AllFeatureDiscoverer:
-    def __init__(self, nxsfile):
-        self.file = h5py.File(nxsfile, 'r')
+    def __init__(self, nxsfile, swmr=False):
+        self.file = open_nexus_file(nxsfile, swmr)
 
     def entries(self):
-        ent = []
+        """
+        Yield every entry, to be checked against all recipes
+        """
+        features = recipe_features()
         for entry in self.file.keys():
-            try:
-                features = []
-                for feat in os.listdir(RECIPE_DIR):
-                    try:
-                        features.append(int(feat, 16))
-                    except:
-                        print("Could not parse feature with name {}".format(feat))
-                ent.append(InsaneEntryWithFeatures(self.file, entry, features))
-            except:
-                print("No features in {}".format(RECIPE_DIR))
-        return ent
+            yield InsaneEntryWithFeatures(self.file, entry, features)
 
 
 class SingleFeatureDiscoverer:
-    def __init__(self, nxsfile, feature):
-        self.file = h5py.File(nxsfile, 'r')
+    def __init__(self, nxsfile, feature, swmr=False):
+        self.file = open_nexus_file(nxsfile, swmr)
         self.feature = feature
 
     def entries(self):
-        ent = []
+        """
+        Yield every entry, to be checked against the given features
+        """
+        features = list(self.feature) if isinstance(self.feature, (list, tuple)) else [self.feature]
         for entry in self.file.keys():
+            yield InsaneEntryWithFeatures(self.file, entry, features)
+
+
+# Pass as features to check every entry against all recipes
+ALL_FEATURES = "all"
+
+
+def make_discoverer(nxsfile, features=None, swmr=False):
+    """
+    Choose the discoverer for the features to check
+
+    :param nxsfile: Name of the NeXus file
+    :param features: None for the features each entry lists, ALL_FEATURES for every recipe,
+                     or a feature id or list of feature ids
+    :param swmr: Open the file in SWMR mode
+    """
+    if features is None:
+        return InsaneFeatureDiscoverer(nxsfile, swmr)
+    if features == ALL_FEATURES:
+        return AllFeatureDiscoverer(nxsfile, swmr)
+    return SingleFeatureDiscoverer(nxsfile, features, swmr)
+
+
+def summarise(value):
+    """
+    Plain data (str, numbers, lists and dicts) describing what a recipe returned, so that
+    it can be reported, cached as JSON or sent to another process. h5py objects are
+    replaced by their path, numpy values by python ones and lazy iterables are consumed.
+
+    :param value: The object returned by a recipe, or part of it
+    :return: A JSON serialisable summary of value
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf8", "replace")
+    if isinstance(value, (h5py.Dataset, h5py.Group)):
+        return value.name
+    if isinstance(value, numpy.generic):
+        return summarise(value.item())
+    if isinstance(value, numpy.ndarray):
+        if value.size > 16:
+            return "array of shape {} {}".format(value.shape, value.dtype)
+        return summarise(value.tolist())
+    if isinstance(value, dict):
+        return dict((str(summarise(k)), summarise(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, map, filter, zip)) or hasattr(value, "__next__"):
+        return [summarise(v) for v in value]
+    return str(value)
+
+
+def summary_text(summary):
+    """
+    Human readable form of a summary, as printed by the command line
+    """
+    if isinstance(summary, str):
+        return summary
+    if isinstance(summary, list):
+        return "[" + ", ".join(summary_text(v) for v in summary) + "]"
+    if isinstance(summary, dict):
+        return "{" + ", ".join("{}: {}".format(k, summary_text(v)) for k, v in summary.items()) + "}"
+    return str(summary)
+
+
+def recipe_summary(recipe, response):
+    """
+    Summary of a recipe response, from recipe.summary(response) if the recipe has one
+    """
+    if hasattr(recipe, "summary"):
+        response = recipe.summary(response)
+    return summarise(response)
+
+
+class FeatureResult(object):
+    """
+    Outcome of checking one feature in one entry of a file.
+
+    Everything but response is plain data, so results can be pickled, cached as JSON
+    or passed between processes. response is the object returned by the recipe and
+    is only kept when the check ran in the calling process, summary is the plain data
+    version of it (see recipe_summary) and message its text. A file which could not
+    be read at all gives a single failed result with entry and feature set to None.
+    """
+    FIELDS = ("path", "entry", "feature", "title", "passed", "message", "error_type", "stack", "coverage", "summary")
+
+    def __init__(self, path, entry, feature, title, passed, message, error_type=None, stack=None, coverage=None,
+                 summary=None, response=None):
+        self.path = path
+        self.entry = entry
+        self.feature = feature
+        self.title = title
+        self.passed = passed
+        self.message = message
+        self.error_type = error_type
+        self.stack = stack
+        self.coverage = coverage
+        self.summary = summary
+        self.response = response
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def __str__(self):
+        feature = "" if self.feature is None else " '{:0>16X}'".format(self.feature)
+        return "{}[{}]{} {}: {}".format(self.path, self.entry, feature, "passed" if self.passed else "failed",
+                                        self.message)
+
+    __repr__ = __str__
+
+
+def check_file(path, features=None, sampling=None, keep_responses=True, content=False):
+    """
+    Check the features of every entry in a NeXus file, yielding each FeatureResult as soon as it is known
+
+    :param path: Name of the NeXus file
+    :param features: See make_discoverer
+    :param sampling: nxchunks.Sampling in use, to report the coverage of each check
+    :param keep_responses: Keep the objects returned by the recipes in the results
+    :param content: Also run the optional content checks of the recipes, see nxchunks.set_content_checks
+    """
+    try:
+        disco = make_discoverer(path, features)
+        entries = iter(disco.entries())
+    except Exception as e:
+        yield FeatureResult(path, None, None, None, False, str(e), type(e).__name__, traceback.format_exc())
+        return
+    while True:
+        # entries are discovered one at a time, so the file can still turn out to be unreadable here
+        try:
+            entry = next(entries, None)
+        except Exception as e:
+            yield FeatureResult(path, None, None, None, False, str(e), type(e).__name__, traceback.format_exc())
+            return
+        if entry is None:
+            return
+        for feat in entry.features():
+            feat = int(feat)
+            if sampling:
+                sampling.reset_coverage()
+            title = None
+            previous_content = nxchunks.get_content_checks()
+            nxchunks.set_content_checks(content)
             try:
-                ent.append(InsaneEntryWithFeatures(self.file, entry, [self.feature]))
-            except:
-                print("Issues with parsing feature {}".format(self.feature))
-        return ent
+                recipe = entry.feature_recipe(feat)
+                title = recipe.title
+                response = recipe.process()
+                summary = recipe_summary(recipe, response)
+                result = FeatureResult(path, entry.entrypath, feat, title, True, summary_text(summary),
+                                       summary=summary, response=response if keep_responses else None)
+            except AssertionError as ae:
+                result = FeatureResult(path, entry.entrypath, feat, title, False, str(ae), type(ae).__name__)
+            except Exception as e:
+                result = FeatureResult(path, entry.entrypath, feat, title, False, str(e), type(e).__name__,
+                                       traceback.format_exc())
+            finally:
+                nxchunks.set_content_checks(previous_content)
+            if sampling:
+                result.coverage = sampling.coverage()
+            yield result
+
+
+def detect_features(nxsfile, entrypath, features=None, errors=None):
+    """
+    The features an entry appears to have, from the detect method of the recipes. Only the
+    metadata of the entry is read, once for all recipes; recipes without a detect method
+    are left out, as are recipes whose detect raises, which are added to errors.
+
+    :param nxsfile: h5py file object of the NeXus file
+    :param entrypath: Path of the entry
+    :param features: Feature ids to try, None for all recipes
+    :param errors: List to append (entry, feature id, exception) to for every detect that raised
+    :return: Sorted list of the ids of the features detected
+    """
+    index = nxindex.EntryIndex(nxsfile, entrypath)
+    entry = InsaneEntryWithFeatures(nxsfile, entrypath, [])
+    detected = []
+    for feat in recipe_features() if features is None else features:
+        try:
+            recipe = entry.feature_recipe(feat)
+            if hasattr(recipe, "detect") and recipe.detect(index):
+                detected.append(feat)
+        except Exception as e:
+            if errors is not None:
+                errors.append((entrypath, feat, e))
+    return sorted(detected)
+
+
+def detect_file(path, features=None, errors=None):
+    """
+    Fingerprint every entry of a NeXus file in one crawl, see detect_features
+
+    :param path: Name of the NeXus file
+    :param features: Feature ids to try, None for all recipes
+    :param errors: See detect_features
+    :return: List of (entry, detected feature ids)
+    """
+    with open_nexus_file(path) as nxsfile:
+        return [(entry, detect_features(nxsfile, entry, features, errors)) for entry in nxsfile.keys()
+                if isinstance(nxsfile[entry], h5py.Group)]
+
+
+def write_features(path, detected):
+    """
+    Record detected features in the /entry/features datasets read by InsaneFeatureDiscoverer,
+    replacing any list already there
+
+    :param path: Name of the NeXus file, which is opened for writing
+    :param detected: List of (entry, feature ids) as returned by detect_file
+    """
+    with h5py.File(path, 'r+') as nxsfile:
+        for entry, features in detected:
+            if "features" in nxsfile[entry]:
+                del nxsfile[entry]["features"]
+            nxsfile[entry].create_dataset("features", data=numpy.array(features, dtype=numpy.uint64))
+
+
+_recipe_digests = {}
+
+
+def _recipe_digest():
+    """
+    Hash of the source of every recipe, read again only when the size or modification time of one changes
+    """
+    import hashlib
+    stats = []
+    for feat in sorted(recipe_features()):
+        filename = os.path.join(RECIPE_DIR, "{:0>16X}".format(feat), "recipe.py")
+        try:
+            stat = os.stat(filename)
+            stats.append((filename, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stats.append((filename, None, None))
+    stats = tuple(stats)
+    if stats not in _recipe_digests:
+        digest = hashlib.sha1()
+        for filename, size, mtime in stats:
+            if size is not None:
+                with open(filename, "rb") as file:
+                    digest.update(file.read())
+        _recipe_digests.clear()
+        _recipe_digests[stats] = digest.hexdigest()
+    return _recipe_digests[stats]
+
+
+def _cache_file(cache, path, features, sample, seed, content=False):
+    """
+    Name of the file caching the results for path, which changes whenever the file, the options or the
+    source of a recipe do
+    """
+    import hashlib
+    import json
+    stat = os.stat(path)
+    key = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime, features, sample, seed, content,
+                      _recipe_digest(), FeatureResult.FIELDS])
+    return os.path.join(cache, hashlib.sha1(key.encode("utf8")).hexdigest() + ".json")
+
+
+def _read_cache(cache_file):
+    import json
+    try:
+        with open(cache_file) as file:
+            return [FeatureResult.from_dict(values) for values in json.load(file)]
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_cache(cache_file, results):
+    import json
+    if not os.path.isdir(os.path.dirname(cache_file)):
+        os.makedirs(os.path.dirname(cache_file))
+    with open(cache_file + ".tmp", "w") as file:
+        json.dump([result.to_dict() for result in results], file)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def _check_file_in_worker(path, features, sample, seed, content=False):
+    """
+    Check one file in a worker process and return its results in a list
+    """
+    sampling = nxchunks.Sampling(sample, seed) if sample is not None else None
+    # Threads of an executor shared between calls must not keep the sampling of this file
+    previous_sampling = nxchunks.get_sampling()
+    nxchunks.set_sampling(sampling)
+    try:
+        return list(check_file(path, features, sampling, keep_responses=False, content=content))
+    finally:
+        nxchunks.set_sampling(previous_sampling)
+
+
+def _check_file_cached(path, features, sample, seed, cache=None, budget=None, content=False):
+    """
+    Check one file in an executor, through the cache and with the memory budget of the call, and return
+    its results in a list
+    """
+    try:
+        cached_name = _cache_file(cache, path, features, sample, seed, content) if cache else None
+    except OSError:
+        cached_name = None
+    cached = _read_cache(cached_name) if cached_name else None
+    if cached is not None:
+        return cached
+    if budget is not None:
+        nxchunks.set_thread_memory_budget(budget)
+    try:
+        results = _check_file_in_worker(path, features, sample, seed, content)
+    finally:
+        if budget is not None:
+            nxchunks.set_thread_memory_budget(None)
+    if cached_name:
+        _write_cache(cached_name, results)
+    return results
+
+
+def shard_key(path):
+    """
+    Stable hash of a file path, the same in every process and on every node
+    """
+    import hashlib
+    return int(hashlib.sha1(os.path.normpath(path).encode("utf8")).hexdigest()[:16], 16)
+
+
+def shard_paths(paths, index, count, balance_size=False):
+    """
+    The paths checked by shard index (from 0) of count, so that shards run without any
+    coordination check every path exactly once between them. Every shard has to be given
+    the same paths, in any order.
+
+    :param paths: All the files to check
+    :param index: Index of this shard
+    :param count: Number of shards
+    :param balance_size: Share out the files by size (largest first, each to the shard with the fewest
+                         bytes so far) rather than by the hash of their path alone
+    :return: The paths for this shard, in their original order
+    """
+    if not balance_size:
+        return [path for path in paths if shard_key(path) % count == index]
+    loads = [0] * count
+    mine = set()
+    files = set(os.path.normpath(path) for path in paths)
+    for size, key, path in sorted(((os.path.getsize(path) if os.path.exists(path) else 0, shard_key(path), path)
+                                   for path in files), key=lambda file: (-file[0], file[1], file[2])):
+        shard = min(range(count), key=lambda s: (loads[s], (s - key) % count))
+        loads[shard] += size
+        if shard == index:
+            mine.add(path)
+    return [path for path in paths if os.path.normpath(path) in mine]
+
+
+def merge_reports(reports):
+    """
+    Results of several JUnit or JSON Lines reports, for instance those of the shards of a run.
+    A report which cannot be read gives a failed result with entry set to None.
+
+    :param reports: File names of the reports
+    """
+    for report in reports:
+        try:
+            for values in nxreport.read_report(report):
+                yield FeatureResult.from_dict(values)
+        except Exception as e:
+            yield FeatureResult(report, None, None, None, False, "not a complete report: {}".format(e),
+                                type(e).__name__, traceback.format_exc())
+
+
+def iter_results(paths, features=None, workers=1, cache=None, sample=None, seed=0, memory_budget=None,
+                 content=False):
+    """
+    Check NeXus files and yield a FeatureResult per file, entry and feature as soon as each is ready.
+
+    With one worker the files are checked in this process, one feature at a time, and the
+    results carry the objects returned by the recipes. With more, whole files are handed to
+    a pool of processes and their results are yielded as each file completes, in completion
+    order; only a bounded number of files is in flight at once.
+
+    :param paths: Iterable of NeXus file names
+    :param features: None for the features each entry lists, ALL_FEATURES for every recipe,
+                     or a feature id or list of feature ids
+    :param workers: Number of processes checking files, None for one per CPU
+    :param cache: Optional directory in which results are cached until a file, the options or a recipe change
+    :param sample: Check the content of large datasets on this fraction of their chunks, see nxchunks.Sampling
+    :param seed: Seed for choosing the sampled chunks
+    :param memory_budget: Bytes that large reads of all the workers may use at once, see nxchunks.MemoryBudget
+    :param content: Also run the optional content checks of the recipes, see nxchunks.set_content_checks
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    sampling = nxchunks.Sampling(sample, seed) if sample is not None else None
+    budget = nxchunks.MemoryBudget(memory_budget) if memory_budget else None
+
+    def cache_file(path):
+        try:
+            return _cache_file(cache, path, features, sample, seed, content) if cache else None
+        except OSError:
+            return None
+
+    if workers <= 1:
+        previous_sampling = nxchunks.get_sampling()
+        previous_budget = nxchunks.get_memory_budget()
+        nxchunks.set_sampling(sampling)
+        nxchunks.set_memory_budget(budget)
+        try:
+            for path in paths:
+                cached_name = cache_file(path)
+                cached = _read_cache(cached_name) if cached_name else None
+                if cached is not None:
+                    for result in cached:
+                        yield result
+                    continue
+                results = []
+                for result in check_file(path, features, sampling, content=content):
+                    if cached_name:
+                        results.append(result)
+                    yield result
+                if cached_name:
+                    _write_cache(cached_name, results)
+        finally:
+            nxchunks.set_sampling(previous_sampling)
+            nxchunks.set_memory_budget(previous_budget)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=nxchunks.set_memory_budget,
+                             initargs=(budget,)) as pool:
+        pending = {}
+
+        def finished(futures):
+            for future in futures:
+                cached_name = pending.pop(future)
+                results = future.result()
+                if cached_name:
+                    _write_cache(cached_name, results)
+                for result in results:
+                    yield result
+
+        for path in paths:
+            cached_name = cache_file(path)
+            cached = _read_cache(cached_name) if cached_name else None
+            if cached is not None:
+                for result in cached:
+                    yield result
+                continue
+            pending[pool.submit(_check_file_in_worker, path, features, sample, seed, content)] = cached_name
+            if len(pending) >= 2 * workers:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for result in finished(done):
+                    yield result
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for result in finished(done):
+                yield result
+
+
+async def aiter_results(paths, features=None, workers=None, concurrency=None, cache=None, sample=None, seed=0,
+                        executor=None, memory_budget=None, content=False):
+    """
+    asyncio version of iter_results, for checking files from inside an event loop.
+
+    Files are checked, and looked up in and written to the cache, in an executor so the
+    event loop is never blocked by HDF5 or the file system, and results are yielded per
+    file, in completion order, through an async iterator. At most concurrency files are
+    handed to the executor at once, and paths are only taken from the iterable as files
+    finish, so a slow consumer holds back the producer. Closing the iterator or cancelling
+    the task consuming it cancels the files that have not started yet; a file already
+    being checked in a worker runs to completion.
+
+    :param paths: Iterable of NeXus file names
+    :param features: See iter_results
+    :param workers: Size of the process pool created when no executor is given, None for one per CPU
+    :param concurrency: Maximum number of files in the executor at once, defaults to workers
+    :param cache: See iter_results
+    :param sample: See iter_results
+    :param seed: See iter_results
+    :param executor: Optional concurrent.futures executor (process or thread) to share between calls
+    :param memory_budget: See iter_results. It applies to the pool created here, or to the calls of this
+                          iterator in a thread pool given. A process pool given needs its own budget, set by
+                          its initializer (nxchunks.set_memory_budget)
+    :param content: See iter_results
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if concurrency is None:
+        concurrency = workers
+    if sample is not None:
+        nxchunks.Sampling(sample, seed)
+    if memory_budget and isinstance(executor, ProcessPoolExecutor):
+        raise ValueError("A memory budget can't be handed to a running process pool, give it one in its initializer")
+    loop = asyncio.get_running_loop()
+    budget = nxchunks.MemoryBudget(memory_budget) if memory_budget else None
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=nxchunks.set_memory_budget,
+                                       initargs=(budget,))
+        # the workers of the pool already have the budget
+        budget = None
+
+    paths = iter(paths)
+    pending = set()
+    try:
+        while True:
+            for path in paths:
+                pending.add(loop.run_in_executor(executor, _check_file_cached, path, features, sample, seed, cache,
+                                                 budget, content))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def follow_swmr(discoverers, interval, idle_refreshes=None, verbose=False):
+    """
+    Keep validating files which are still being written in SWMR mode.
+
+    Every interval seconds the monitors of the recipes which support incremental
+    validation refresh their datasets and check only the newly appended data.
+    Runs until interrupted, or until idle_refreshes refreshes in a row found no new data.
+
+    :param discoverers: (file name, discoverer) pairs, the discoverers must have opened the files with swmr=True
+    :param interval: Seconds between refreshes
+    :param idle_refreshes: Stop after this many refreshes without new data, None to run until interrupted
+    :param verbose: Report which features cannot be validated incrementally
+    :return: True if any refresh found invalid data
+    """
+    import time
+
+    monitors = []
+    for file, disco in discoverers:
+        for entry in disco.entries():
+            for feat in entry.features():
+                try:
+                    feature_monitors = entry.feature_monitors(feat)
+                except Exception as e:
+                    if verbose:
+                        print("\t{}[{}] '{:0>16X}': {}".format(file, entry.entrypath, feat, e))
+                    continue
+                if feature_monitors is None:
+                    if verbose:
+                        print("\t{}[{}] '{:0>16X}' does not support incremental validation".format(
+                            file, entry.entrypath, feat))
+                    continue
+                for monitor in feature_monitors:
+                    print("Following {} in {}[{}]".format(monitor, file, entry.entrypath))
+                    monitors.append((file, entry.feature_title(feat), monitor))
+
+    failed = False
+    idle = 0
+    try:
+        while monitors:
+            for file, title, monitor in monitors:
+                fails = monitor.refresh()
+                if fails:
+                    failed = True
+                    print("\t{} in {} is invalid with the following errors:".format(title, file))
+                    print("\t\t{}".format('\n'.join(fails).replace('\n', '\n\t\t')))
+            if not any(monitor.grew for _, _, monitor in monitors):
+                idle += 1
+                if idle_refreshes is not None and idle >= idle_refreshes:
+                    break
+            else:
+                idle = 0
+                for file, title, monitor in monitors:
+                    print("\t{}".format(monitor))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return failed
 
 
 if __name__ == '__main__':
@@ -124,7 +718,21 @@ if __name__ == '__main__':
         sys.exit(1)
 
     import argparse
-    import traceback
+
+    def parse_shard(value):
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError:
+            raise argparse.ArgumentTypeError("expected INDEX/COUNT, got '{}'".format(value))
+        if count < 1 or not 0 <= index < count:
+            raise argparse.ArgumentTypeError("shard index must be from 0 to {}".format(count - 1))
+        return index, count
+
+    def parse_size(value):
+        try:
+            return nxchunks.parse_size(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError("expected a size such as 512M or 4G, got '{}'".format(value))
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--test", dest="test", help="Test file against all recipes", action="store_true",
@@ -134,62 +742,159 @@ if __name__ == '__main__':
     parser.add_argument("-v", "--verbose", dest="verbose", help="Include full stacktraces of failures", action="store_true",
                         default=False)
     parser.add_argument("-x", "--xml", dest="xml", help="XML file to write the junit output to", default=None)
-    parser.add_argument("nexusfile", help="Nexus file to test", nargs='*')
+    parser.add_argument("--jsonl", dest="jsonl", default=None, metavar="FILE",
+                        help="JSON Lines file to write every result to")
+    parser.add_argument("--csv", dest="csv", default=None, metavar="FILE",
+                        help="CSV file to write a summary of every result to")
+    parser.add_argument("-s", "--sample", dest="sample", type=float, default=None,
+                        help="Check the content of large datasets on a random fraction of their chunks")
+    parser.add_argument("--seed", dest="seed", type=int, default=0,
+                        help="Seed for choosing the chunks to sample, the same seed gives the same result")
+    parser.add_argument("--content", dest="content", action="store_true", default=False,
+                        help="Also run the slow checks of the values of large datasets, such as the NXevent_data "
+                             "index datasets; implied by --sample")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=1,
+                        help="Number of processes checking files in parallel")
+    parser.add_argument("--cache", dest="cache", default=None, metavar="DIR",
+                        help="Cache results in DIR and reuse them until a file, the options or a recipe change")
+    parser.add_argument("--swmr", dest="swmr", type=float, default=None, metavar="INTERVAL",
+                        help="Keep validating files being written in SWMR mode, refreshing every INTERVAL seconds")
+    parser.add_argument("--swmr-idle", dest="swmr_idle", type=int, default=None, metavar="N",
+                        help="Stop following SWMR files after N refreshes without new data")
+    parser.add_argument("--memory-budget", dest="memory_budget", type=parse_size, default=None, metavar="SIZE",
+                        help="Memory (e.g. 512M or 4G) that large reads of all workers may use at once")
+    parser.add_argument("--shard", dest="shard", type=parse_shard, default=None, metavar="INDEX/COUNT",
+                        help="Only check the files of shard INDEX (from 0) out of COUNT, chosen by a hash of their path")
+    parser.add_argument("--shard-by-size", dest="shard_by_size", action="store_true", default=False,
+                        help="Balance the shards by file size instead of path hash alone")
+    parser.add_argument("--merge", dest="merge", action="store_true", default=False,
+                        help="Combine the JUnit or JSON Lines reports given instead of nexus files")
+    parser.add_argument("--detect", dest="detect", action="store_true", default=False,
+                        help="Only list the features each entry appears to have, from its metadata")
+    parser.add_argument("--write-features", dest="write_features", action="store_true", default=False,
+                        help="With --detect, store the detected features in the /entry/features datasets")
+    parser.add_argument("nexusfile", help="Nexus file to test, or report to merge", nargs='*')
 
     args = parser.parse_args()
 
-    failed = False
-    for file in args.nexusfile:
-        if args.feature:
+    if args.shard is not None:
+        args.nexusfile = shard_paths(args.nexusfile, args.shard[0], args.shard[1], args.shard_by_size)
+
+    if args.write_features and not args.detect:
+        parser.error("--write-features changes the files given, so it needs --detect")
+
+    if args.sample is not None:
+        try:
+            nxchunks.Sampling(args.sample, args.seed)
+        except ValueError as e:
+            parser.error(str(e))
+
+    features = None
+    if args.feature:
+        try:
+            features = int(args.feature, 16)
+        except:
+            print("The feature '{}' has not parsed correctly, exiting".format(args.feature))
+            sys.exit()
+    elif args.test:
+        features = ALL_FEATURES
+
+    if args.detect:
+        failed = False
+        for file in args.nexusfile:
+            errors = []
             try:
-                disco = SingleFeatureDiscoverer(file, int(args.feature, 16))
-            except:
-                print("The feature '{}' has not parsed correctly, exiting".format(args.feature))
-                sys.exit()
-        else:
-            if args.test:
-                disco = AllFeatureDiscoverer(file)
-            else:
-                disco = InsaneFeatureDiscoverer(file)
-
-        factory = JUnitFactory()
-
-        for entry in disco.entries():
-            pass_list = []
-            fail_list = []
-
-            print("Investigating features in {}[{}]".format(file, entry.entrypath))
-            for feat in entry.features():
-                try:
-                    response = entry.feature_response(feat)
-                    pass_list.append((feat, response))
-                except AssertionError as ae:
-                    fail_list.append((feat, type(ae).__name__, str(ae), None))
-                except Exception as e:
-                    fail_list.append((feat, type(e).__name__, str(e), str(traceback.format_exc())))
-
-            if len(pass_list) > 0:
-                print("\tThe following features are contained in this entry:")
-                for feat, message in pass_list:
-                    print("\t\t{} '{:0>16X}'({}) {}".format(entry.feature_title(feat), feat, feat, message))
-                    factory.add_test_case(feat, message)
+                detected = detect_file(file, [features] if isinstance(features, int) else None, errors)
+                if args.write_features:
+                    write_features(file, detected)
+            except Exception as e:
+                failed = True
+                print("Could not check {}: {}".format(file, e))
+                continue
+            for entry, feats in detected:
+                print("Features detected in {}[{}]: {}".format(
+                    file, entry, " ".join("{:0>16X}".format(feat) for feat in feats) or "none"))
+            for entry, feat, e in errors:
+                failed = True
+                print("Could not detect {:0>16X} in {}[{}]: {}".format(feat, file, entry, e))
+                if args.verbose:
+                    print("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+        sys.exit(int(failed))
+
+    if args.swmr is not None:
+        if args.memory_budget:
+            nxchunks.set_memory_budget(nxchunks.MemoryBudget(args.memory_budget))
+        failed = follow_swmr([(file, make_discoverer(file, features, swmr=True)) for file in args.nexusfile],
+                             args.swmr, args.swmr_idle, args.verbose)
+        sys.exit(int(failed))
+
+    def coverage_str(coverage):
+        return " (sampled coverage {:.1%})".format(coverage) if coverage is not None else ""
+
+    def report_entry(file, entrypath, results):
+        """
+        Print the results for one entry, return True if any failed
+        """
+        print("Investigating features in {}[{}]".format(file, entrypath))
+        pass_list = [result for result in results if result.passed]
+        fail_list = [result for result in results if not result.passed]
+
+        if len(pass_list) > 0:
+            print("\tThe following features are contained in this entry:")
+            for result in pass_list:
+                print("\t\t{} '{:0>16X}'({}) {}{}".format(result.title, result.feature, result.feature,
+                                                       result.message, coverage_str(result.coverage)))
+
+        if len(fail_list) > 0:
+            print("\tThe following features are NOT contained in this entry:")
+            for result in fail_list:
+                if result.title is None:
+                    if args.verbose:
+                        print("\t\tFeature ({}) could not be found".format(result.feature))
+                    continue
+                print("\t\t{} '{:0>16X}'({}) is invalid with the following errors{}:".format(
+                    result.title, result.feature, result.feature, coverage_str(result.coverage)))
+                print("\t\t\t{}".format(result.message.replace('\n', '\n\t\t\t')))
+                if args.verbose and result.stack:
+                    print("\t\t\t{}".format(result.stack.replace('\n', '\n\t\t\t')))
+        print("\n")
+        return len(fail_list) > 0
+
+    writers = []
+    if args.xml:
+        writers.append(nxreport.JUnitWriter(args.xml))
+    if args.jsonl:
+        writers.append(nxreport.JSONLinesWriter(args.jsonl))
+    if args.csv:
+        writers.append(nxreport.CSVWriter(args.csv))
 
-            if len(fail_list) > 0:
+    failed = False
+    current = None
+    entry_results = []
+    try:
+        if args.merge:
+            results = merge_reports(args.nexusfile)
+        else:
+            results = iter_results(args.nexusfile, features, args.workers, args.cache, args.sample, args.seed,
+                                   args.memory_budget, args.content or args.sample is not None)
+        for result in results:
+            for writer in writers:
+                writer.write(result)
+            if result.entry is None:
                 failed = True
-                print("\tThe following features are NOT contained in this entry:")
-                for feat, error_type, message, stack in fail_list:
-                    try:
-                        print("\t\t{} '{:0>16X}'({}) is invalid with the following errors:".format(entry.feature_title(feat), feat, feat))
-                        print("\t\t\t{}".format(message.replace('\n', '\n\t\t\t')))
-                        if args.verbose and stack:
-                            print("\t\t\t{}".format(stack.replace('\n', '\n\t\t\t')))
-                        factory.add_test_case(entry.feature_title(feat), feat, error_type, message)
-                    except:
-                        if args.verbose:
-                            print("\t\tFeature ({}) could not be found".format(feat))
-            print("\n")
-        if args.xml:
-            factory.write(args.xml)
+                print("Could not check {}: {}".format(result.path, result.message))
+                continue
+            if (result.path, result.entry) != current:
+                if entry_results:
+                    failed = report_entry(current[0], current[1], entry_results) or failed
+                current = (result.path, result.entry)
+                entry_results = []
+            entry_results.append(result)
+        if entry_results:
+            failed = report_entry(current[0], current[1], entry_results) or failed
+    finally:
+        for writer in writers:
+            writer.close()
 
     # to fail on Travis, return non zero if fails
     sys.exit(int(failed))
@@ -0,0 +1,104 @@
+"""
+Metadata index of an entry, for recipes to detect their feature without processing it.
+
+One walk over the entry records the NeXus class of every group and the path of every
+group and dataset, without reading any data. The detect method of each recipe is then
+a lookup in the index, so fingerprinting a file against all recipes costs one crawl of
+its metadata however large the datasets are:
+
+    index = EntryIndex(nx_file, "entry")
+    if index.has_class("NXevent_data"):
+        ...
+"""
+
+import h5py
+import numpy
+
+
+def decode(value):
+    """
+    A string attribute or small string dataset value as str, whichever way it was written
+
+    :param value: bytes, str, or numpy array or scalar holding one of them
+    :return: the str, None if value is not a single string
+    """
+    if isinstance(value, numpy.ndarray):
+        if value.size != 1:
+            return None
+        value = value.flat[0]
+    if isinstance(value, bytes):
+        return value.decode("utf8", "replace")
+    if isinstance(value, str):
+        return value
+    return None
+
+
+def nx_class(obj):
+    """
+    The NX_class attribute of an HDF5 object as str, None if it has none
+    """
+    try:
+        return decode(obj.attrs["NX_class"])
+    except (KeyError, OSError):
+        return None
+
+
+class EntryIndex(object):
+    """
+    The groups and datasets below an entry, by path and by NeXus class
+
+    Paths are relative to the entry, as passed to visititems. Only objects reached by
+    hard links are indexed, like the visitors of the recipes see them.
+    """
+
+    def __init__(self, nx_file, entrypath):
+        self.entry = nx_file[entrypath]
+        self.groups = {}
+        self.datasets = set()
+        self.classes = {}
+        self.entry.visititems(self._visit)
+
+    def _visit(self, name, obj):
+        if isinstance(obj, h5py.Dataset):
+            self.datasets.add(name)
+            return
+        self.groups[name] = obj
+        cls = nx_class(obj)
+        if cls is not None:
+            self.classes.setdefault(cls, []).append(name)
+
+    def has(self, path):
+        """
+        True if the group or dataset at path (relative to the entry) exists
+        """
+        return path in self.groups or path in self.datasets
+
+    def has_class(self, *nx_classes):
+        """
+        True if any group below the entry is of one of the given classes
+        """
+        return any(cls in self.classes for cls in nx_classes)
+
+    def find_class(self, *nx_classes):
+        """
+        The (path, group) of the groups below the entry of the given classes
+        """
+        return [(name, self.groups[name]) for cls in nx_classes for name in self.classes.get(cls, [])]
+
+    def definitions(self, include_entry=False):
+        """
+        The application definitions of the NXentry and NXsubentry groups below the entry
+
+        :param include_entry: Include the definition of the entry itself
+        :return: set of definition names
+        """
+        entries = [group for name, group in self.find_class("NXentry", "NXsubentry")]
+        if include_entry:
+            entries.append(self.entry)
+        names = set()
+        for group in entries:
+            definition = group.get("definition")
+            if isinstance(definition, h5py.Dataset) and definition.size == 1:
+                names.add(decode(definition[()]))
+        names.discard(None)
+        return names
@@ -0,0 +1,321 @@
+#! /usr/bin/env python
+"""
+Repack NXevent_data groups with a layout suited to reading events by time range.
+
+Event data is often written with tiny storage chunks, no compression and without the
+cue_timestamp_zero and cue_index datasets. Repacking copies the groups to a new file with
+the one dimensional datasets chunked in blocks of chunk_bytes, so that a time range read
+decompresses a few large chunks instead of thousands of small ones, optionally compressed,
+and with cues generated every cue_interval seconds of pulse time:
+
+    python src/nxrepack.py run.nxs repacked.nxs --compression gzip --cue-interval 1 --benchmark
+
+Only the NXevent_data groups (and the groups above them, with their attributes) are written
+unless whole_file is set, then everything else is copied as it is by the HDF5 library.
+Datasets are copied in blocks of whole destination chunks, so memory use is bounded by
+max_bytes however many events there are.
+
+The benchmark times get_events_by_time_range of the NXevent_data recipe, which finds the
+pulses of a time range through the cues where they are present and through event_index
+otherwise, so it measures the effect of the chunking, the compression and the cues together.
+"""
+
+import importlib
+import os
+import sys
+import time
+
+import h5py
+import numpy
+
+import nxchunks
+import nxindex
+import nxunits
+
+RECIPE_DIR = os.path.dirname(os.path.realpath(__file__)) + "/recipes"
+sys.path.append(RECIPE_DIR)
+
+# The recipe whose time range queries are benchmarked
+EVENT_RECIPE = "ECB064453EDB096D.recipe"
+
+# Large enough that decompressing a chunk costs more than finding it, small enough that the
+# events read outside the time range at either end of a query are few
+DEFAULT_CHUNK_BYTES = 256 * 1024
+DEFAULT_CUE_INTERVAL = 1.0
+
+CUE_DATASETS = ("cue_timestamp_zero", "cue_index")
+
+
+def find_event_data(nx_file):
+    """
+    Paths of the NXevent_data groups in a file
+    """
+    paths = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Group) and nxindex.nx_class(obj) == "NXevent_data":
+            paths.append(obj.name)
+
+    nx_file.visititems(visit)
+    return paths
+
+
+def _copy_attrs(source, dest):
+    for key in source.attrs:
+        dest.attrs.create(key, source.attrs[key], dtype=source.attrs.get_id(key).dtype)
+
+
+def copy_rechunked(source, dest_group, name, chunk_bytes=DEFAULT_CHUNK_BYTES, compression=None,
+                   compression_opts=None, max_bytes=nxchunks.DEFAULT_BUFFER_BYTES):
+    """
+    Copy a one dimensional dataset with new storage chunks and compression, writing whole chunks at a time
+
+    :param source: h5py Dataset to copy
+    :param dest_group: Group to create the copy in
+    :param name: Name of the copy
+    :param chunk_bytes: Size of the storage chunks of the copy
+    :param compression: h5py compression filter of the copy, e.g. "gzip" or "lzf", None for none
+    :param compression_opts: Options of the filter, e.g. the gzip level
+    :param max_bytes: Upper bound on the size of each block copied
+    :return: The new dataset
+    """
+    n_rows = source.shape[0]
+    itemsize = source.dtype.itemsize
+    rows = max(1, min(chunk_bytes // itemsize, n_rows))
+    dest = dest_group.create_dataset(name, shape=source.shape, dtype=source.dtype, chunks=(rows,), maxshape=(None,),
+                                     compression=compression, compression_opts=compression_opts,
+                                     shuffle=compression is not None)
+    _copy_attrs(source, dest)
+    block_rows = max(rows, max_bytes // itemsize // rows * rows)
+    for start in range(0, n_rows, block_rows):
+        stop = min(start + block_rows, n_rows)
+        dest[start:stop] = source[start:stop]
+    return dest
+
+
+def cue_pulses(pulse_times, event_index, n_events, interval):
+    """
+    The pulses to put cues at: the first pulse with events in each interval of pulse time, counted from the
+    first pulse
+
+    :param pulse_times: Time of each pulse in seconds
+    :param event_index: Index of the first event of each pulse
+    :param n_events: Number of events
+    :param interval: Time between cues in seconds
+    :return: Array of pulse indices
+    """
+    has_events = numpy.flatnonzero(numpy.asarray(event_index) < n_events)
+    if len(has_events) == 0:
+        return has_events
+    periods = numpy.floor((pulse_times[has_events] - pulse_times[has_events[0]]) / interval)
+    return has_events[numpy.flatnonzero(numpy.concatenate(([True], periods[1:] != periods[:-1])))]
+
+
+def write_cues(source, dest, interval):
+    """
+    Write cue_timestamp_zero and cue_index datasets for the pulses chosen by cue_pulses, the timestamps in the
+    units and with the offset of event_time_zero
+
+    :param source: NXevent_data group to read the pulses from
+    :param dest: Group to write the cues to
+    :param interval: Time between cues in seconds
+    """
+    event_time_zero = source["event_time_zero"]
+    raw_times = event_time_zero[...]
+    event_index = source["event_index"][...]
+    pulses = cue_pulses(nxunits.convert(raw_times, event_time_zero.attrs.get("units"), "s"), event_index,
+                        source["event_id"].len(), interval)
+    timestamps = dest.create_dataset("cue_timestamp_zero", data=raw_times[pulses])
+    for key in ("units", "offset"):
+        if key in event_time_zero.attrs:
+            timestamps.attrs.create(key, event_time_zero.attrs[key], dtype=event_time_zero.attrs.get_id(key).dtype)
+    dest.create_dataset("cue_index", data=event_index[pulses])
+
+
+def repack_event_data(source, dest_parent, copied, chunk_bytes=DEFAULT_CHUNK_BYTES, compression=None,
+                      compression_opts=None, cue_interval=DEFAULT_CUE_INTERVAL,
+                      max_bytes=nxchunks.DEFAULT_BUFFER_BYTES):
+    """
+    Copy an NXevent_data group with its one dimensional datasets rechunked, see copy_rechunked
+
+    :param source: NXevent_data group
+    :param dest_parent: Group to create the copy in, under the same name
+    :param copied: dict from the ids of the objects copied so far to their paths in the destination, updated
+    :param cue_interval: Time between generated cues in seconds, None to copy the cues of the source
+    :return: The new group
+    """
+    dest = dest_parent.create_group(source.name.split("/")[-1])
+    _copy_attrs(source, dest)
+    copied[source.id] = dest.name
+    generate_cues = cue_interval is not None and all(name in source for name in ("event_time_zero", "event_index",
+                                                                                 "event_id"))
+    for name in source:
+        link = source.get(name, getlink=True)
+        if isinstance(link, (h5py.SoftLink, h5py.ExternalLink)):
+            dest[name] = link
+            continue
+        if generate_cues and name in CUE_DATASETS:
+            continue
+        obj = source[name]
+        if obj.id in copied:
+            dest[name] = dest.file[copied[obj.id]]
+        elif isinstance(obj, h5py.Dataset) and obj.ndim == 1:
+            copied[obj.id] = copy_rechunked(obj, dest, name, chunk_bytes, compression, compression_opts,
+                                            max_bytes).name
+        else:
+            source.copy(obj, dest, name)
+            copied[obj.id] = dest[name].name
+    if generate_cues:
+        write_cues(source, dest, cue_interval)
+    return dest
+
+
+def _copy_tree(source, dest, copied):
+    """
+    Copy the contents of a group which have not been copied yet, keeping hard, soft and external links
+    """
+    for name in source:
+        link = source.get(name, getlink=True)
+        if isinstance(link, (h5py.SoftLink, h5py.ExternalLink)):
+            if name not in dest:
+                dest[name] = link
+            continue
+        obj = source[name]
+        if obj.id in copied:
+            if name not in dest:
+                dest[name] = dest.file[copied[obj.id]]
+        elif isinstance(obj, h5py.Group):
+            if name in dest:
+                # created above a repacked group
+                child = dest[name]
+            else:
+                child = dest.create_group(name)
+                _copy_attrs(obj, child)
+            copied[obj.id] = child.name
+            _copy_tree(obj, child, copied)
+        else:
+            source.copy(obj, dest, name)
+            copied[obj.id] = dest[name].name
+
+
+def repack_file(source_path, dest_path, groups=None, whole_file=False, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                compression=None, compression_opts=None, cue_interval=DEFAULT_CUE_INTERVAL,
+                max_bytes=nxchunks.DEFAULT_BUFFER_BYTES):
+    """
+    Write the repacked NXevent_data groups of a file to a new file
+
+    :param source_path: File to repack
+    :param dest_path: File to write, overwritten if it exists
+    :param groups: Paths of the groups to repack, by default all NXevent_data groups
+    :param whole_file: Also copy everything else in the file
+    :param chunk_bytes: Size of the storage chunks of the one dimensional datasets
+    :param compression: h5py compression filter, e.g. "gzip" or "lzf", None for none
+    :param compression_opts: Options of the filter, e.g. the gzip level
+    :param cue_interval: Time between generated cues in seconds, None to copy the cues of the source
+    :param max_bytes: Upper bound on the size of each block copied
+    :return: Paths of the groups repacked
+    """
+    if os.path.exists(dest_path) and os.path.samefile(source_path, dest_path):
+        raise ValueError("Can't repack {} into itself".format(source_path))
+    with h5py.File(source_path, "r") as source, h5py.File(dest_path, "w") as dest:
+        if groups is None:
+            groups = find_event_data(source)
+        if len(groups) == 0:
+            raise ValueError("No NXevent_data groups found in {}".format(source_path))
+        _copy_attrs(source, dest)
+        copied = {}
+        for path in groups:
+            parent = dest
+            # Groups directly under the root have no parents to create
+            for name in filter(None, source[path].parent.name.split("/")):
+                if name not in parent:
+                    _copy_attrs(source[parent.name][name], parent.create_group(name))
+                parent = parent[name]
+            repack_event_data(source[path], parent, copied, chunk_bytes, compression, compression_opts,
+                              cue_interval, max_bytes)
+        if whole_file:
+            _copy_tree(source, dest, copied)
+    return groups
+
+
+def benchmark(path, group, width=None, queries=5, seed=0):
+    """
+    Time the time range queries of the NXevent_data recipe (get_events_by_time_range, which finds the pulses
+    through the cues where they are present) on a group, over random time ranges which are the same for the same seed,
+    so that a file and its repacked copy can be compared
+
+    :param path: File holding the group
+    :param group: Path of the NXevent_data group
+    :param width: Length of each time range in seconds, by default a hundredth of the pulse times
+    :param queries: Number of queries timed, after one which is not
+    :param seed: Seed for choosing the time ranges
+    :return: Median time of a query in seconds and mean number of events returned
+    """
+    recipe = importlib.import_module(EVENT_RECIPE)
+    with h5py.File(path, "r") as nx_file:
+        event_time_zero = nx_file[group]["event_time_zero"]
+        pulse_times = nxunits.convert(event_time_zero[...], event_time_zero.attrs.get("units"), "s")
+        first, last = numpy.min(pulse_times), numpy.max(pulse_times)
+        if width is None:
+            width = (last - first) / 100
+        starts = numpy.random.RandomState(seed).uniform(first, max(first, last - width), queries + 1)
+        examples = recipe.NXevent_dataExamples(nx_file[group])
+        durations = []
+        n_events = 0
+        for query, start in enumerate(starts):
+            began = time.perf_counter()
+            times, detector_ids = examples.get_events_by_time_range(start, start + width)
+            if query > 0:
+                durations.append(time.perf_counter() - began)
+                n_events += len(times)
+    return float(numpy.median(durations)), n_events / max(queries, 1)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    def parse_size(value):
+        try:
+            return nxchunks.parse_size(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError("expected a size such as 512K or 4M, got '{}'".format(value))
+
+    parser = argparse.ArgumentParser(description="Repack the NXevent_data groups of a file for time range queries")
+    parser.add_argument("source", help="NeXus file to repack")
+    parser.add_argument("dest", help="File to write, overwritten if it exists")
+    parser.add_argument("-g", "--group", dest="groups", action="append", default=None, metavar="PATH",
+                        help="NXevent_data group to repack, may be repeated, by default all of them")
+    parser.add_argument("--whole-file", dest="whole_file", action="store_true", default=False,
+                        help="Copy everything else in the file too")
+    parser.add_argument("--chunk-size", dest="chunk_bytes", type=parse_size, default=DEFAULT_CHUNK_BYTES,
+                        metavar="SIZE", help="Size of the storage chunks of the event datasets")
+    parser.add_argument("--compression", dest="compression", choices=["gzip", "lzf", "none"], default="none",
+                        help="Compression filter of the repacked datasets")
+    parser.add_argument("--compression-level", dest="compression_opts", type=int, default=None, metavar="LEVEL",
+                        help="gzip compression level")
+    parser.add_argument("--cue-interval", dest="cue_interval", type=float, default=DEFAULT_CUE_INTERVAL,
+                        metavar="SECONDS", help="Time between generated cues, 0 to copy the existing cues")
+    parser.add_argument("--buffer-size", dest="max_bytes", type=parse_size, default=nxchunks.DEFAULT_BUFFER_BYTES,
+                        metavar="SIZE", help="Upper bound on the size of each block copied")
+    parser.add_argument("--benchmark", dest="benchmark", action="store_true", default=False,
+                        help="Time queries by time range on the groups before and after repacking")
+    parser.add_argument("--benchmark-width", dest="width", type=float, default=None, metavar="SECONDS",
+                        help="Length of the time ranges queried, by default a hundredth of the run")
+    parser.add_argument("--benchmark-queries", dest="queries", type=int, default=5, metavar="N",
+                        help="Number of queries timed for each group")
+    args = parser.parse_args()
+
+    repacked = repack_file(args.source, args.dest, args.groups, args.whole_file, args.chunk_bytes,
+                           None if args.compression == "none" else args.compression, args.compression_opts,
+                           args.cue_interval or None, args.max_bytes)
+    print("Repacked {} into {}: {:.1f} MB to {:.1f} MB".format(args.source, args.dest,
+                                                               os.path.getsize(args.source) / 1e6,
+                                                               os.path.getsize(args.dest) / 1e6))
+    for group in repacked:
+        print("\t{}".format(group))
+        if args.benchmark:
+            before, n_events = benchmark(args.source, group, args.width, args.queries)
+            after, _ = benchmark(args.dest, group, args.width, args.queries)
+            print("\t\tget_events_by_time_range of {:.0f} events: "
+                  "{:.4f} s before, {:.4f} s after ({:.1f}x)".format(
+                n_events, before, after, before / after if after > 0 else numpy.inf))
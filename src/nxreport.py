@@ -0,0 +1,235 @@
+"""
+Report writers for nxfeature results, and readers to merge them again.
+
+Each writer streams the results to its file as they arrive, so memory use does not
+grow with the number of files, entries or features checked. They all take the
+results (nxfeature.FeatureResult) of a whole run, whichever files they come from.
+"""
+
+import csv
+import json
+import re
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+# characters which are not allowed anywhere in an XML 1.0 document
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# width reserved for each count in the JUnit header, filled in once all results are known
+_COUNT_WIDTH = 20
+
+# classname and name of the JUnit test cases, see JUnitWriter.write
+_CLASSNAME = re.compile(r"(.*)\[(.*)\]$", re.DOTALL)
+_NAME = re.compile(r"(.*) '([0-9A-F]{16})'$", re.DOTALL)
+
+# key of the last line of a JSON Lines report, holding the number of results before it
+_END_OF_REPORT = "end_of_report"
+
+
+def _xml_text(value):
+    return escape(_INVALID_XML.sub("?", str(value)))
+
+
+def _xml_attr(value):
+    return quoteattr(_INVALID_XML.sub("?", str(value)))
+
+
+def _feature_id(result):
+    return "" if result.feature is None else "{:0>16X}".format(result.feature)
+
+
+class ReportWriter(object):
+    """
+    Base class of the writers, to be used as a context manager or closed explicitly
+    """
+
+    def __init__(self, filename, mode="w"):
+        if mode == "wb":
+            self.file = open(filename, mode)
+        else:
+            self.file = open(filename, mode, encoding="utf8", newline="")
+
+    def write(self, result):
+        raise NotImplementedError
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JUnitWriter(ReportWriter):
+    """
+    One JUnit XML test suite for the whole run, with a test case for each feature checked in each entry
+
+    The counts in the testsuite element are only known at the end, so fixed width space
+    is left for them and filled in by close().
+    """
+
+    COUNTS = ("tests", "failures", "errors")
+
+    def __init__(self, filename):
+        super(JUnitWriter, self).__init__(filename, "wb")
+        self.counts = dict((name, 0) for name in self.COUNTS)
+        self.file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n\t<testsuite name="features" ')
+        self.counts_offset = self.file.tell()
+        self.file.write(self._counts_attrs() + b">\n")
+
+    def _counts_attrs(self):
+        attrs = ("{}=\"{}\"".format(name, self.counts[name]).ljust(len(name) + 3 + _COUNT_WIDTH)
+                 for name in self.COUNTS)
+        return " ".join(attrs).encode("utf8")
+
+    def write(self, result):
+        if result.entry is None:
+            # the file could not be read at all
+            classname, name = result.path, result.path
+            body = "\n\t\t\t<error type={} message={}>{}</error>".format(
+                _xml_attr(result.error_type), _xml_attr(result.message.split("\n")[0]), _xml_text(result.stack or ""))
+            self.counts["errors"] += 1
+        elif result.title is None:
+            # the recipe for a feature listed in the file could not be loaded, named by the feature id alone
+            classname, name = "{}[{}]".format(result.path, result.entry), _feature_id(result)
+            body = "\n\t\t\t<error type={} message={}>{}</error>".format(
+                _xml_attr(result.error_type), _xml_attr(result.message.split("\n")[0]), _xml_text(result.stack or ""))
+            self.counts["errors"] += 1
+        else:
+            classname = "{}[{}]".format(result.path, result.entry)
+            name = "{} '{}'".format(result.title, _feature_id(result))
+            if result.passed:
+                body = "\n\t\t\t<system-out>{}</system-out>".format(_xml_text(result.message))
+            else:
+                body = "\n\t\t\t<failure type={} message={}>{}</failure>".format(
+                    _xml_attr(result.error_type), _xml_attr(result.message.split("\n")[0]),
+                    _xml_text(result.message))
+                self.counts["failures"] += 1
+        self.counts["tests"] += 1
+        self.file.write("\t\t<testcase classname={} name={}>{}\n\t\t</testcase>\n".format(
+            _xml_attr(classname), _xml_attr(name), body).encode("utf8"))
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(b"\t</testsuite>\n</testsuites>\n")
+        self.file.seek(self.counts_offset)
+        self.file.write(self._counts_attrs())
+        super(JUnitWriter, self).close()
+
+
+class JSONLinesWriter(ReportWriter):
+    """
+    One JSON object per line and result, with the fields of FeatureResult
+
+    close() adds a last line counting the results, so that a report cut short at a line
+    boundary can be told from a complete one.
+    """
+
+    def __init__(self, filename):
+        super(JSONLinesWriter, self).__init__(filename)
+        self.count = 0
+
+    def write(self, result):
+        self.file.write(json.dumps(result.to_dict()) + "\n")
+        self.count += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(json.dumps({_END_OF_REPORT: self.count}) + "\n")
+        super(JSONLinesWriter, self).close()
+
+
+class CSVWriter(ReportWriter):
+    """
+    One row per result, the feature id in hex as printed by nxfeature
+    """
+
+    COLUMNS = ("path", "entry", "feature", "title", "passed", "error_type", "coverage", "message")
+
+    def __init__(self, filename):
+        super(CSVWriter, self).__init__(filename)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.COLUMNS)
+
+    def write(self, result):
+        self.writer.writerow([result.path, result.entry, _feature_id(result), result.title, result.passed,
+                              result.error_type, result.coverage, result.message])
+
+
+def read_jsonl(filename):
+    """
+    Read back the results written by JSONLinesWriter, as dicts of FeatureResult fields
+
+    Raises ValueError, after the results read, if the report does not end with the line
+    counting them or the count is wrong.
+    """
+    count = 0
+    with open(filename, encoding="utf8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            values = json.loads(line)
+            if _END_OF_REPORT in values:
+                if values[_END_OF_REPORT] != count:
+                    raise ValueError("{} has {} results but its last line counts {}".format(
+                        filename, count, values[_END_OF_REPORT]))
+                return
+            count += 1
+            yield values
+    raise ValueError("{} ends after {} results without the line counting them".format(filename, count))
+
+
+def read_junit(filename):
+    """
+    Read back the results written by JUnitWriter, as dicts of FeatureResult fields
+
+    The summary and coverage of the results are not recorded in JUnit files, and of
+    files which could not be read and features whose recipe could not be loaded only
+    the first line of the message is.
+    """
+    suite = None
+    for event, case in ElementTree.iterparse(filename, ("start", "end")):
+        if event == "start":
+            if case.tag == "testsuite":
+                suite = case
+            continue
+        if case.tag != "testcase":
+            continue
+        values = dict(summary=None, coverage=None, stack=None)
+        error = case.find("error")
+        failure = case.find("failure")
+        if error is not None and case.get("name") == case.get("classname"):
+            values.update(path=case.get("classname"), entry=None, feature=None, title=None, passed=False,
+                          message=error.get("message"), error_type=error.get("type"), stack=error.text)
+        elif error is not None:
+            path, entry = _CLASSNAME.match(case.get("classname")).groups()
+            values.update(path=path, entry=entry, feature=int(case.get("name"), 16), title=None, passed=False,
+                          message=error.get("message"), error_type=error.get("type"), stack=error.text)
+        else:
+            path, entry = _CLASSNAME.match(case.get("classname")).groups()
+            title, feature = _NAME.match(case.get("name")).groups()
+            values.update(path=path, entry=entry, feature=int(feature, 16), title=title)
+            if failure is not None:
+                values.update(passed=False, message=failure.text or "", error_type=failure.get("type"))
+            else:
+                output = case.find("system-out")
+                values.update(passed=True, message="" if output is None else output.text or "", error_type=None)
+        # drop the test cases already read, to read large reports in constant memory
+        if suite is not None:
+            suite.clear()
+        yield values
+
+
+def read_report(filename):
+    """
+    Read back a JUnit or JSON Lines report, whichever filename holds
+    """
+    with open(filename, "rb") as file:
+        start = file.read(64).lstrip()
+    if start.startswith(b"<"):
+        return read_junit(filename)
+    return read_jsonl(filename)
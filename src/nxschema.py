@@ -0,0 +1,398 @@
+"""
+Declarative validation of the datasets and groups below a NeXus group.
+
+Recipes describe what they expect as a table mapping paths (relative to the group
+being validated) to the checks to run on them, for instance:
+
+    PLAN = compile_schema({
+        "data/data": [Include(), SameLength()],
+        "data/image_key": (False, [InRange(0, 3)]),
+        "title": {"minOccurs": 0, "checks": [Dtype("object")]},
+    }, missing="'{item}' is missing from {name}")
+
+    values, fails = PLAN.run(group)
+
+A path maps to a list of checks (the path is required), to (optional, checks), or to
+a dict with minOccurs and checks. compile_schema turns the table into a Plan once.
+Running it reads the links, shapes, dtypes and attributes needed by all the checks in
+a single walk of the group, listing each subgroup once, and then evaluates each kind
+of check for all paths at once. Failures are reported in table order, with the checks
+of a path in the order given, whatever order they were evaluated in.
+"""
+
+import numpy
+import h5py
+
+from nxchunks import reduce_dataset
+
+
+class Check(object):
+    """
+    Base class of the checks. Subclasses implement evaluate, which gets every use of the
+    check class in a plan at once as a list of (order, item, check) jobs and the Snapshot
+    of the group, and adds (order, message) pairs to fails.
+    """
+
+    # attributes of the object at the path which the check needs read
+    attrs = ()
+    # whether the check can be run on a group (otherwise it fails when the path is not a dataset)
+    groups = False
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        raise NotImplementedError
+
+
+class Dtype(Check):
+    """
+    The dataset has one of the given dtypes (numpy names or dtype objects)
+    """
+
+    def __init__(self, *dtypes, message="{name} is type {dtype}, expected {expected}"):
+        if len(dtypes) == 1 and isinstance(dtypes[0], (list, tuple)):
+            dtypes = dtypes[0]
+        self.dtypes = tuple(dtypes)
+        self.allowed = numpy.array([numpy.dtype(dtype).str for dtype in dtypes])
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for dtypes, group in _group_by(jobs, lambda check: check.dtypes):
+            index = numpy.array([snapshot.index[item] for order, item, check in group])
+            bad = ~numpy.isin(snapshot.dtype_str[index], group[0][2].allowed)
+            for (order, item, check), i in zip(_select(group, bad), index[bad]):
+                fails.append((order, check.message.format(
+                    item=item, name=snapshot.objects[i].name, dtype=snapshot.dtype[i],
+                    expected=", ".join(str(dtype) for dtype in check.dtypes))))
+
+
+class Dims(Check):
+    """
+    The dataset has the given number of dimensions
+    """
+
+    def __init__(self, dims, message="{name} has dims {dims}, expected {expected}"):
+        self.dims = dims
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        index = numpy.array([snapshot.index[item] for order, item, check in jobs])
+        expected = numpy.array([check.dims for order, item, check in jobs])
+        bad = snapshot.ndim[index] != expected
+        for (order, item, check), i in zip(_select(jobs, bad), index[bad]):
+            fails.append((order, check.message.format(item=item, name=snapshot.objects[i].name,
+                                                      dims=snapshot.ndim[i], expected=check.dims)))
+
+
+class Shape(Check):
+    """
+    The dataset has the given shape
+    """
+
+    def __init__(self, shape, message="{name} has shape {shape}, expected {expected}"):
+        self.shape = tuple(shape)
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for shape, group in _group_by(jobs, lambda check: check.shape):
+            index = numpy.array([snapshot.index[item] for order, item, check in group])
+            ok = snapshot.ndim[index] == len(shape)
+            if len(shape) > 0 and ok.any():
+                shapes = numpy.array([snapshot.shape[i] if good else (-1,) * len(shape)
+                                      for i, good in zip(index, ok)])
+                ok &= (shapes == numpy.array(shape)).all(axis=1)
+            for (order, item, check), i in zip(_select(group, ~ok), index[~ok]):
+                fails.append((order, check.message.format(item=item, name=snapshot.objects[i].name,
+                                                          shape=snapshot.shape[i], expected=shape)))
+
+
+class IsScalar(Check):
+    """
+    Whether the dataset holds a single value (its shape is ()), decided from the Snapshot without reading
+    the dataset. Datasets with a null dataspace fail before this check, see Plan.run
+    """
+
+    def __init__(self, is_scalar=True, message="{name} == scalar is {scalar}, expected {expected}"):
+        self.is_scalar = is_scalar
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        index = numpy.array([snapshot.index[item] for order, item, check in jobs])
+        scalar = snapshot.ndim[index] == 0
+        expected = numpy.array([check.is_scalar for order, item, check in jobs], dtype=bool)
+        for (order, item, check), i in zip(_select(jobs, scalar != expected), index[scalar != expected]):
+            fails.append((order, check.message.format(item=item, name=snapshot.objects[i].name,
+                                                      scalar=bool(snapshot.ndim[i] == 0), expected=check.is_scalar)))
+
+
+class Attr(Check):
+    """
+    The dataset or group has the attribute, optionally with the given value or python type
+    """
+
+    groups = True
+
+    def __init__(self, name, value=None, dtype=None):
+        self.name = name
+        self.attrs = (name,)
+        self.value = value
+        self.dtype = dtype
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for order, item, check in jobs:
+            i = snapshot.index[item]
+            name = snapshot.objects[i].name
+            attrs = snapshot.attrs[i]
+            if check.name not in attrs:
+                fails.append((order, "'{}' does not have an attribute '{}'".format(name, check.name)))
+            elif check.value is not None and attrs[check.name] != check.value:
+                fails.append((order, "attribute '{}' of {} has value {}, expected {}".format(
+                    check.name, name, attrs[check.name], check.value)))
+            elif check.dtype is not None and not isinstance(attrs[check.name], check.dtype):
+                fails.append((order, "attribute '{}' of '{}' has type {}, expected {}".format(
+                    check.name, name, type(attrs[check.name]), check.dtype)))
+
+
+class SameLength(Check):
+    """
+    The datasets all have the same length (first dimension), taken from the first one in
+    the table which is longer than one. Scalars and datasets of length one always pass.
+    Datasets are only compared with those of the same group, for instance the name of
+    the dimension.
+    """
+
+    def __init__(self, group=None,
+                 message="'{item}' does not have the same number of frames as '{reference}'"):
+        self.group = group
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for name, group in _group_by(jobs, lambda check: check.group):
+            group = sorted(group, key=lambda job: job[0])
+            index = numpy.array([snapshot.index[item] for order, item, check in group])
+            lengths = snapshot.length[index]
+            longer = numpy.flatnonzero(lengths != 1)
+            if len(longer) == 0:
+                continue
+            reference = longer[0]
+            bad = (lengths != 1) & (lengths != lengths[reference])
+            for order, item, check in _select(group, bad):
+                fails.append((order, check.message.format(item=item, reference=group[reference][1])))
+
+
+class InRange(Check):
+    """
+    Every value of the dataset lies between minimum and maximum (inclusive), NaN not being in any range.
+    The dataset is read one chunk at a time, up to the first chunk with a value outside the range
+    """
+
+    def __init__(self, minimum, maximum,
+                 message="'{item}' has values outside of the normal range {minimum} to {maximum}"):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.message = message
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for order, item, check in jobs:
+            reduction = reduce_dataset(snapshot.objects[snapshot.index[item]],
+                                       limits=(check.minimum, check.maximum), stop_at_failure=True)
+            if not reduction.within_limits:
+                fails.append((order, check.message.format(item=item, minimum=check.minimum,
+                                                          maximum=check.maximum)))
+
+
+class Include(Check):
+    """
+    Not a check: return the dataset or group in the values, keyed by its path
+    """
+
+    groups = True
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        for order, item, check in jobs:
+            values[item] = snapshot.objects[snapshot.index[item]]
+
+
+class Custom(Check):
+    """
+    A recipe function called as function(context, group, item, values, fails), one path at a
+    time in table order, for checks which have no declarative equivalent
+    """
+
+    groups = True
+
+    def __init__(self, function):
+        self.function = function
+
+    @classmethod
+    def evaluate(cls, jobs, snapshot, values, fails):
+        context = {}
+        for order, item, check in sorted(jobs, key=lambda job: job[0]):
+            messages = []
+            check.function(context, snapshot.group, item, values, messages)
+            fails.extend((order, message) for message in messages)
+
+
+def _group_by(jobs, key):
+    groups = {}
+    for job in jobs:
+        groups.setdefault(key(job[2]), []).append(job)
+    return groups.items()
+
+
+def _select(jobs, mask):
+    return [job for job, selected in zip(jobs, mask) if selected]
+
+
+class Snapshot(object):
+    """
+    What a Plan reads of a group: for every path in the table (indexed by index[path])
+    the object found or None, and for datasets their shape, dtype, number of dimensions
+    and length, -1 for groups and missing paths. Datasets with a null dataspace (h5py.Empty)
+    have no shape and are marked in empty. attrs holds the attributes any check asked for.
+    """
+
+    def __init__(self, group, items):
+        n = len(items)
+        self.group = group
+        self.index = dict((item, i) for i, item in enumerate(items))
+        self.objects = [None] * n
+        self.shape = [None] * n
+        self.dtype = [None] * n
+        self.dtype_str = numpy.full(n, "", dtype=object)
+        self.ndim = numpy.full(n, -1)
+        self.length = numpy.full(n, -1)
+        self.empty = numpy.zeros(n, dtype=bool)
+        self.attrs = [{} for i in range(n)]
+
+    def add(self, i, obj, attrs):
+        self.objects[i] = obj
+        if isinstance(obj, h5py.Dataset) and obj.shape is None:
+            self.dtype[i] = obj.dtype
+            self.dtype_str[i] = obj.dtype.str
+            self.empty[i] = True
+        elif isinstance(obj, h5py.Dataset):
+            self.shape[i] = obj.shape
+            self.dtype[i] = obj.dtype
+            self.dtype_str[i] = obj.dtype.str
+            self.ndim[i] = len(obj.shape)
+            self.length[i] = obj.shape[0] if len(obj.shape) > 0 else 1
+        for name in attrs:
+            if name in obj.attrs:
+                self.attrs[i][name] = obj.attrs[name]
+
+
+class Plan(object):
+    """
+    A compiled table, see compile_schema
+    """
+
+    def __init__(self, rules, missing):
+        self.rules = rules
+        self.missing = missing
+        self.items = [item for item, optional, checks in rules]
+        # tree of the path components, with the rule index of complete paths under None
+        self.tree = {}
+        self.attrs = []
+        self.jobs = {}
+        for i, (item, optional, checks) in enumerate(rules):
+            node = self.tree
+            for part in item.split("/"):
+                node = node.setdefault(part, {})
+            node[None] = i
+            self.attrs.append(set(name for check in checks for name in check.attrs))
+            for j, check in enumerate(checks):
+                self.jobs.setdefault(type(check), []).append(((i, j), item, check))
+
+    def snapshot(self, group):
+        """
+        Read everything the checks need from group, walking only down the paths in the table
+        """
+        snapshot = Snapshot(group, self.items)
+        pending = [(group, self.tree)]
+        while pending:
+            parent, node = pending.pop()
+            keys = set(parent.keys())
+            for part, child in node.items():
+                if part is None or part not in keys:
+                    continue
+                obj = parent.get(part)
+                if obj is None:
+                    continue
+                if None in child:
+                    snapshot.add(child[None], obj, self.attrs[child[None]])
+                if isinstance(obj, h5py.Group) and len(child) > (None in child):
+                    pending.append((obj, child))
+        return snapshot
+
+    def run(self, group):
+        """
+        Validate group
+
+        :param group: The h5py group the paths of the table are relative to
+        :return: the values returned by Include checks, keyed by path, and the list of failure messages
+        """
+        snapshot = self.snapshot(group)
+        values = {}
+        fails = []
+        for i, (item, optional, checks) in enumerate(self.rules):
+            if snapshot.objects[i] is None and not optional:
+                fails.append(((i, -1), self.missing.format(item=item, name=group.name)))
+        for cls, jobs in self.jobs.items():
+            present = [job for job in jobs if snapshot.objects[snapshot.index[job[1]]] is not None]
+            if not cls.groups:
+                datasets = []
+                for job in present:
+                    if snapshot.empty[snapshot.index[job[1]]]:
+                        fails.append((job[0], "'{}' is an empty dataset".format(job[1])))
+                    elif snapshot.ndim[snapshot.index[job[1]]] < 0:
+                        fails.append((job[0], "'{}' is not a dataset".format(job[1])))
+                    else:
+                        datasets.append(job)
+                present = datasets
+            if present:
+                cls.evaluate(present, snapshot, values, fails)
+        fails.sort(key=lambda fail: fail[0])
+        return values, [message for order, message in fails]
+
+
+def _flatten(checks):
+    for check in checks:
+        if isinstance(check, (list, tuple)):
+            for inner in _flatten(check):
+                yield inner
+        elif isinstance(check, Check):
+            yield check
+        else:
+            yield Custom(check)
+
+
+def compile_schema(table, missing="'{item}' is missing from {name}"):
+    """
+    Compile a validation table into a Plan
+
+    :param table: dict of path to a list of checks, to (optional, checks) or to {"minOccurs": 0 or 1, "checks": checks}.
+                  Checks are Check instances, lists of them or functions to wrap in Custom.
+    :param missing: Message for a required path which is missing, formatted with the path as item
+                    and the name of the group validated as name
+    :return: the Plan
+    """
+    rules = []
+    for item, rule in table.items():
+        if isinstance(rule, dict):
+            if rule["minOccurs"] not in (0, 1):
+                raise ValueError("minOccurs of '{}' must be 0 or 1".format(item))
+            optional, checks = rule["minOccurs"] == 0, rule["checks"]
+        elif isinstance(rule, tuple):
+            optional, checks = rule
+        else:
+            optional, checks = False, rule
+        rules.append((item, optional, list(_flatten(checks))))
+    return Plan(rules, missing)
@@ -0,0 +1,135 @@
+"""
+Conversion of values between the units given in NeXus units attributes.
+
+A pair of units is resolved to a single scale factor from a table, once, and the factor
+is then applied to a whole array with one multiply, instead of testing the unit strings
+for every value:
+
+    times = convert(dset[...], dset.attrs["units"], "s")
+    times_ns = convert(dset[...], dset.attrs["units"], "ns", dtype=numpy.int64)
+
+Units attributes may be str or bytes, as scalars or one element arrays. Only units which
+are plain multiples of each other are supported, not temperatures or compound units.
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+import math
+
+import numpy
+
+from nxindex import decode
+
+# Decimal factors are kept exact, so that for instance microseconds to nanoseconds is an integer
+_TIME = {
+    "s": 1, "second": 1, "seconds": 1,
+    "ms": Fraction(1, 10 ** 3), "millisecond": Fraction(1, 10 ** 3), "milliseconds": Fraction(1, 10 ** 3),
+    "us": Fraction(1, 10 ** 6), "µs": Fraction(1, 10 ** 6), "microsecond": Fraction(1, 10 ** 6),
+    "microseconds": Fraction(1, 10 ** 6),
+    "ns": Fraction(1, 10 ** 9), "nanosecond": Fraction(1, 10 ** 9), "nanoseconds": Fraction(1, 10 ** 9),
+    "min": 60, "minute": 60, "minutes": 60,
+    "h": 3600, "hour": 3600, "hours": 3600,
+}
+_LENGTH = {
+    "m": 1, "metre": 1, "metres": 1, "meter": 1, "meters": 1,
+    "cm": Fraction(1, 10 ** 2), "mm": Fraction(1, 10 ** 3),
+    "um": Fraction(1, 10 ** 6), "µm": Fraction(1, 10 ** 6), "micron": Fraction(1, 10 ** 6),
+    "microns": Fraction(1, 10 ** 6),
+    "nm": Fraction(1, 10 ** 9),
+    "angstrom": Fraction(1, 10 ** 10), "angstroms": Fraction(1, 10 ** 10), "Å": Fraction(1, 10 ** 10),
+}
+_ANGLE = {
+    "rad": 1, "radian": 1, "radians": 1,
+    "mrad": Fraction(1, 10 ** 3),
+    "deg": math.pi / 180, "degree": math.pi / 180, "degrees": math.pi / 180,
+}
+
+# dimension and factor to the base unit of that dimension, by units string
+UNITS = {}
+for _dimension, _table in (("time", _TIME), ("length", _LENGTH), ("angle", _ANGLE)):
+    for _name, _factor in _table.items():
+        UNITS[_name] = (_dimension, _factor)
+
+
+def units_string(units):
+    """
+    A units attribute as a str, whichever way it was written
+
+    :param units: str, bytes or numpy array or scalar holding one of them
+    :return: The units, without surrounding white space
+    """
+    text = decode(units)
+    if text is None:
+        raise ValueError("Units should be a string, not {!r}".format(units))
+    return text.strip()
+
+
+@lru_cache(maxsize=None)
+def _scale_factor(from_units, to_units):
+    if from_units == to_units:
+        return 1
+    try:
+        from_dimension, from_factor = UNITS[from_units]
+        to_dimension, to_factor = UNITS[to_units]
+    except KeyError as e:
+        raise ValueError("Unrecognised units '{}'".format(e.args[0]))
+    if from_dimension != to_dimension:
+        raise ValueError("Can't convert units '{}' to '{}'".format(from_units, to_units))
+    factor = from_factor / to_factor
+    if isinstance(factor, Fraction) and factor.denominator == 1:
+        return int(factor)
+    return float(factor)
+
+
+def scale_factor(from_units, to_units):
+    """
+    The number to multiply values in from_units by to have them in to_units
+
+    :param from_units: Units of the values, e.g. a units attribute
+    :param to_units: Units wanted
+    :return: The factor, an int when it is a whole number
+    """
+    return _scale_factor(units_string(from_units), units_string(to_units))
+
+
+def convert(values, from_units, to_units, dtype=numpy.float64, copy=True):
+    """
+    Convert a value or array of values between units
+
+    :param values: Value or array to convert
+    :param from_units: Units of the values, e.g. a units attribute
+    :param to_units: Units wanted
+    :param dtype: dtype of the result, an integer dtype rounds to the nearest whole to_unit
+                  (e.g. numpy.int64 with "ns" for exact nanosecond timestamps)
+    :param copy: Set to False to convert an array which already has dtype in place
+    :return: The converted array, or a numpy scalar for a scalar value
+    """
+    factor = scale_factor(from_units, to_units)
+    dtype = numpy.dtype(dtype)
+    values = numpy.asarray(values)
+    if dtype.kind in "iu" and not (values.dtype.kind in "iu" and isinstance(factor, int)):
+        # round the values scaled in floating point to the integer dtype
+        result = values.astype(numpy.float64)
+        result *= factor
+        result = numpy.rint(result, out=result).astype(dtype)
+    else:
+        result = values.astype(dtype, copy=copy or values.dtype != dtype)
+        if factor != 1:
+            result *= dtype.type(factor)
+    if result.ndim == 0:
+        return result[()]
+    return result
+
+
+def dataset_units(dset, default=None):
+    """
+    The units attribute of a dataset as a str
+
+    :param dset: h5py Dataset
+    :param default: Units to assume when the dataset has none, None to raise KeyError
+    """
+    if "units" not in dset.attrs:
+        if default is None:
+            raise KeyError("No units attribute on {}".format(dset.name))
+        return default
+    return units_string(dset.attrs["units"])
@@ -1,39 +1,19 @@
-def check_nframes(context, nxTomo, item, values, fails):
-    frames = nxTomo[item].shape[0]
-    if ('nFrames' not in context.keys()) and frames != 1:
-        context['nFrames'] = frames
-        context['nFrames_item'] = item
-    else:
-        if frames not in [context['nFrames'], 1]:
-            fails.append("'{}' does not have the same number of frames as '{}'".format(item, context['nFrames_item']))
+from nxschema import compile_schema, Include, InRange, SameLength
 
 
-def include_data(context, nxTomo, item, values, fails):
-    values[item] = nxTomo[item]
-
-
-def check_image_keys(context, nxTomo, item, values, fails):
-    data = nxTomo[item][...]
-    if data.max() > 3 or data.min() < 0:
-        fails.append("'{}' has values outside of the normal range 0 to 3".format(item))
-
-
-INCLUDE_DATA = 'include_data'
-CHECK_NFRAMES = 'check_nframes'
-CHECK_IMAGE_KEYS = 'check_image_keys'
 VALIDATE = {
     "control": [],
-    "control/data": [check_nframes],
+    "control/data": [SameLength()],
     "data": [],
-    "data/image_key": [include_data, check_image_keys],
-    "data/rotation_angle": [include_data, check_nframes],
-    "data/data": [include_data, check_nframes],
+    "data/image_key": [Include(), InRange(0, 3)],
+    "data/rotation_angle": [Include(), SameLength()],
+    "data/data": [Include(), SameLength()],
     "definition": [],
     "instrument": [],
     "instrument/detector": [],
-    "instrument/detector/data": [check_nframes],
+    "instrument/detector/data": [SameLength()],
     "instrument/detector/distance": [],
-    "instrument/detector/image_key": [check_nframes, check_image_keys],
+    "instrument/detector/image_key": [SameLength(), InRange(0, 3)],
     "instrument/detector/x_pixel_size": [],
     "instrument/detector/y_pixel_size": [],
     "instrument/detector/x_rotation_axis_pixel_position": [],
@@ -46,14 +26,15 @@ VALIDATE = {
     "instrument/source/type": [],
     "sample": [],
     "sample/name": [],
-    "sample/rotation_angle": [check_nframes],
-    "sample/x_translation": [check_nframes],
-    "sample/y_translation": [check_nframes],
-    "sample/z_translation": [check_nframes],
+    "sample/rotation_angle": [SameLength()],
+    "sample/x_translation": [SameLength()],
+    "sample/y_translation": [SameLength()],
+    "sample/z_translation": [SameLength()],
     "title": [],
     "start_time": [],
     "end_time": [],
 }
+PLAN = compile_schema(VALIDATE, missing="'NXtomo/{item}' is missing from the NXtomo entry")
 
 
 class _NXTomoFinder(object):
@@ -73,27 +54,8 @@ class _NXTomoFinder(object):
         return self.hits
 
 
-def check_path(entry, path):
-    section = entry
-    for part in path.split('/'):
-        if part in section.keys():
-            section = section[part]
-        else:
-            return False
-    return True
-
-
 def validate(nxTomo):
-    context = {}
-    values = {}
-    fails = []
-
-    for item in VALIDATE.keys():
-        if check_path(nxTomo, item):
-            for test in VALIDATE[item]:
-                test(context, nxTomo, item, values, fails)
-        else:
-            fails.append("'NXtomo/{}' is missing from the NXtomo entry".format(item))
+    values, fails = PLAN.run(nxTomo)
     if len(fails) > 0:
         raise AssertionError('\n'.join(fails))
     return values
@@ -112,6 +74,10 @@ class recipe:
         self.entry = entrypath
         self.title = "NXtomo"
 
+    def detect(self, index):
+        """Whether the entry has an NXtomo application definition"""
+        return "NXtomo" in index.definitions()
+
     def process(self):
         nxTomo = _NXTomoFinder()
         nxTomoList = nxTomo.get_NXtomo(self.file, self.entry)
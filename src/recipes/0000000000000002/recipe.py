@@ -24,6 +24,10 @@ class recipe:
         self.entry = entrypath
         self.title = "NXdetector with image key"
 
+    def detect(self, index):
+        """Whether an NXdetector of the entry has an image_key"""
+        return any("image_key" in group for name, group in index.find_class("NXdetector"))
+
     def process(self):
         nxDet = get_NXdetector_with_image_key(self.file, self.entry)
         if nxDet is not None:
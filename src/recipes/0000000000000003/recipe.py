@@ -22,6 +22,10 @@ class recipe:
         self.entry = entrypath
         self.title = "GDA scan command"
 
+    def detect(self, index):
+        """Whether the entry has a scan_command dataset"""
+        return any("scan_command" in name for name in index.datasets)
+
     def process(self):
         gda_scan = get_gda_scan_command(self.file, self.entry)
         if gda_scan is not None:
@@ -1,142 +1,41 @@
-class check_dtype(object):
-    """
-    A class to check whether the dataset data type matches the expected
-
-    """
-
-    def __init__(self, dtype):
-        self.dtype = dtype
+from nxschema import compile_schema, Attr, Dims, Dtype, IsScalar, Shape
+import nxindex
+import nxunits
 
-    def __call__(self, dset):
-        dtype = dset.dtype
-        if dtype not in self.dtype:
-            return False, "{} is type {}, expected {}".format(
-                dset.name, dtype, ', '.join(self.dtype))
-        return True, ""
 
-
-class check_dims(object):
+def check_dset(dtype=None,
+               dims=None,
+               shape=None,
+               is_scalar=None):
     """
-    A class to check whether the dataset dimensions matches the expected
+    Checks of the properties of a dataset
+    :param dtype:         The datatype
+    :param dims:          The number of dimensions
+    :param shape:         The shape of the dataset
+    :param is_scalar:     Whether the dataset is a single value
 
     """
+    checks = []
+    if dtype is not None:
+        checks.append(Dtype(dtype))
+    if dims is not None:
+        checks.append(Dims(dims))
+    if shape is not None:
+        checks.append(Shape(shape))
+    if is_scalar is not None:
+        checks.append(IsScalar(is_scalar))
+    return checks
 
-    def __init__(self, dims):
-        self.dims = dims
-
-    def __call__(self, dset):
-        dims = len(dset.shape)
-        if not dims == self.dims:
-            return False, '{} has dims {}, expected {}'.format(
-                dset.name, str(dims), str(self.dims))
-        return True, ''
 
-
-class check_shape(object):
-    """
-    A class to check whether the dataset shape matches the expected
-
-    """
-
-    def __init__(self, shape):
-        self.shape = shape
-
-    def __call__(self, dset):
-        shape = dset.shape
-        if not shape == self.shape:
-            return False, '{} has shape {}, expected {}'.format(
-                dset.name, str(shape), str(self.shape))
-        return True, ''
-
-
-class check_is_scalar(object):
-    """
-    A class to check whether the dataset is scalar or not
-
-    """
-
-    def __init__(self, is_scalar):
-        self.is_scalar = is_scalar
-
-    def __call__(self, dset):
-        try:
-            data = dset[()]
-            s = True
-        except Exception:
-            s = False
-        if s != self.is_scalar:
-            return False, '{} == scalar is {}, expected {}'.format(
-                dset.name, s, self.is_scalar)
-        return True, ''
-
-
-class check_dset(object):
-    """
-    Check properties of a dataset
-
-    """
-
-    def __init__(self,
-                 dtype=None,
-                 dims=None,
-                 shape=None,
-                 is_scalar=None):
-        """
-        Set stuff to check
-        :param dtype:         The datatype
-        :param dims:          The number of dimensions
-        :param shape:         The shape of the dataset
-
-        """
-        self.checks = []
-        if dtype is not None:
-            if not isinstance(dtype, list) and not isinstance(dtype, tuple):
-                dtype = [dtype]
-            self.checks.append(check_dtype(dtype))
-        if dims is not None:
-            self.checks.append(check_dims(dims))
-        if shape is not None:
-            self.checks.append(check_shape(shape))
-        if is_scalar is not None:
-            self.checks.append(check_is_scalar(is_scalar))
-
-    def __call__(self, dset):
-        for check in self.checks:
-            passed, errors = check(dset)
-            if not passed:
-                raise RuntimeError(errors)
-
-
-class check_attr(object):
+def check_attr(name, value=None, dtype=None):
     """
     Check some properties of an attribute
+    :param name:  The name of the attribute
+    :param value: The value of the attribute
+    :param dtype: The python type of the attribute
 
     """
-
-    def __init__(self, name, value=None, dtype=None):
-        """
-        Set stuff to check
-        :param name:  The name of the attribute
-        :param value: The value of the attribute
-        :param tests: A list of tests to run
-
-        """
-        self.name = name
-        self.value = value
-        self.dtype = dtype
-
-    def __call__(self, dset):
-        if self.name not in dset.attrs.keys():
-            raise RuntimeError("'{}' does not have an attribute '{}'".format(
-                dset.name, self.name))
-        elif self.value is not None and dset.attrs[self.name] != self.value:
-            raise RuntimeError("attribute '{}' of {} has value {}, expected {}".format(
-                self.name, dset.name, dset.attrs[self.name], self.value))
-        elif self.dtype is not None:
-            dtype = type(dset.attrs[self.name])
-            if not isinstance(dset.attrs[self.name], self.dtype):
-                raise RuntimeError("attribute '{}' of '{}' has type {}, expected {}".format(
-                    self.name, dset.name, dtype, self.dtype))
+    return Attr(name, value=value, dtype=dtype)
 
 
 def find_entries(nx_file, entry):
@@ -148,9 +47,9 @@ def find_entries(nx_file, entry):
 
     def visitor(name, obj):
         if "NX_class" in obj.attrs.keys():
-            if str(obj.attrs["NX_class"], 'utf8') in ["NXentry", "NXsubentry"]:
+            if nxindex.decode(obj.attrs["NX_class"]) in ["NXentry", "NXsubentry"]:
                 if "definition" in obj.keys():
-                    if str(obj["definition"][()], 'utf8') == "NXmx":
+                    if nxindex.decode(obj["definition"][()]) == "NXmx":
                         hits.append(obj)
 
     visitor(entry, nx_file[entry])
@@ -167,7 +66,7 @@ def find_class(nx_file, nx_class):
 
     def visitor(name, obj):
         if "NX_class" in obj.attrs.keys():
-            if str(obj.attrs["NX_class"], 'utf8') == nx_class:
+            if nxindex.decode(obj.attrs["NX_class"]) == nx_class:
                 hits.append(obj)
 
     nx_file.visititems(visitor)
@@ -176,39 +75,13 @@ def find_class(nx_file, nx_class):
 
 def convert_units(value, input_units, output_units):
     """
-    Hacky utility function to convert units
-
-    """
-    converters = {
-        'm': {
-            'mm': lambda x: x * 1e3,
-            'microns': lambda x: x * 1e6,
-            'nm': lambda x: x * 1e9
-        },
-        'mm': {
-            'm': lambda x: x * 1e-3,
-            'microns': lambda x: x * 1e3,
-            'nm': lambda x: x * 1e6
-        },
-        'microns': {
-            'm': lambda x: x * 1e-6,
-            'mm': lambda x: x * 1e-3,
-            'nm': lambda x: x * 1e3
-        },
-        'nm': {
-            'm': lambda x: x * 1e-9,
-            'mm': lambda x: x * 1e-6,
-            'microns': lambda x: x * 1e-3,
-            'angstroms': lambda x: x * 10
-        }
-    }
-    if input_units == output_units:
-        return value
+    Convert a value or array between units, see nxunits.convert
+
+    """
     try:
-        return converters[input_units][output_units](value)
-    except Exception:
-        pass
-    raise RuntimeError('Can\'t convert units "{}" to "{}"'.format(input_units, output_units))
+        return nxunits.convert(value, input_units, output_units)
+    except ValueError:
+        raise RuntimeError('Can\'t convert units "{}" to "{}"'.format(input_units, output_units))
 
 
 def visit_dependencies(nx_file, item, visitor=None):
@@ -219,9 +92,9 @@ def visit_dependencies(nx_file, item, visitor=None):
     import os.path
     dependency_chain = []
     if os.path.basename(item) == 'depends_on':
-        depends_on = nx_file[item][()]
+        depends_on = nxindex.decode(nx_file[item][()])
     else:
-        depends_on = nx_file[item].attrs['depends_on']
+        depends_on = nxindex.decode(nx_file[item].attrs['depends_on'])
     while not depends_on == ".":
         if visitor is not None:
             visitor(nx_file, depends_on)
@@ -233,7 +106,7 @@ def visit_dependencies(nx_file, item, visitor=None):
             raise RuntimeError("'{}' is missing from nx_file".format(depends_on))
         dependency_chain.append(depends_on)
         try:
-            depends_on = nx_file[depends_on].attrs["depends_on"]
+            depends_on = nxindex.decode(nx_file[depends_on].attrs["depends_on"])
         except Exception:
             raise RuntimeError("'{}' contains no depends_on attribute".format(depends_on))
 
@@ -253,20 +126,18 @@ def construct_vector(nx_file, item, vector=None):
             from scitbx import matrix
             item = nx_file[depends_on]
             value = item[()]
-            units = str(item.attrs['units'], 'utf8')
-            ttype = str(item.attrs['transformation_type'], 'utf8')
+            units = item.attrs['units']
+            ttype = nxindex.decode(item.attrs['transformation_type'])
             vector = matrix.col(item.attrs['vector'])
             if ttype == 'translation':
                 value = convert_units(value, units, 'mm')
                 self.vector = vector * value + self.vector
             elif ttype == 'rotation':
-                if units == 'rad':
-                    deg = False
-                elif units == 'deg':
-                    deg = True
-                else:
-                    raise RuntimeError('Invalid units: {}'.format(units))
-                self.vector.rotate(axis=vector, angle=value, deg=deg)
+                try:
+                    angle = nxunits.convert(value, units, 'rad')
+                except ValueError:
+                    raise RuntimeError('Invalid units: {}'.format(nxunits.units_string(units)))
+                self.vector.rotate(axis=vector, angle=angle, deg=False)
             else:
                 raise RuntimeError('Unknown transformation_type: {}'.format(ttype))
 
@@ -275,8 +146,8 @@ def construct_vector(nx_file, item, vector=None):
 
     if vector is None:
         value = nx_file[item][()]
-        units = str(nx_file[item].attrs['units'], 'uft8')
-        ttype = str(nx_file[item].attrs['transformation_type'], 'uft8')
+        units = nx_file[item].attrs['units']
+        ttype = nxindex.decode(nx_file[item].attrs['transformation_type'])
         vector = nx_file[item].attrs['vector']
         if ttype == 'translation':
             value = convert_units(value, units, "mm")
@@ -292,24 +163,20 @@ def construct_vector(nx_file, item, vector=None):
 
 def run_checks(handle, items):
     """
-    Run checks for datasets
+    Run checks for datasets, raising the first failure
 
     """
-    for item, detail in items.items():
-        min_occurs = detail["minOccurs"]
-        checks = detail['checks']
-        assert (min_occurs in [0, 1])
-        try:
-            dset = handle[item]
-        except Exception:
-            dset = None
-            if min_occurs != 0:
-                raise RuntimeError('Could not find {} in {}'.format(item, handle.name))
-            else:
-                continue
-        if dset is not None:
-            for check in checks:
-                check(dset)
+    values, fails = items.run(handle)
+    if len(fails) > 0:
+        raise RuntimeError(fails[0])
+
+
+def compile_items(items):
+    """
+    Compile the items to validate in a class
+
+    """
+    return compile_schema(items, missing="Could not find {item} in {name}")
 
 
 class NXdetector_module(object):
@@ -318,58 +185,58 @@ class NXdetector_module(object):
 
     """
 
+    ITEMS = compile_items({
+        "data_origin": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["uint32", "uint64", "int32", "int64"], shape=(2,))
+            ]
+        },
+        "data_size": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["int32", "int64", "uint32", "uint64"], shape=(2,))
+            ]
+        },
+        "module_offset": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["float64", "float32", "int64", "int32"], is_scalar=True),
+                check_attr("transformation_type"),
+                check_attr("vector"),
+                check_attr("offset"),
+                check_attr("units", dtype=(bytes, str)),
+                check_attr("depends_on")
+            ]
+        },
+        "fast_pixel_direction": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True),
+                check_attr("transformation_type"),
+                check_attr("vector"),
+                check_attr("offset"),
+                check_attr("units", dtype=(bytes, str)),
+                check_attr("depends_on")
+            ]
+        },
+        "slow_pixel_direction": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True),
+                check_attr("transformation_type"),
+                check_attr("vector"),
+                check_attr("offset"),
+                check_attr("units", dtype=(bytes, str)),
+                check_attr("depends_on"),
+            ]
+        },
+    })
+
     def __init__(self, handle, errors=None):
         self.handle = handle
 
-        items = {
-            "data_origin": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["uint32", "uint64", "int32", "int64"], shape=(2,))
-                ]
-            },
-            "data_size": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["int32", "int64", "uint32", "uint64"], shape=(2,))
-                ]
-            },
-            "module_offset": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["float64", "float32", "int64", "int32"], is_scalar=True),
-                    check_attr("transformation_type"),
-                    check_attr("vector"),
-                    check_attr("offset"),
-                    check_attr("units", dtype=bytes),
-                    check_attr("depends_on")
-                ]
-            },
-            "fast_pixel_direction": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True),
-                    check_attr("transformation_type"),
-                    check_attr("vector"),
-                    check_attr("offset"),
-                    check_attr("units", dtype=bytes),
-                    check_attr("depends_on")
-                ]
-            },
-            "slow_pixel_direction": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True),
-                    check_attr("transformation_type"),
-                    check_attr("vector"),
-                    check_attr("offset"),
-                    check_attr("units", dtype=bytes),
-                    check_attr("depends_on"),
-                ]
-            },
-        }
-
-        run_checks(self.handle, items)
+        run_checks(self.handle, self.ITEMS)
 
 
 class NXdetector(object):
@@ -378,160 +245,160 @@ class NXdetector(object):
 
     """
 
+    # The items to validate
+    ITEMS = compile_items({
+        "depends_on": {
+            "minOccurs": 1,
+            "checks": []
+        },
+        "data": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dims=3)
+            ]
+        },
+        "description": {
+            "minOccurs": 1,
+            "checks": []
+        },
+        "time_per_channel": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "distance": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+        "dead_time": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+        "count_time": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+        "beam_centre_x": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+        "beam_centre_y": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+        "angular_calibration_applied": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
+            ]
+        },
+        "angular_calibration": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"])
+            ]
+        },
+        "flatfield_applied": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
+            ]
+        },
+        "flatfield": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"])
+            ]
+        },
+        "flatfield_error": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"])
+            ]
+        },
+        "pixel_mask_applied": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
+            ]
+        },
+        "pixel_mask": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype="int32")
+            ]
+        },
+        "countrate_correction_applied": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
+            ]
+        },
+        "bit_depth_readout": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['int32', "int64"], is_scalar=True)
+            ]
+        },
+        "detector_readout_time": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['float32', "float64"], is_scalar=True)
+            ]
+        },
+        "frame_time": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['float32', "float64"], is_scalar=True)
+            ]
+        },
+        "gain_setting": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "saturation_value": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["int32", "int64"], is_scalar=True)
+            ]
+        },
+        "sensor_material": {
+            "minOccurs": 1,
+            "checks": []
+        },
+        "sensor_thickness": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True),
+                check_attr("units", dtype=(bytes, str))
+            ]
+        },
+        "threshold_energy": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=['float32', "float64"], is_scalar=True)
+            ]
+        },
+        "type": {
+            "minOccurs": 1,
+            "checks": []
+        },
+    })
+
     def __init__(self, handle, errors=None):
 
         self.handle = handle
 
-        # The items to validate
-        items = {
-            "depends_on": {
-                "minOccurs": 1,
-                "checks": []
-            },
-            "data": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dims=3)
-                ]
-            },
-            "description": {
-                "minOccurs": 1,
-                "checks": []
-            },
-            "time_per_channel": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "distance": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-            "dead_time": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-            "count_time": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-            "beam_centre_x": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-            "beam_centre_y": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-            "angular_calibration_applied": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
-                ]
-            },
-            "angular_calibration": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"])
-                ]
-            },
-            "flatfield_applied": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
-                ]
-            },
-            "flatfield": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"])
-                ]
-            },
-            "flatfield_error": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"])
-                ]
-            },
-            "pixel_mask_applied": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
-                ]
-            },
-            "pixel_mask": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype="int32")
-                ]
-            },
-            "countrate_correction_applied": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['int32', 'int64', 'uint32', 'uint64'], is_scalar=True)
-                ]
-            },
-            "bit_depth_readout": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['int32', "int64"], is_scalar=True)
-                ]
-            },
-            "detector_readout_time": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['float32', "float64"], is_scalar=True)
-                ]
-            },
-            "frame_time": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['float32', "float64"], is_scalar=True)
-                ]
-            },
-            "gain_setting": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "saturation_value": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["int32", "int64"], is_scalar=True)
-                ]
-            },
-            "sensor_material": {
-                "minOccurs": 1,
-                "checks": []
-            },
-            "sensor_thickness": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True),
-                    check_attr("units", dtype=bytes)
-                ]
-            },
-            "threshold_energy": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=['float32', "float64"], is_scalar=True)
-                ]
-            },
-            "type": {
-                "minOccurs": 1,
-                "checks": []
-            },
-        }
-
-        run_checks(self.handle, items)
+        run_checks(self.handle, self.ITEMS)
 
         # Find the NXdetector_modules
         self.modules = []
@@ -577,35 +444,35 @@ class NXbeam(object):
 
     """
 
+    ITEMS = compile_items({
+        "incident_wavelength": {
+            "minOccurs": 1,
+            "checks": [
+                check_dset(dtype=['float32', "float64"], is_scalar=True)
+            ]
+        },
+        "incident_wavelength_spectrum": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "incident_polarization_stokes": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], shape=(4,))
+            ]
+        },
+        "flux": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype=["float32", "float64"], is_scalar=True)
+            ]
+        },
+    })
+
     def __init__(self, handle, errors=None):
         self.handle = handle
 
-        items = {
-            "incident_wavelength": {
-                "minOccurs": 1,
-                "checks": [
-                    check_dset(dtype=['float32', "float64"], is_scalar=True)
-                ]
-            },
-            "incident_wavelength_spectrum": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "incident_polarization_stokes": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], shape=(4,))
-                ]
-            },
-            "flux": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype=["float32", "float64"], is_scalar=True)
-                ]
-            },
-        }
-
-        run_checks(self.handle, items)
+        run_checks(self.handle, self.ITEMS)
 
 
 class NXsample(object):
@@ -614,56 +481,56 @@ class NXsample(object):
 
     """
 
+    ITEMS = compile_items({
+        "name": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "depends_on": {
+            "minOccurs": 1,
+            "checks": []
+        },
+        "chemical_formula": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "unit_cell": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype="float64", dims=2)
+            ]
+        },
+        "unit_cell_class": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "unit_cell_group": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "sample_orientation": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype="float64", shape=(3,))
+            ]
+        },
+        "orientation_matrix": {
+            "minOccurs": 0,
+            "checks": [
+                check_dset(dtype="float64", dims=3)
+            ]
+        },
+        "temperature": {
+            "minOccurs": 0,
+            "checks": []
+        },
+    })
+
     def __init__(self, handle, errors=None):
 
         self.handle = handle
 
-        items = {
-            "name": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "depends_on": {
-                "minOccurs": 1,
-                "checks": []
-            },
-            "chemical_formula": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "unit_cell": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype="float64", dims=2)
-                ]
-            },
-            "unit_cell_class": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "unit_cell_group": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "sample_orientation": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype="float64", shape=(3,))
-                ]
-            },
-            "orientation_matrix": {
-                "minOccurs": 0,
-                "checks": [
-                    check_dset(dtype="float64", dims=3)
-                ]
-            },
-            "temperature": {
-                "minOccurs": 0,
-                "checks": []
-            },
-        }
-
-        run_checks(self.handle, items)
+        run_checks(self.handle, self.ITEMS)
 
         # Find the NXsource
         self.beams = []
@@ -695,26 +562,26 @@ class NXmxEntry(object):
 
     """
 
+    ITEMS = compile_items({
+        'title': {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "start_time": {
+            "minOccurs": 0,
+            "checks": []
+        },
+        "end_time": {
+            "minOccurs": 0,
+            "checks": []
+        },
+    })
+
     def __init__(self, handle, errors=None):
 
         self.handle = handle
 
-        items = {
-            'title': {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "start_time": {
-                "minOccurs": 0,
-                "checks": []
-            },
-            "end_time": {
-                "minOccurs": 0,
-                "checks": []
-            },
-        }
-
-        run_checks(self.handle, items)
+        run_checks(self.handle, self.ITEMS)
 
         # Find the NXinstrument
         self.instruments = []
@@ -766,6 +633,25 @@ def validate(nx_file, item, test):
     return values
 
 
+def required_items(plan):
+    """
+    The names a compiled class table requires
+
+    """
+    return set(item for item, optional, checks in plan.rules if not optional)
+
+
+def containing(index, nx_class, plan, names):
+    """
+    The paths in index of the groups of nx_class with the items plan requires, if any, and one of names
+    below them, if any
+
+    """
+    return [name for name, group in index.find_class(nx_class)
+            if (plan is None or required_items(plan) <= set(group.keys()))
+            and (names is None or any(other.startswith(name + "/") for other in names))]
+
+
 def check_path(nx_file, path):
     """
     Ensure path exists
@@ -790,6 +676,16 @@ class recipe:
         self.entry = entrypath
         self.title = "NXmx"
 
+    def detect(self, index):
+        """Whether an NXmx entry has the instrument, detector module, sample, beam and data groups"""
+        if "NXmx" not in index.definitions(include_entry=True) or not index.has_class("NXdata"):
+            return False
+        modules = containing(index, "NXdetector_module", NXdetector_module.ITEMS, None)
+        detectors = containing(index, "NXdetector", NXdetector.ITEMS, modules)
+        beams = containing(index, "NXbeam", NXbeam.ITEMS, None)
+        return (len(containing(index, "NXinstrument", None, detectors)) > 0
+                and len(containing(index, "NXsample", NXsample.ITEMS, beams)) > 0)
+
     def process(self):
         # A list of errors
         self.errors = []
@@ -811,6 +707,20 @@ class recipe:
         
         return self.entries
 
+    def summary(self, entries):
+        """
+        The paths of the groups making up each NXmx entry
+
+        """
+        return [{
+            "entry": entry.handle.name,
+            "detectors": [detector.handle.name
+                          for instrument in entry.instruments
+                          for detector in instrument.detectors],
+            "samples": [sample.handle.name for sample in entry.samples],
+            "data": [data.handle.name for data in entry.data],
+        } for entry in entries]
+
 
 if __name__ == '__main__':
     import sys
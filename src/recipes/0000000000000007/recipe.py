@@ -1,41 +1,13 @@
-def check_len(context, entry, item, values, fails):
-    frames = entry[item].shape[0]
-    if ('nFrames' not in context.keys()) and frames != 1:
-        context['nFrames'] = frames
-        context['nFrames_item'] = item
-    else:
-        if frames not in [context['nFrames'], 1]:
-            fails.append("'{}' does not have the same number of frames as '{}'".format(item, context['nFrames_item']))
+from nxschema import compile_schema, Dtype, SameLength
+import nxindex
 
 
-def check_int(context, entry, item, value, fails):
-    dtype = entry[item].dtype
-    if dtype not in ["int64"]:
-        fails.append("'{}' is of type {}, expected int32 or int64".format(item, dtype))
-
-
-def check_bool(context, entry, item, value, fails):
-    dtype = entry[item].dtype
-    if dtype not in ["bool"]:
-        fails.append("'{}' is of type {}, expected bool".format(item, dtype))
-
-
-def check_uint(context, entry, item, value, fails):
-    dtype = entry[item].dtype
-    if dtype not in ["uint64"]:
-        fails.append("'{}' is of type {}, expected uint64".format(item, dtype))
-
-
-def check_float(context, entry, item, value, fails):
-    dtype = entry[item].dtype
-    if dtype not in ["float64"]:
-        fails.append("'{}' is of type {}, expected float64".format(item, dtype))
-
-
-def check_array_uint(context, entry, item, value, fails):
-    dtype = entry[item].dtype
-    if dtype not in ["object"]:
-        fails.append("'{}' is of type {}, expected object".format(item, dtype))
+check_len = SameLength()
+check_int = Dtype("int64", message="'{item}' is of type {dtype}, expected int32 or int64")
+check_bool = Dtype("bool", message="'{item}' is of type {dtype}, expected bool")
+check_uint = Dtype("uint64", message="'{item}' is of type {dtype}, expected uint64")
+check_float = Dtype("float64", message="'{item}' is of type {dtype}, expected float64")
+check_array_uint = Dtype("object", message="'{item}' is of type {dtype}, expected object")
 
 
 VALIDATE = {
@@ -82,6 +54,8 @@ VALIDATE = {
     "prf_cc": (True, [check_len, check_float]),
     "overlaps": (True, [check_len, check_array_uint]),
 }
+PLAN = compile_schema(VALIDATE, missing="'NXdiffraction/{item}' is missing from the NXdiffraction entry")
+REQUIRED = [item for item, optional, checks in PLAN.rules if not optional]
 
 
 def find_nx_diffraction_entries(nx_file, entry):
@@ -89,35 +63,17 @@ def find_nx_diffraction_entries(nx_file, entry):
 
     def visitor(name, obj):
         if "NX_class" in obj.attrs.keys():
-            if str(obj.attrs["NX_class"], 'utf8') in ["NXentry", "NXsubentry"]:
+            if nxindex.decode(obj.attrs["NX_class"]) in ["NXentry", "NXsubentry"]:
                 if "definition" in obj.keys():
-                    if str(obj["definition"][()], 'utf8') == "NXdiffraction":
+                    if nxindex.decode(obj["definition"][()]) == "NXdiffraction":
                         hits.append(obj)
 
     nx_file[entry].visititems(visitor)
     return hits
 
 
-def check_path(entry, path):
-    section = entry
-    for part in path.split('/'):
-        if part in section.keys():
-            section = section[part]
-        else:
-            return False
-    return True
-
-
 def validate(entry):
-    context = {}
-    values = {}
-    fails = []
-    for item, (optional, tests) in VALIDATE.items():
-        if check_path(entry, item):
-            for test in tests:
-                test(context, entry, item, values, fails)
-        elif not optional:
-            fails.append("'NXdiffraction/{}' is missing from the NXdiffraction entry".format(item))
+    values, fails = PLAN.run(entry)
     if len(fails) > 0:
         raise AssertionError('\n'.join(fails))
     return values
@@ -134,8 +90,14 @@ class recipe:
         self.entry = entrypath
         self.title = "NXdiffraction"
 
+    def detect(self, index):
+        """Whether an NXdiffraction entry has all the required fields"""
+        return any("definition" in group and nxindex.decode(group["definition"][()]) == "NXdiffraction"
+                   and all(item in group for item in REQUIRED)
+                   for name, group in index.find_class("NXentry", "NXsubentry"))
+
     def process(self):
         entries = find_nx_diffraction_entries(self.file, self.entry)
         if len(entries) == 0:
             raise AssertionError('No NXdiffraction entries found')
-        return map(validate, entries)
+        return [validate(entry) for entry in entries]
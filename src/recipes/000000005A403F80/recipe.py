@@ -1,3 +1,4 @@
+import nxindex
 
 
 def find_class(nx_file, nx_class):
@@ -10,7 +11,7 @@ def find_class(nx_file, nx_class):
         nx_class = [nx_class]
     def visitor(name, obj):
         if "NX_class" in obj.attrs.keys():
-            if obj.attrs["NX_class"].decode() in nx_class:
+            if nxindex.decode(obj.attrs["NX_class"]) in nx_class:
                 hits.append((name, obj))
 
     nx_file.visititems(visitor)
@@ -38,6 +39,12 @@ class recipe(object):
         self.entry = entrypath
         self.title = "NXrixs"
 
+    def detect(self, index):
+        """Whether the NXdetectors with any of the required fields have all of them"""
+        hits = [check_detector(group) for name, group in index.find_class("NXdetector")]
+        hits = [h for h in hits if h]
+        return len(hits) > 0 and all(len(h) == len(REQUIRED_FIELDS) for h in hits)
+
     def process(self):
         hits = dict()
         for en, e in find_class(self.file, 'NXentry'):
@@ -14,6 +14,10 @@ class recipe:
         self.entry = entrypath
         self.title = "Has title"
 
+    def detect(self, index):
+        """Whether the entry has a title field"""
+        return index.has("title")
+
     def process(self):
         """
         Finds the title.
@@ -14,6 +14,10 @@ class recipe:
         self.entry = entrypath
         self.title = "Has experiment_identifier"
 
+    def detect(self, index):
+        """Whether the entry has an experiment_identifier field"""
+        return index.has("experiment_identifier")
+
     def process(self):
         """
         Finds the experiment identifier.
@@ -1,6 +1,12 @@
 import h5py
 import numpy as np
 
+from nxchunks import read_dataset, reserve_memory
+import nxunits
+
+# Seconds to wait for room in the memory budget before reading or replicating the geometry anyway
+RESERVE_TIMEOUT = 60
+
 
 class NeXusOFF:
     """
@@ -32,8 +38,8 @@ class NeXusOFF:
         winding_order = None
         for group in geometry_groups:
             new_vertices, new_faces, new_winding_order = self.get_geometry_from_group(group)
-            vertices, faces, winding_order = self.accumulate_geometry(vertices, faces, winding_order, new_vertices,
-                                                                      new_faces, new_winding_order)
+            vertices, faces, winding_order = self.accumulate_geometry(vertices, faces, winding_order,
+                                                                      new_vertices, new_faces, new_winding_order)
         self.write_off_file(off_filename, vertices, faces, winding_order)
 
     def add_shape_from_off_file(self, filename, group, name):
@@ -178,8 +184,9 @@ class NeXusOFF:
         :param group:  NXoff_geometry and parent group in dictionary
         :return: vertices, faces and winding_order information from the group
         """
-        vertices = group['geometry_group']['vertices'][...]
-        return vertices, group['geometry_group']['faces'][...], group['geometry_group']['winding_order'][...]
+        vertices = read_dataset(group['geometry_group']['vertices'], timeout=RESERVE_TIMEOUT)
+        return vertices, read_dataset(group['geometry_group']['faces'], timeout=RESERVE_TIMEOUT), \
+            read_dataset(group['geometry_group']['winding_order'], timeout=RESERVE_TIMEOUT)
 
     def get_cylindrical_geometry_from_group(self, group):
         """
@@ -188,8 +195,8 @@ class NeXusOFF:
         :param group:  NXcylindrical_geometry group and its parent group in a dictionary
         :return: vertices, faces and winding_order information from the group
         """
-        cylinders = group['geometry_group']['cylinders'][...]
-        group_vertices = group['geometry_group']['vertices'][...]
+        cylinders = read_dataset(group['geometry_group']['cylinders'], timeout=RESERVE_TIMEOUT)
+        group_vertices = read_dataset(group['geometry_group']['vertices'], timeout=RESERVE_TIMEOUT)
         vertices = None
         faces = None
         winding_order = None
@@ -248,18 +255,23 @@ class NeXusOFF:
             number_of_pixels = len(x_offsets)
             total_num_of_vertices = number_of_pixels * pixel_vertices.shape[0]
 
-            # Preallocate arrays
-            vertices = np.empty((total_num_of_vertices, 3))
-            winding_order = np.empty((len(pixel_winding_order) * number_of_pixels), dtype=int)
-            faces = np.empty((len(pixel_faces) * number_of_pixels), dtype=int)
-
-            for pixel_number in range(number_of_pixels):
-                new_vertices = np.hstack((pixel_vertices[:, 0] + x_offsets[pixel_number],
-                                          pixel_vertices[:, 1] + y_offsets[pixel_number],
-                                          pixel_vertices[:, 2] + z_offsets[pixel_number]))
-                vertices, faces, winding_order, next_vertex = \
-                    self.accumulate_geometry_in_prealloc_arrays(vertices, faces, winding_order, new_vertices,
-                                                                pixel_faces, pixel_winding_order, next_indices)
+            # Wait for room in the memory budget while the pixels are replicated, like nxchunks.read_dataset the
+            # arrays returned then belong to the caller
+            with reserve_memory((total_num_of_vertices * 3 +
+                                 (len(pixel_winding_order) + len(pixel_faces)) * number_of_pixels) * 8,
+                                timeout=RESERVE_TIMEOUT):
+                # Preallocate arrays
+                vertices = np.empty((total_num_of_vertices, 3))
+                winding_order = np.empty((len(pixel_winding_order) * number_of_pixels), dtype=int)
+                faces = np.empty((len(pixel_faces) * number_of_pixels), dtype=int)
+
+                for pixel_number in range(number_of_pixels):
+                    new_vertices = np.hstack((pixel_vertices[:, 0] + x_offsets[pixel_number],
+                                              pixel_vertices[:, 1] + y_offsets[pixel_number],
+                                              pixel_vertices[:, 2] + z_offsets[pixel_number]))
+                    vertices, faces, winding_order, next_vertex = \
+                        self.accumulate_geometry_in_prealloc_arrays(vertices, faces, winding_order, new_vertices,
+                                                                    pixel_faces, pixel_winding_order, next_indices)
         return vertices, faces, winding_order
 
     @staticmethod
@@ -384,7 +396,7 @@ class NeXusOFF:
 
         elif attributes['transformation_type'].astype(str) == 'rotation':
             axis = attributes['vector']
-            angle = np.deg2rad(transform[...])
+            angle = nxunits.convert(transform[...], nxunits.dataset_units(transform, default='deg'), 'rad')
             rotation_matrix = self.rotation_matrix_from_axis_and_angle(axis, angle)
             matrix = np.matrix([[rotation_matrix[0, 0], rotation_matrix[0, 1], rotation_matrix[0, 2], offset[0]],
                                 [rotation_matrix[1, 0], rotation_matrix[1, 1], rotation_matrix[1, 2], offset[1]],
@@ -458,7 +470,7 @@ class NeXusOFF:
         if centre is None:
             centre = [0, 0, 0]
         face_centre = [centre[0] - (height / 2.0), centre[1], centre[2]]
-        angles = np.linspace(0, 2 * np.pi, np.floor((number_of_vertices / 2) + 1))
+        angles = np.linspace(0, 2 * np.pi, int(number_of_vertices // 2) + 1)
         # The last point is the same as the first so get rid of it
         angles = angles[:-1]
         y = face_centre[1] + radius * np.cos(angles)
@@ -655,6 +667,10 @@ class recipe:
         self.entry = entrypath
         self.title = "Extractable Geometrical Shapes (NXoff_geometry, NXcylindrical_geometry)"
 
+    def detect(self, index):
+        """Whether the entry has geometry groups, without validating them"""
+        return index.has_class("NXoff_geometry", "NXcylindrical_geometry")
+
     def process(self):
         """
         Recipes need to implement this method and return information which
@@ -667,3 +683,13 @@ class recipe:
             raise AssertionError("No valid geometry entries found")
         else:
             return NeXusOFF(self.entry)
+
+    def summary(self, nexus_off):
+        """
+        Plain data description of what process returned, for reports, caches and
+        other processes.
+
+        :param nexus_off: the object returned by process
+        :return: JSON serialisable summary of it
+        """
+        return "Geometry in {} can be output as OFF files".format(nexus_off.nx_entry)
@@ -1,10 +1,24 @@
 from itertools import compress
 import numpy as np
+from nxchunks import read_rows
 
 
 class NXlogExamples:
-    def __init__(self, nxlog_group):
+    def __init__(self, nxlog_group, workers=None):
+        """
+        :param nxlog_group: The NXlog HDF5 group
+        :param workers: Optionally decompress large reads of the log with this many processes
+        """
         self.nxlog_group = nxlog_group
+        self.workers = workers
+        self._arrays = {}
+
+    def _read_rows(self, dataset_name, start, stop):
+        """
+        Read a slice of one of the log datasets, in parallel if workers were requested
+        """
+        # Contiguous, uncompressed datasets are memory mapped once and then sliced without copying
+        return read_rows(self.nxlog_group, dataset_name, start, stop, self.workers, self._arrays)
 
     def get_times_and_values_in_time_range(self, start_time, end_time):
         """
@@ -25,8 +39,8 @@ class NXlogExamples:
                                     np.append([True], (end_time > cue_timestamps[:-1]))][[0, -1]]
 
         # Extract a slice of the log which we know contains the time range we are interested in
-        times = self.nxlog_group['time'][range_indices[0]:range_indices[1]]
-        values = self.nxlog_group['value'][range_indices[0]:range_indices[1]]
+        times = self._read_rows('time', range_indices[0], range_indices[1])
+        values = self._read_rows('value', range_indices[0], range_indices[1])
 
         # Truncate them to the exact range
         times_mask = (start_time <= times) & (times <= end_time)
@@ -69,6 +83,19 @@ def validate(nx_log):
     """
     fails = []
 
+    _check_lengths(nx_log, fails)
+
+    if len(fails) > 0:
+        raise AssertionError('\n'.join(fails))
+
+
+def _check_lengths(nx_log, fails):
+    """
+    Check the cue datasets match each other and value and raw_value match time in length
+
+    :param nx_log: An NXlog group which was found in the file
+    :param fails: Failures are recorded in this list
+    """
     _check_datasets_have_same_length(nx_log, ['cue_timestamp_zero', 'cue_index'], fails)
     if 'time' in nx_log:
         if 'value' in nx_log:
@@ -82,8 +109,44 @@ def validate(nx_log):
                     'The first dimension of the raw_value dataset should have the '
                     'same size as the time dataset in ' + nx_log.name)
 
-    if len(fails) > 0:
-        raise AssertionError('\n'.join(fails))
+
+class NXlogMonitor(object):
+    """
+    Validates an NXlog group incrementally while it is still being written in SWMR mode.
+
+    Only dataset shapes are looked at, so each refresh costs the same however long the log is.
+    grew tells whether the last refresh found new data.
+    """
+
+    def __init__(self, nx_log):
+        self.nx_log = nx_log
+        self.n_entries = 0
+        self.grew = False
+
+    def refresh(self):
+        """
+        Refresh the datasets from the file and validate them
+
+        :return: List of failure messages, empty if the log is valid
+        """
+        fails = []
+        for dataset in self.nx_log.values():
+            if hasattr(dataset, 'refresh'):
+                dataset.refresh()
+        _check_lengths(self.nx_log, fails)
+        if 'time' in self.nx_log:
+            n_entries = self.nx_log['time'].shape[0]
+            if n_entries < self.n_entries:
+                fails.append("time shrank from {} to {} entries in {}".format(
+                    self.n_entries, n_entries, self.nx_log.name))
+            self.grew = n_entries != self.n_entries
+            self.n_entries = n_entries
+        return fails
+
+    def __str__(self):
+        return "NXlog group at " + self.nx_log.name + " with " + str(self.n_entries) + " entries so far"
+
+    __repr__ = __str__
 
 
 def _check_datasets_have_same_length(group, dataset_names, fails):
@@ -127,6 +190,10 @@ class recipe:
         self.entry = entrypath
         self.title = "NXlog - including examples of using the new cue datasets"
 
+    def detect(self, index):
+        """Whether the entry has NXlog groups, without validating them"""
+        return index.has_class("NXlog")
+
     def process(self):
         """
         Recipes need to implement this method and return information which
@@ -145,3 +212,14 @@ class recipe:
             examples.append(NXlogExamples(nx_log_entry))
 
         return examples
+
+    def monitor(self):
+        """
+        Incremental validation of the NXlog groups in a file opened in SWMR mode
+
+        :return: A monitor for each NXlog group, see NXlogMonitor.refresh
+        """
+        nx_log_list = _NXlogFinder().get_NXlog(self.file, self.entry)
+        if len(nx_log_list) == 0:
+            raise AssertionError("No NXlog entries found")
+        return [NXlogMonitor(nx_log_entry) for nx_log_entry in nx_log_list]
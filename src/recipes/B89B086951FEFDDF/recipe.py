@@ -1,4 +1,5 @@
 import numpy as np
+import nxunits
 
 
 class Point:
@@ -457,10 +458,7 @@ class recipe:
         centre_to_slit_bottom = radius - slit_height
 
         # Convert the slit edges to radians if they're in degrees
-        if units == b"deg":
-            slit_edges = [np.deg2rad(x) % recipe.TWO_PI for x in slit_edges]
-        else:
-            slit_edges = [x % recipe.TWO_PI for x in slit_edges]
+        slit_edges = nxunits.convert(slit_edges, units, "rad") % recipe.TWO_PI
 
         off_creator = OFFFileCreator(
             self.thickness * 0.5, self.resolution, self.arrow_size
@@ -590,6 +588,10 @@ class recipe:
                 )
             )
 
+    def detect(self, index):
+        """Whether the entry has NXdisk_chopper groups, without building the OFF files"""
+        return index.has_class("NXdisk_chopper")
+
     def process(self):
         """
         Recipes need to implement this method and return information which
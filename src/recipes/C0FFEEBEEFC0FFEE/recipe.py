@@ -1,3 +1,7 @@
+import h5py
+import nxindex
+
+
 class recipe:
     """
         A demo recipe for finding the information associated with this demo feature.
@@ -17,21 +21,30 @@ class recipe:
         for node in self.file[self.entry].keys():
             try:
                 absnode = "{}/{}".format(self.entry, node)
-                if str(self.file[absnode].attrs["NX_class"], 'utf8') == "NXsample":
+                if nxindex.decode(self.file[absnode].attrs["NX_class"]) == "NXsample":
                     return absnode
             except:
                 pass
         # better have custom exceptions
         raise Exception("no NXsample found")
 
+    def detect(self, index):
+        """Whether an NXsample directly in the entry has a depends_on dataset pointing into the file"""
+        for name, group in index.find_class("NXsample"):
+            depends_on = group.get("depends_on")
+            if "/" not in name and isinstance(depends_on, h5py.Dataset) and depends_on.ndim == 1:
+                target = nxindex.decode(depends_on[0])
+                return target is not None and target in group.file
+        return False
+
     def process(self):
         dependency_chain = []
         try:
             sample = self.findNXsample()
-            depends_on = str(self.file[sample + "/depends_on"][0], 'utf8')
+            depends_on = nxindex.decode(self.file[sample + "/depends_on"][0])
             while not depends_on == ".":
                 dependency_chain.append(depends_on)
-                depends_on = str(self.file[depends_on].attrs["depends_on"], 'utf8')
+                depends_on = nxindex.decode(self.file[depends_on].attrs["depends_on"])
 
         except Exception as e:
             raise Exception("this feature does not validate correctly")
@@ -1,5 +1,7 @@
 import numpy as np
 
+from nxchunks import read_dataset
+
 
 class NXDataWrapper:
     def __init__(self, NXdata):
@@ -59,7 +61,8 @@ class NXDataWrapper:
         if len(val) > len(self.data.shape):
             raise IndexError("too many dimensions given for slicing")
         result = {}
-        result['data'] = self.data[val]
+        # Large selections wait for room in the memory budget shared by the workers
+        result['data'] = read_dataset(self.data, val)
         result['primary_axes'] = []
         for i in range(len(self.primary_axes_names)):
             result['primary_axes'].append(self.get_axis_slice(self.primary_axes_names[i], val, self.primary_axes[i]))
@@ -115,6 +118,10 @@ class recipe:
 
         self.NXdatas.append(NXDataWrapper(obj))
 
+    def detect(self, index):
+        """Whether an NXdata of the entry has a signal attribute"""
+        return any("signal" in group.attrs for name, group in index.find_class("NXdata"))
+
     def process(self):
         self.NXdatas = []
         self.file[self.entry].visititems(self.visitor)
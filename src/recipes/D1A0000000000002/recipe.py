@@ -88,6 +88,10 @@ class recipe:
         self.entry = entrypath
         self.title = "NXcitation information"
 
+    def detect(self, index):
+        """Whether the entry has NXcite groups"""
+        return index.has_class("NXcite")
+
     def process(self):
         citation_manager = NXciteVisitor().get_citation_manager(self.file, self.entry)
         if citation_manager is not None:
@@ -1,6 +1,28 @@
 from datetime import datetime, tzinfo, timedelta
+import hashlib
+import heapq
+import json
+import os
+import re
+import shutil
 import numpy as np
 from itertools import compress
+from nxchunks import DEFAULT_BUFFER_BYTES, get_content_checks, get_sampling, read_rows, reduce_dataset, \
+    reserve_memory, search_sorted
+import nxindex
+import nxunits
+
+
+# Events read at once by the streaming methods (histograms, merges), when the memory budget does not limit them
+# further
+CHUNK_EVENTS = 1 << 22
+
+DEFAULT_EVENT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "nxfeature", "events")
+DEFAULT_EVENT_CACHE_BYTES = 16 * 1024 ** 3
+
+# ISO 8601 date and time, with optional fractional seconds and a Z or +hh:mm offset. Parsed by hand since
+# datetime.fromisoformat does not take a Z before python 3.11
+ISO8601 = re.compile(r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$')
 
 
 class UTC(tzinfo):
@@ -17,8 +39,95 @@ class UTC(tzinfo):
 
 
 class NXevent_dataExamples:
-    def __init__(self, nx_event_data):
+    def __init__(self, nx_event_data, workers=None, cache=None):
+        """
+        :param nx_event_data: The NXevent_data HDF5 group
+        :param workers: Optionally decompress large reads of event datasets with this many processes
+        :param cache: Optionally an EventColumnCache, to decode the events once and memory map them afterwards
+        """
         self.nx_event_data = nx_event_data
+        self.workers = workers
+        self.cache = cache
+        self._arrays = {}
+        self._event_index = None
+        self._pulse_time_offset_ns = None
+
+    def _read_rows(self, dataset_name, start, stop):
+        """
+        Read a slice of one of the event datasets, in parallel if workers were requested
+        """
+        # Contiguous, uncompressed datasets are memory mapped once and then sliced without copying
+        return read_rows(self.nx_event_data, dataset_name, start, stop, self.workers, self._arrays)
+
+    @property
+    def event_index(self):
+        """
+        The event_index dataset, read on first use and then kept
+        """
+        if self._event_index is None:
+            self._event_index = self.nx_event_data['event_index'][...]
+        return self._event_index
+
+    @property
+    def pulse_time_offset_ns(self):
+        """
+        The offset attribute of event_time_zero in whole nanoseconds since the epoch, parsed on first use and
+        then kept
+        """
+        if self._pulse_time_offset_ns is None:
+            offset = self.nx_event_data['event_time_zero'].attrs['offset']
+            self._pulse_time_offset_ns = self._isotime_to_unixtime_in_nanoseconds(offset)
+        return self._pulse_time_offset_ns
+
+    @property
+    def pulse_time_offset(self):
+        """
+        The offset attribute of event_time_zero in seconds since the epoch, see pulse_time_offset_ns
+        """
+        return self.pulse_time_offset_ns / 10 ** 9
+
+    def _take_rows(self, dataset_name, rows):
+        """
+        Values of one of the event datasets at the given rows, in any order. The rows are read in windows of at
+        most a buffer, or less if the memory budget is short, each starting at the next row wanted, so rows far
+        apart do not read everything between them.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.empty(rows.shape, dtype=self.nx_event_data[dataset_name].dtype)
+        if rows.size == 0:
+            return values
+        itemsize = values.dtype.itemsize
+        window = max(DEFAULT_BUFFER_BYTES // itemsize, 1)
+        start, stop = rows.min(), rows.max() + 1
+        if stop - start <= window:
+            with reserve_memory((stop - start) * itemsize, minimum=itemsize) as reservation:
+                if reservation.nbytes >= (stop - start) * itemsize:
+                    # The whole span fits, no need to put the rows in order
+                    values[...] = np.asarray(self._read_rows(dataset_name, start, stop))[rows - start]
+                    return values
+        order = np.argsort(rows)
+        sorted_rows = rows[order]
+        first = 0
+        while first < len(sorted_rows):
+            start = sorted_rows[first]
+            with reserve_memory(min(sorted_rows[-1] + 1 - start, window) * itemsize,
+                                minimum=itemsize) as reservation:
+                stop = start + max(reservation.nbytes // itemsize, 1)
+                last = np.searchsorted(sorted_rows, stop, side='left')
+                block = self._read_rows(dataset_name, start, sorted_rows[last - 1] + 1)
+                values[order[first:last]] = np.asarray(block)[sorted_rows[first:last] - start]
+            first = last
+        return values
+
+    def get_pulse_indices_of_events(self, events):
+        """
+        Find the pulse index that each of the given events occurred in, by binary search of event_index
+
+        :param events: Array of event numbers (the Nth detection event in the group)
+        :return: Array of pulse indices, -1 for events before the first pulse
+        """
+        # The pulse (frame) of an event is the last one whose event_index is not greater than the event number
+        return np.searchsorted(self.event_index, np.asarray(events), side='right') - 1
 
     def get_pulse_index_of_event(self, nth_event):
         """
@@ -27,12 +136,38 @@ class NXevent_dataExamples:
         :param nth_event: The Nth detection event in the group
         :return: pulse index of the nth_event
         """
-        # Find index of the last element which has event_index lower than the nth_event
-        # this is the index of the pulse (frame) which the nth_event falls in
-        event_index = self.nx_event_data['event_index'][...]
-        for i, event_index_for_pulse in enumerate(event_index):
-            if event_index_for_pulse > nth_event:
-                return i - 1
+        return int(self.get_pulse_indices_of_events([nth_event])[0])
+
+    def get_times_neutron_detected(self, events, time_units='s', dtype=np.float64):
+        """
+        Use offset and time units attributes to find the absolute times
+        that the neutrons with the given event numbers hit the detector
+
+        :param events: Array of event numbers (the Nth detection event in the group)
+        :param time_units: Units of the times returned, for instance 'ns' with dtype np.int64 for times
+                           which keep every nanosecond, which float64 seconds since the epoch cannot
+        :param dtype: dtype of the times returned
+        :return: Array of absolute times of neutron event detection since the epoch
+        """
+        events = np.asarray(events, dtype=np.int64)
+        n_events = self.nx_event_data['event_time_offset'].len()
+        if np.any((events < 0) | (events >= n_events)):
+            raise IndexError("Event numbers must be from 0 to {} in {}".format(n_events - 1, self.nx_event_data.name))
+        pulse_indices = self.get_pulse_indices_of_events(events)
+        if np.any(pulse_indices < 0):
+            raise ValueError("Events before the first pulse in " + self.nx_event_data.name)
+
+        # Get absolute pulse times since epoch
+        times = nxunits.convert(self._take_rows('event_time_zero', pulse_indices),
+                                self.nx_event_data['event_time_zero'].attrs['units'], time_units, dtype, copy=False)
+        # The offset is added in whole nanoseconds, as pulse_time_offset in float64 seconds is only good to
+        # a fraction of a microsecond
+        times += nxunits.convert(self.pulse_time_offset_ns, 'ns', time_units, dtype)
+
+        # Add event times relative to pulse times
+        times += nxunits.convert(self._take_rows('event_time_offset', events),
+                                 self.nx_event_data['event_time_offset'].attrs['units'], time_units, dtype, copy=False)
+        return times
 
     def get_time_neutron_detected(self, nth_event):
         """
@@ -42,27 +177,306 @@ class NXevent_dataExamples:
         :param nth_event: The Nth detection event in the group
         :return: Absolute time of neutron event detection in ISO8601 format
         """
-        if "event_time_offset" in self.nx_event_data.keys() and self.nx_event_data['event_time_offset'][...].size > (
-                    nth_event + 1):
-            # Get absolute pulse time in seconds since epoch
-            pulse_index = self.get_pulse_index_of_event(nth_event)
-            pulse_start_time_seconds = self._convert_to_seconds(self.nx_event_data['event_time_zero'][pulse_index],
-                                                                self.nx_event_data['event_time_zero'].attrs['units'])
-            pulse_start_offset = self._isotime_to_unixtime_in_seconds(
-                self.nx_event_data['event_time_zero'].attrs['offset'])
-            pulse_absolute_seconds = pulse_start_time_seconds + pulse_start_offset
-
-            # Get event time in seconds relative to pulse time
-            event_offset = self.nx_event_data['event_time_offset'][nth_event]
-            event_offset_seconds = self._convert_to_seconds(event_offset,
-                                                            self.nx_event_data['event_time_offset'].attrs['units'])
-
-            # Calculate absolute event time in seconds since epoch
-            absolute_event_time_seconds = pulse_absolute_seconds + event_offset_seconds
-            # and convert to a readable string in ISO8601 format
+        if "event_time_offset" in self.nx_event_data.keys() and \
+                self.nx_event_data['event_time_offset'].len() > nth_event:
+            absolute_event_time_seconds = self.get_times_neutron_detected([nth_event])[0]
+            # convert to a readable string in ISO8601 format
             absolute_event_time_iso = datetime.fromtimestamp(absolute_event_time_seconds, tz=UTC()).isoformat()
             return absolute_event_time_iso
 
+    def _pulses(self, cached=True, range_start=None, range_end=None):
+        """
+        Pulse times in seconds and the index of the first event of each pulse, with the number of events appended
+        so that the events of pulse i are pulse_starts[i] to pulse_starts[i + 1], and the columns of the cache
+        to read the events from, None to read them from the file. The columns are kept by each query rather
+        than by the object, so that queries running at the same time do not change each other's.
+
+        Given a time range, and cues which agree with the pulses, only the pulses which can have events in the
+        range are read, see _cued_pulses, and the pulses are numbered from the first of them.
+        """
+        if self.cache is not None and cached:
+            # Checked on every query, so that a changed file is decoded again
+            columns = self.cache.columns(self)
+            if columns is not None:
+                return columns['pulse_time'], columns['pulse_start'], columns
+        if range_start is not None or range_end is not None:
+            pulses = self._cued_pulses(-np.inf if range_start is None else range_start,
+                                       np.inf if range_end is None else range_end)
+            if pulses is not None:
+                return pulses + (None,)
+        # event_time_zero is a small subset of timestamps from the full event_time_offsets dataset
+        # Since it is small we can load the whole dataset from file with [...]
+        pulse_times = nxunits.convert(self.nx_event_data['event_time_zero'][...],
+                                      self.nx_event_data['event_time_zero'].attrs.get('units'), 's')
+        # event_index maps between indices in event_time_zero and event_time_offsets,
+        # the events of the last pulse run to the end of the event datasets
+        pulse_starts = np.append(self.event_index, self.nx_event_data['event_time_offset'].len()).astype(np.int64)
+        return pulse_times, pulse_starts, None
+
+    def _cued_pulses(self, range_start, range_end):
+        """
+        Pulse times and starts, as _pulses gives them, of the pulses from the one holding the event of the last
+        cue at or before range_start to the one before the pulse of the first cue after range_end, found from
+        cue_timestamp_zero and cue_index and by binary search of event_index, so that the pulse datasets are
+        only read around the time range
+
+        :return: pulse_times, pulse_starts, None if the group has no cues or they do not agree with the pulses,
+                 for instance when a cue is not in the pulse holding its event
+        """
+        group = self.nx_event_data
+        if 'cue_timestamp_zero' not in group or 'cue_index' not in group:
+            return None
+        event_time_zero = group['event_time_zero']
+        cue_timestamp_zero = group['cue_timestamp_zero']
+        if nxindex.decode(cue_timestamp_zero.attrs.get('offset')) != \
+                nxindex.decode(event_time_zero.attrs.get('offset')):
+            return None
+        units = event_time_zero.attrs.get('units')
+        cue_times = nxunits.convert(cue_timestamp_zero[...], cue_timestamp_zero.attrs.get('units', units), 's')
+        cue_index = group['cue_index'][...]
+        n_pulses = event_time_zero.len()
+        n_events = group['event_time_offset'].len()
+        if len(cue_times) == 0 or len(cue_times) != len(cue_index) or np.any(cue_times[1:] < cue_times[:-1]) \
+                or np.any(cue_index[1:] < cue_index[:-1]) or cue_index[-1] >= n_events:
+            return None
+
+        first_cue = np.searchsorted(cue_times, range_start, side='right') - 1
+        end_cue = np.searchsorted(cue_times, range_end, side='right')
+        event_index = group['event_index']
+        first = 0 if first_cue < 0 else search_sorted(event_index, cue_index[first_cue], side='right') - 1
+        end = n_pulses if end_cue == len(cue_index) else \
+            search_sorted(event_index, cue_index[end_cue], side='right') - 1
+        if first < 0 or end < first:
+            return None
+        # Up to the pulse after the pulse of the end cue, to check that cue too
+        stop = min(end + 2, n_pulses)
+        pulse_times = nxunits.convert(event_time_zero[first:stop], units, 's')
+        pulse_starts = np.append(event_index[first:stop], n_events).astype(np.int64)
+        for cue, pulse in ((first_cue, first), (end_cue, end)):
+            if cue < 0 or cue >= len(cue_index):
+                continue
+            # A cue is at or after the start of the pulse holding its event, and before the next pulse starts
+            pulse -= first
+            if not pulse_times[pulse] <= cue_times[cue] or \
+                    (pulse + 1 < len(pulse_times) and not cue_times[cue] < pulse_times[pulse + 1]):
+                return None
+        return pulse_times[:end - first], pulse_starts[:end - first + 1]
+
+    @staticmethod
+    def _pulses_in_time_range(pulse_times, range_start, range_end):
+        """
+        From the last pulse starting before the time range to the last pulse starting in it, as first and
+        end (exclusive) pulse index
+        """
+        first = max(np.searchsorted(pulse_times, range_start, side='right') - 1, 0)
+        return first, max(np.searchsorted(pulse_times, range_end, side='right'), first)
+
+    @staticmethod
+    def _iter_pulse_chunks(pulse_starts, first, last, event_bytes, read, max_events=None):
+        """
+        Split pulses first to last (exclusive) into chunks of whole pulses, as many as the memory budget and
+        max_events allow and at least one, and read each of them
+
+        :param pulse_starts: Index of the first event of each pulse, and the number of events
+        :param event_bytes: Memory needed for each event read
+        :param read: Function of the first and end pulse of a chunk which reads it
+        :param max_events: Most events in a chunk, unless a single pulse has more
+        :return: Generator of (first pulse, end pulse, what read returned) of each chunk. The memory for a chunk
+                 is only reserved while it is read, like read_dataset, so that the chunks of several groups can
+                 be read in turn (merge_event_banks) without one waiting for memory another holds
+        """
+        if first >= last:
+            return
+        # Size of the largest pulse from each one on, the least memory needed to carry on from there
+        largest_pulse_from = np.maximum.accumulate(np.diff(pulse_starts[first:last + 1])[::-1])[::-1]
+        pulse = first
+        while pulse < last:
+            # Number of events up to the end of each of the remaining pulses
+            events_to = pulse_starts[pulse + 1:last + 1] - pulse_starts[pulse]
+            wanted = events_to[-1] if max_events is None else min(events_to[-1], max(max_events, events_to[0]))
+            with reserve_memory(wanted * event_bytes,
+                                minimum=largest_pulse_from[pulse - first] * event_bytes) as reservation:
+                # Whole pulses whose events fit in the memory granted
+                end = pulse + max(np.searchsorted(events_to, min(wanted, reservation.nbytes // event_bytes),
+                                                  side='right'), 1)
+                chunk = read(pulse, end)
+            yield pulse, end, chunk
+            pulse = end
+
+    @property
+    def _event_bytes(self):
+        """
+        Memory needed for each event read by _read_pulses: the raw offsets and ids, their conversion, the sorted
+        times and ids, and the padded rows sorted by _order_within_pulses
+        """
+        return (self.nx_event_data['event_time_offset'].dtype.itemsize +
+                self.nx_event_data['event_id'].dtype.itemsize + 10 * 8)
+
+    def _read_pulses(self, pulse_times, pulse_starts, columns, pulse, end, across_pulses=True):
+        """
+        The absolute times in seconds and detector ids of the events of pulses pulse to end (exclusive), sorted
+        by time, or only within each pulse when not across_pulses. The events are read from the columns of the
+        cache given by _pulses, or from the file if they are None
+        """
+        start_index, end_index = pulse_starts[pulse], pulse_starts[end]
+        if columns is not None:
+            # Already decoded and sorted within each pulse by the cache
+            times = np.array(columns['time'][start_index:end_index])
+            detector_ids = np.array(columns['event_id'][start_index:end_index])
+            if columns['sorted']:
+                # and across pulses too, as the cache found when decoding them
+                return times, detector_ids
+        else:
+            offsets = nxunits.convert(self._read_rows('event_time_offset', start_index, end_index),
+                                      self.nx_event_data['event_time_offset'].attrs.get('units'), 's')
+            detector_ids = np.asarray(self._read_rows('event_id', start_index, end_index))
+
+            # Sort the events within each pulse (they are not sorted in the file), then add the pulse times to
+            # give an "absolute" time for each event
+            lengths = np.diff(pulse_starts[pulse:end + 1])
+            order = _order_within_pulses(offsets, lengths)
+            times = offsets[order]
+            times += np.repeat(pulse_times[pulse:end], lengths)
+            detector_ids = detector_ids[order]
+        if across_pulses and np.any(times[1:] < times[:-1]):
+            # Events of a pulse were detected after the next pulse started
+            order = np.argsort(times, kind='stable')
+            times = times[order]
+            detector_ids = detector_ids[order]
+        return times, detector_ids
+
+    def iter_events_by_time_range(self, range_start, range_end, max_events=None):
+        """
+        Generate arrays of neutron detection timestamps and the corresponding IDs for the detectors on which they
+        were detected, for a given time range, a chunk of whole pulses at a time. Time ranges with more events
+        than fit in memory can be streamed this way.
+        Each chunk is sorted by time, and follows the previous one in time as long as the events of each pulse
+        are detected before those of the next pulse.
+        The pulses of the range are found from the cue datasets when the group has cues which agree with its
+        pulses, so that event_time_zero and event_index are only read around the range, and from event_index
+        otherwise.
+
+        :param range_start: Start time range in seconds measured from the same reference as the pulse times
+        :param range_end: End time range in seconds measured from the same reference as the pulse times
+        :param max_events: Most events to read at once (a larger pulse is still read whole), in addition to the
+                           limit of the memory budget
+        :return: Generator of (detection event times, detector ids)
+        """
+        pulse_times, pulse_starts, columns = self._pulses(range_start=range_start, range_end=range_end)
+        first, last = self._pulses_in_time_range(pulse_times, range_start, range_end)
+
+        def read(pulse, end):
+            # Now we can extract a slice of the events which we know contains the time range we are interested in
+            return self._read_pulses(pulse_times, pulse_starts, columns, pulse, end)
+
+        for pulse, end, (times, detector_ids) in self._iter_pulse_chunks(pulse_starts, first, last,
+                                                                         self._event_bytes, read, max_events):
+            # Truncate them to the exact time range asked for, only the first and last pulses can stick out
+            lo = np.searchsorted(times, range_start, side='left')
+            hi = np.searchsorted(times, range_end, side='right')
+            yield times[lo:hi], detector_ids[lo:hi]
+
+    def _iter_histogram_chunks(self, time_units, range_start=None, range_end=None, max_events=CHUNK_EVENTS):
+        """
+        Generate the event_time_offset (in time_units, as stored for None) and event_id of all events, or of the
+        events in a time range, in chunks of whole pulses and in file order. The pulses of a time range are
+        found through the cues when the group has them, see _pulses
+        """
+        event_time_units = self.nx_event_data['event_time_offset'].attrs.get('units')
+        event_bytes = (self.nx_event_data['event_time_offset'].dtype.itemsize +
+                       self.nx_event_data['event_id'].dtype.itemsize + 4 * 8)
+        if range_start is None and range_end is None:
+            n_events = self.nx_event_data['event_id'].len()
+            if 'event_index' in self.nx_event_data:
+                pulse_times, pulse_starts, columns = self._pulses(cached=False)
+            else:
+                # Without pulses any rows will do
+                pulse_starts = np.append(np.arange(0, n_events, max_events or CHUNK_EVENTS), n_events)
+            first, last = 0, len(pulse_starts) - 1
+        else:
+            pulse_times, pulse_starts, columns = self._pulses(cached=False, range_start=range_start,
+                                                              range_end=range_end)
+            first, last = self._pulses_in_time_range(pulse_times,
+                                                     -np.inf if range_start is None else range_start,
+                                                     np.inf if range_end is None else range_end)
+
+        def read(pulse, end):
+            start_index, end_index = pulse_starts[pulse], pulse_starts[end]
+            offsets = np.asarray(self._read_rows('event_time_offset', start_index, end_index))
+            detector_ids = np.asarray(self._read_rows('event_id', start_index, end_index))
+            if range_start is not None or range_end is not None:
+                times = nxunits.convert(offsets, event_time_units, 's')
+                times += np.repeat(pulse_times[pulse:end], np.diff(pulse_starts[pulse:end + 1]))
+                in_range = np.ones(len(times), dtype=bool)
+                if range_start is not None:
+                    in_range &= times >= range_start
+                if range_end is not None:
+                    in_range &= times <= range_end
+                offsets = offsets[in_range]
+                detector_ids = detector_ids[in_range]
+            if time_units is not None:
+                offsets = nxunits.convert(offsets, event_time_units, time_units)
+            return offsets, detector_ids
+
+        for pulse, end, chunk in self._iter_pulse_chunks(pulse_starts, first, last, event_bytes, read, max_events):
+            yield chunk
+
+    def histogram_event_ids(self, n_ids=0, range_start=None, range_end=None, max_events=CHUNK_EVENTS):
+        """
+        Count the events detected by each detector, reading the events a chunk of pulses at a time so that
+        memory use is bounded by the size of the histogram and of a chunk, however many events there are
+
+        :param n_ids: Least length of the histogram, it grows to the largest detector id seen
+        :param range_start: Only count events from this time in seconds, measured from the same reference as
+                            the pulse times
+        :param range_end: Only count events up to this time
+        :param max_events: Most events to read at once, see iter_events_by_time_range
+        :return: Array of the number of events with each detector id
+        """
+        counts = np.zeros(n_ids, dtype=np.int64)
+        for offsets, detector_ids in self._iter_histogram_chunks(None, range_start, range_end, max_events):
+            chunk_counts = np.bincount(detector_ids, minlength=len(counts))
+            if len(chunk_counts) > len(counts):
+                counts = np.append(counts, np.zeros(len(chunk_counts) - len(counts), dtype=np.int64))
+            counts += chunk_counts
+        return counts
+
+    def histogram_time_of_flight(self, bins, time_units='us', n_ids=0, range_start=None, range_end=None,
+                                 max_events=CHUNK_EVENTS):
+        """
+        Count the events by detector and time of flight (event_time_offset), reading the events a chunk of
+        pulses at a time so that memory use is bounded by the size of the histogram and of a chunk
+
+        :param bins: Edges of the time of flight bins, increasing, in time_units. Like numpy.histogram the last
+                     bin includes its upper edge, and events outside the bins are not counted
+        :param time_units: Units of the bins
+        :param n_ids: Least number of detectors (rows), it grows to the largest detector id seen
+        :param range_start: Only count events from this time in seconds, measured from the same reference as
+                            the pulse times
+        :param range_end: Only count events up to this time
+        :param max_events: Most events to read at once, see iter_events_by_time_range
+        :return: Array of counts with a row for each detector id and a column for each bin
+        """
+        bins = np.asarray(bins, dtype=np.float64)
+        n_bins = len(bins) - 1
+        counts = np.zeros((n_ids, n_bins), dtype=np.int64)
+        for offsets, detector_ids in self._iter_histogram_chunks(time_units, range_start, range_end, max_events):
+            tof_bin = np.searchsorted(bins, offsets, side='right') - 1
+            tof_bin[offsets == bins[-1]] = n_bins - 1
+            in_bins = (tof_bin >= 0) & (tof_bin < n_bins)
+            flat_bins = detector_ids[in_bins].astype(np.int64) * n_bins + tof_bin[in_bins]
+            if len(flat_bins) == 0:
+                continue
+            # Count only over the span of (detector, bin) cells the chunk hits, not the whole histogram
+            low, high = flat_bins.min(), flat_bins.max()
+            if low < 0:
+                raise ValueError("event_id has negative values, which cannot be histogrammed")
+            if high // n_bins >= len(counts):
+                counts = np.append(counts, np.zeros((high // n_bins + 1 - len(counts), n_bins), dtype=np.int64),
+                                   axis=0)
+            counts.reshape(-1)[low:high + 1] += np.bincount(flat_bins - low, minlength=high - low + 1)
+        return counts
+
     def get_events_by_time_range(self, range_start, range_end):
         """
         Return arrays of neutron detection timestamps and the corresponding IDs for the detectors on which they
@@ -74,90 +488,537 @@ class NXevent_dataExamples:
         :param range_end: End time range in seconds measured from the same reference as the pulse times
         :return: Detection event times and detector ids
         """
-        # event_time_zero is a small subset of timestamps from the full event_time_offsets dataset
-        # Since it is small we can load the whole dataset from file with [...]
-        cue_timestamps = self.nx_event_data['event_time_zero'][...]
-        # event_index maps between indices in event_time_zero and event_time_offsets
-        cue_indices = self.nx_event_data['event_index'][...]
-
-        # Look up the positions in the full timestamp list where the cue timestamps are in our range of interest
-        range_indices_all = cue_indices[np.append((range_start < cue_timestamps[1:]), [True]) &
-                                        np.append([True], (range_end > cue_timestamps[:-1]))]
-        range_indices = range_indices_all[[0, -1]]
-        range_timestamps_all = cue_timestamps[np.append((range_start < cue_timestamps[1:]), [True]) &
-                                              np.append([True], (range_end > cue_timestamps[:-1]))]
-
-        # Now we can extract a slice of the log which we know contains the time range we are interested in
-        times = self.nx_event_data['event_time_offset'][range_indices[0]:range_indices[1]]
-        detector_ids = self.nx_event_data['event_id'][range_indices[0]:range_indices[1]]
-
-        # Convert everything to seconds
+        times_list = []
+        ids_list = []
+        for times, detector_ids in self.iter_events_by_time_range(range_start, range_end):
+            times_list.append(times)
+            ids_list.append(detector_ids)
+        if len(times_list) == 0:
+            return np.empty(0), np.empty(0, dtype=self.nx_event_data['event_id'].dtype)
+        absolute_times = np.concatenate(times_list)
+        detector_ids = np.concatenate(ids_list)
+        if len(times_list) > 1 and np.any(absolute_times[1:] < absolute_times[:-1]):
+            # Events of a pulse were detected after those of the next chunk of pulses
+            sort_order = np.argsort(absolute_times, kind='stable')
+            absolute_times = absolute_times[sort_order]
+            detector_ids = detector_ids[sort_order]
+
+        return absolute_times, detector_ids
+
+    def intervals_from_logs(self, conditions):
+        """
+        The time intervals in which the values of one or more NXlog groups all meet their condition, for instance
+        while a sample temperature and the proton charge were within bounds
+
+        :param conditions: List of (NXlog group, condition), see log_intervals
+        :return: Starts and ends of half open intervals in seconds, measured from the same reference as the
+                 pulse times
+        :raises ValueError: If the pulse times have an offset attribute and a log time has no start attribute,
+                            or the other way round, as the log and the pulse times cannot then be compared
+        """
+        reference = self.pulse_time_offset if 'offset' in self.nx_event_data['event_time_zero'].attrs else None
+        if reference is None:
+            for nx_log, condition in conditions:
+                if 'start' in nx_log['time'].attrs:
+                    raise ValueError("{} has no offset attribute, so the times of {} cannot be measured from "
+                                     "it".format(self.nx_event_data['event_time_zero'].name, nx_log['time'].name))
+        return intersect_intervals(*[log_intervals(nx_log, condition, reference) for nx_log, condition in conditions])
+
+    def _pulses_in_intervals(self, pulse_times, starts, ends):
+        """
+        Which pulses lie wholly inside one of the intervals, and which overlap any of them, assuming the events
+        of a pulse are detected before the next pulse starts
+        """
+        pulse_ends = np.append(pulse_times[1:], np.inf)
+        # The interval starting last at or before the start of each pulse, and the next one
+        interval = np.searchsorted(starts, pulse_times, side='right') - 1
+        interval_end = np.where(interval >= 0, ends[np.maximum(interval, 0)], -np.inf)
+        next_start = np.append(starts, np.inf)[interval + 1]
+        whole = pulse_ends <= interval_end
+        overlap = whole | (pulse_times < interval_end) | (next_start < pulse_ends)
+        return whole, overlap
+
+    @staticmethod
+    def _runs(selected):
+        """
+        First and end (exclusive) index of each run of consecutive True values
+        """
+        changes = np.flatnonzero(np.diff(np.concatenate(([0], selected.astype(np.int8), [0]))))
+        return changes[::2], changes[1::2]
+
+    def iter_events_in_intervals(self, starts, ends, max_events=CHUNK_EVENTS):
+        """
+        Generate the events detected inside time intervals, for instance those of intervals_from_logs, with the
+        interval each falls in. Only the pulses overlapping an interval are read, a chunk of pulses at a time,
+        and only the pulses from the start of the first interval to the end of the last are looked at, found
+        through the cues as for iter_events_by_time_range.
+
+        :param starts: Starts of sorted, non overlapping, half open intervals in seconds, measured from the same
+                       reference as the pulse times
+        :param ends: Ends of the intervals
+        :param max_events: Most events to read at once, see iter_events_by_time_range
+        :return: Generator of (detection event times, detector ids, interval index), each chunk sorted by time
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if len(starts) == 0:
+            return
+        pulse_times, pulse_starts, columns = self._pulses(range_start=starts[0], range_end=ends[-1])
+        whole, overlap = self._pulses_in_intervals(pulse_times, starts, ends)
+
+        def read(pulse, end):
+            times, detector_ids = self._read_pulses(pulse_times, pulse_starts, columns, pulse, end)
+            interval = np.searchsorted(starts, times, side='right') - 1
+            inside = (interval >= 0) & (times < ends[np.maximum(interval, 0)])
+            return times[inside], detector_ids[inside], interval[inside]
+
+        for first, last in zip(*self._runs(overlap)):
+            for pulse, end, chunk in self._iter_pulse_chunks(pulse_starts, first, last, self._event_bytes, read,
+                                                             max_events):
+                yield chunk
+
+    def count_events_in_intervals(self, starts, ends, max_events=CHUNK_EVENTS):
+        """
+        Count the events detected inside time intervals. Pulses wholly inside an interval are counted from
+        event_index alone, only the event times of pulses at the edges of the intervals are read. The pulses
+        from the start of the first interval to the end of the last are found through the cues, as for
+        iter_events_by_time_range.
+
+        :param starts: Starts of sorted, non overlapping, half open intervals in seconds, measured from the same
+                       reference as the pulse times
+        :param ends: Ends of the intervals
+        :param max_events: Most events to read at once, see iter_events_by_time_range
+        :return: Number of events inside the intervals
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if len(starts) == 0:
+            return 0
+        pulse_times, pulse_starts, columns = self._pulses(range_start=starts[0], range_end=ends[-1])
+        whole, overlap = self._pulses_in_intervals(pulse_times, starts, ends)
+        count = int(np.sum(np.diff(pulse_starts)[whole]))
         event_time_units = self.nx_event_data['event_time_offset'].attrs.get('units')
-        pulse_time_units = self.nx_event_data['event_time_zero'].attrs.get('units')
-        times = self._convert_to_seconds(times.astype(np.float64), event_time_units)
-        range_timestamps_all = self._convert_to_seconds(range_timestamps_all.astype(np.float64), pulse_time_units)
+        event_bytes = self.nx_event_data['event_time_offset'].dtype.itemsize + 3 * 8
 
-        # Add the pulse times to the event times to give an "absolute" time for each event
-        new_range_indices = np.array(range_indices_all) - range_indices_all[0]
-        times_list = []
-        for i in range(len(new_range_indices) - 1):
-            times_list.append(times[new_range_indices[i]:new_range_indices[i + 1]] + range_timestamps_all[i])
+        def read(pulse, end):
+            times = nxunits.convert(self._read_rows('event_time_offset', pulse_starts[pulse], pulse_starts[end]),
+                                    event_time_units, 's')
+            times += np.repeat(pulse_times[pulse:end], np.diff(pulse_starts[pulse:end + 1]))
+            interval = np.searchsorted(starts, times, side='right') - 1
+            return int(np.count_nonzero((interval >= 0) & (times < ends[np.maximum(interval, 0)])))
 
-        # Sort the absolute times (times in each pulse are not sorted) and rearrange the detector id list accordingly
-        absolute_times = np.concatenate(times_list)
-        sort_order = np.argsort(absolute_times)
-        absolute_times = absolute_times[sort_order]
-        detector_ids = detector_ids[sort_order]
+        for first, last in zip(*self._runs(overlap & ~whole)):
+            for pulse, end, chunk_count in self._iter_pulse_chunks(pulse_starts, first, last, event_bytes, read,
+                                                                   max_events):
+                count += chunk_count
+        return count
 
-        # Truncate them to the exact time range asked for
-        absolute_times_mask = (range_start <= absolute_times) & (absolute_times <= range_end)
-        absolute_times = absolute_times[absolute_times_mask]
-        detector_ids = detector_ids[absolute_times_mask]
+    def pulse_summary(self, expected_period=None, rate_bin=1.0, gap_factor=1.5):
+        """
+        Statistics of the pulses (frames) of the group, computed from event_time_zero and event_index alone, so
+        that the health of a run can be checked without reading any of the per event datasets
 
-        return absolute_times, detector_ids
+        :param expected_period: Nominal time between pulses in seconds, by default the median time between them
+        :param rate_bin: Width in seconds of the bins of the count rate over time
+        :param gap_factor: Times between pulses longer than this many periods are counted as missing pulses
+        :return: PulseSummary, print it for a compact report
+        """
+        pulse_times, pulse_starts, columns = self._pulses(cached=False)
+        return PulseSummary(self.nx_event_data.name, pulse_times, pulse_starts, expected_period, rate_bin,
+                            gap_factor)
 
     @staticmethod
     def _isotime_to_unixtime_in_seconds(isotime):
-        utc_dt = datetime.strptime(isotime, '%Y-%m-%dT%H:%M:%S')
-        # convert UTC datetime to seconds since the Epoch
-        return (utc_dt - datetime(1970, 1, 1)).total_seconds()
+        """
+        Seconds since the Epoch of an ISO 8601 date and time, taken as UTC if it has no offset
+        """
+        return NXevent_dataExamples._isotime_to_unixtime_in_nanoseconds(isotime) / 10 ** 9
 
     @staticmethod
-    def _convert_to_seconds(timestamps, time_unit):
+    def _isotime_to_unixtime_in_nanoseconds(isotime):
+        """
+        Whole nanoseconds since the Epoch of an ISO 8601 date and time, taken as UTC if it has no offset
         """
-        Convert a single time value or numpy array of times to seconds
+        if isinstance(isotime, bytes):
+            isotime = isotime.decode('utf8')
+        match = ISO8601.match(isotime.strip())
+        if match is None:
+            raise ValueError("'{}' is not an ISO 8601 date and time".format(isotime))
+        date, time, fraction, offset = match.groups()
+        utc_dt = datetime.strptime(date + 'T' + time, '%Y-%m-%dT%H:%M:%S')
+        # convert UTC datetime to seconds since the Epoch
+        seconds = (utc_dt - datetime(1970, 1, 1)) // timedelta(seconds=1)
+        if offset is not None and offset != 'Z':
+            sign = -1 if offset[0] == '-' else 1
+            seconds -= sign * (int(offset[1:3]) * 3600 + int(offset[-2:]) * 60)
+        # digits beyond nanoseconds are dropped
+        return seconds * 10 ** 9 + int(((fraction or '.')[1:] + '0' * 9)[:9])
+
+    def __str__(self):
+        return "Valid NXevent_data group at " + self.nx_event_data.name + \
+               " containing " + str(self.nx_event_data['event_id'].len()) + " events"
 
-        :param timestamps: Time or array to times to convert
-        :param time_unit: Units of the time to convert from
-        :return: Time or times in seconds
+    __repr__ = __str__
+
+
+class PulseSummary(object):
+    """
+    Per pulse event counts, missing pulses, pulse period jitter and count rate over time of an NXevent_data
+    group, see NXevent_dataExamples.pulse_summary. Times are in seconds, measured from the same reference as the
+    pulse times.
+
+    A time between pulses of more than gap_factor periods is a gap, with the number of whole periods it spans
+    less one missing pulses. Jitter is the deviation from the period of the other times between pulses, times
+    which do not increase are counted in n_backwards instead.
+    """
+
+    def __init__(self, name, pulse_times, pulse_starts, expected_period=None, rate_bin=1.0, gap_factor=1.5):
         """
+        :param name: Name of the group, for the report
+        :param pulse_times: Time of each pulse
+        :param pulse_starts: Index of the first event of each pulse, followed by the number of events
+        :param expected_period: Nominal time between pulses, by default the median time between them
+        :param rate_bin: Width of the bins of the count rate over time
+        :param gap_factor: Times between pulses longer than this many periods are gaps
+        """
+        self.name = name
+        self.pulse_times = np.asarray(pulse_times, dtype=np.float64)
+        self.events_per_pulse = np.diff(np.asarray(pulse_starts, dtype=np.int64))
+        self.n_pulses = len(self.pulse_times)
+        self.n_events = int(pulse_starts[-1])
+        self.rate_bin = rate_bin
 
-        def _convert_single_timestamp_to_seconds(timestamp):
-            if time_unit in ['seconds', 'second', 's']:
-                return timestamp
-            elif time_unit in ['milliseconds', 'millisecond', 'ms']:
-                return timestamp * 1e-3
-            elif time_unit in ['microseconds', 'microsecond', 'us']:
-                return timestamp * 1e-6
-            elif time_unit in ['nanoseconds', 'nanosecond', 'ns']:
-                return timestamp * 1e-9
-            else:
-                raise ValueError('Unrecognised time unit in event_time_offset')
+        self.periods = np.diff(self.pulse_times)
+        increasing = self.periods > 0
+        self.n_backwards = int(len(self.periods) - np.count_nonzero(increasing))
+        if expected_period is None:
+            expected_period = float(np.median(self.periods[increasing])) if np.any(increasing) else np.nan
+        self.period = expected_period
+        self.pulse_rate = 1.0 / expected_period if expected_period > 0 else np.nan
+
+        # Gaps, as the index of the pulse before each of them, and the number of pulses missing in each
+        gap = self.periods > gap_factor * expected_period
+        self.gaps = np.flatnonzero(gap)
+        self.missing_per_gap = np.maximum(np.rint(self.periods[gap] / expected_period).astype(np.int64) - 1, 1)
+        self.n_missing = int(np.sum(self.missing_per_gap))
+
+        jitter = self.periods[increasing & ~gap] - expected_period
+        self.jitter_rms = float(np.sqrt(np.mean(jitter ** 2))) if len(jitter) > 0 else np.nan
+        self.jitter_max = float(np.max(np.abs(jitter))) if len(jitter) > 0 else np.nan
 
-        if isinstance(timestamps, np.ndarray):
-            vectorised_convert_single_timestamp_to_seconds = np.vectorize(_convert_single_timestamp_to_seconds,
-                                                                          otypes=[np.float64])
-            return vectorised_convert_single_timestamp_to_seconds(timestamps)
+        # Events of the pulses starting in each bin, divided by the width of the bins
+        if self.n_pulses > 0:
+            start = np.min(self.pulse_times)
+            rate_bins = np.floor((self.pulse_times - start) / rate_bin).astype(np.int64)
+            self.count_rate = np.bincount(rate_bins, weights=self.events_per_pulse) / rate_bin
+            self.rate_times = start + rate_bin * np.arange(len(self.count_rate))
         else:
-            return _convert_single_timestamp_to_seconds(timestamps)
+            self.count_rate = np.empty(0)
+            self.rate_times = np.empty(0)
 
     def __str__(self):
-        return "Valid NXevent_data group at " + self.nx_event_data.name + \
-               " containing " + str(self.nx_event_data['event_id'].len()) + " events"
+        if self.n_pulses == 0:
+            return "NXevent_data group at {} has no pulses".format(self.name)
+        counts = self.events_per_pulse
+        lines = ["NXevent_data group at {}: {} pulses, {} events over {:.6g} s".format(
+                     self.name, self.n_pulses, self.n_events, np.ptp(self.pulse_times)),
+                 "  pulse rate {:.6g} Hz (period {:.6g} s), jitter rms {:.3g} s, max {:.3g} s".format(
+                     self.pulse_rate, self.period, self.jitter_rms, self.jitter_max),
+                 "  events per pulse min {}, median {:.6g}, mean {:.6g}, max {}, {} empty pulses".format(
+                     counts.min(), np.median(counts), counts.mean(), counts.max(), np.count_nonzero(counts == 0))]
+        if self.n_missing > 0:
+            lines.append("  {} missing pulses in {} gaps, the longest {:.6g} s after pulse {}".format(
+                self.n_missing, len(self.gaps), self.periods[self.gaps].max(),
+                self.gaps[np.argmax(self.periods[self.gaps])]))
+        if self.n_backwards > 0:
+            lines.append("  event_time_zero does not increase {} times".format(self.n_backwards))
+        lines.append("  count rate min {:.6g}, mean {:.6g}, max {:.6g} events/s in {:g} s bins".format(
+            self.count_rate.min(), self.count_rate.mean(), self.count_rate.max(), self.rate_bin))
+        return "\n".join(lines)
 
     __repr__ = __str__
 
 
+class EventColumnCache(object):
+    """
+    Opt-in cache of decoded event data in a local directory, for repeated queries of the same files.
+
+    The absolute event times (sorted within each pulse) and detector ids of an NXevent_data group are written
+    once as .npy columns, with the pulse times and first event of each pulse, and memory mapped by later
+    queries instead of decompressing the event datasets again. Entries are decoded again when the size or
+    modification time of the file changes, and the least recently used entries are removed once the cache
+    holds more than max_bytes.
+    """
+
+    VERSION = 1
+    COLUMNS = ('time', 'event_id', 'pulse_time', 'pulse_start')
+
+    def __init__(self, directory=DEFAULT_EVENT_CACHE, max_bytes=DEFAULT_EVENT_CACHE_BYTES):
+        """
+        :param directory: Directory of the cache, one subdirectory per NXevent_data group
+        :param max_bytes: Size the cache is kept under, apart from the entry in use
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry(self, nx_event_data):
+        """
+        Directory of the entry for a group and the key its contents must have been written for
+        """
+        filename = os.path.abspath(nx_event_data.file.filename)
+        stat = os.stat(filename)
+        name = hashlib.sha1("{}:{}".format(filename, nx_event_data.name).encode("utf8")).hexdigest()
+        key = dict(source=filename, group=nx_event_data.name, size=stat.st_size, mtime=stat.st_mtime_ns,
+                   version=self.VERSION)
+        return os.path.join(self.directory, name), key
+
+    def columns(self, examples):
+        """
+        The memory mapped columns of the events of an NXevent_dataExamples, decoding them first if needed
+
+        :param examples: NXevent_dataExamples of the group
+        :return: dict of the COLUMNS, and 'sorted' telling whether the times are sorted across pulses too;
+                 None if the cache cannot be written
+        """
+        path, key = self._entry(examples.nx_event_data)
+        try:
+            with open(os.path.join(path, 'key.json')) as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            stored = None
+        try:
+            if stored is None or stored['key'] != key:
+                stored = self._build(examples, path, key)
+                self._evict(keep=path)
+            # the modification time of an entry records when it was last used
+            os.utime(path)
+        except OSError:
+            return None
+        columns = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in self.COLUMNS)
+        columns['sorted'] = stored['sorted']
+        return columns
+
+    def _build(self, examples, path, key):
+        """
+        Decode the events of a group into a new entry, a chunk of pulses at a time
+        """
+        pulse_times, pulse_starts, columns = examples._pulses(cached=False)
+        tmp_path = "{}.tmp.{}".format(path, os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        try:
+            np.save(os.path.join(tmp_path, 'pulse_time.npy'), pulse_times)
+            np.save(os.path.join(tmp_path, 'pulse_start.npy'), pulse_starts)
+            times = np.lib.format.open_memmap(os.path.join(tmp_path, 'time.npy'), mode='w+', dtype=np.float64,
+                                              shape=(int(pulse_starts[-1]),))
+            detector_ids = np.lib.format.open_memmap(os.path.join(tmp_path, 'event_id.npy'), mode='w+',
+                                                     dtype=examples.nx_event_data['event_id'].dtype,
+                                                     shape=(int(pulse_starts[-1]),))
+            is_sorted = True
+            last_time = -np.inf
+
+            def read(pulse, end):
+                # Each event stays with its pulse, so that the events of any pulses can be read back
+                return examples._read_pulses(pulse_times, pulse_starts, columns, pulse, end, across_pulses=False)
+
+            for pulse, end, (chunk_times, chunk_ids) in examples._iter_pulse_chunks(
+                    pulse_starts, 0, len(pulse_times), examples._event_bytes, read, CHUNK_EVENTS):
+                times[pulse_starts[pulse]:pulse_starts[end]] = chunk_times
+                detector_ids[pulse_starts[pulse]:pulse_starts[end]] = chunk_ids
+                if len(chunk_times) > 0:
+                    is_sorted = is_sorted and chunk_times[0] >= last_time and \
+                        not np.any(chunk_times[1:] < chunk_times[:-1])
+                    last_time = chunk_times[-1]
+            times.flush()
+            detector_ids.flush()
+            del times, detector_ids
+            stored = dict(key=key, sorted=bool(is_sorted))
+            with open(os.path.join(tmp_path, 'key.json'), 'w') as file:
+                json.dump(stored, file)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return stored
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used entries, apart from keep, until the cache is no larger than max_bytes
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if '.tmp.' in name or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+            total += size
+        for used, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+def _order_within_pulses(offsets, lengths):
+    """
+    The order which sorts the events of consecutive pulses by time within each pulse, without comparing events
+    of different pulses. Pulses of similar length (up to the next power of two) are laid out as the rows of a
+    2D array padded with NaN, which sorts last, and each row sorted separately.
+
+    :param offsets: Event times relative to their pulse, the events of one pulse after another
+    :param lengths: Number of events in each pulse
+    :return: Indices of the events in order
+    """
+    order = np.arange(len(offsets))
+    starts = np.cumsum(lengths) - lengths
+    length_class = np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+    for power in np.unique(length_class[length_class > 0]):
+        pulses = np.flatnonzero(length_class == power)
+        pulse_lengths = lengths[pulses]
+        in_pulse = np.arange(np.max(pulse_lengths)) < pulse_lengths[:, np.newaxis]
+        rows = starts[pulses][:, np.newaxis] + np.arange(in_pulse.shape[1])
+        positions = rows[in_pulse]
+        padded = np.full(in_pulse.shape, np.nan)
+        padded[in_pulse] = offsets[positions]
+        # The sort is stable, so events with a NaN time stay before the padding
+        order[positions] = (starts[pulses][:, np.newaxis] + np.argsort(padded, axis=1, kind='stable'))[in_pulse]
+    return order
+
+
+def log_intervals(nx_log, condition, reference=None):
+    """
+    The time intervals in which the values of an NXlog meet a condition. Each value is taken to hold from its
+    time until the time of the next one, the last value for ever after.
+
+    :param nx_log: NXlog group with time and value datasets
+    :param condition: (low, high) bounds of the value, inclusive and None for no bound, or a function taking the
+                      array of values and returning an array of booleans
+    :param reference: Measure the intervals from this time in seconds since the epoch, using the start attribute
+                      of the log times; None to measure them from the same reference as the log times
+    :return: Starts and ends of sorted, non overlapping, half open intervals in seconds
+    :raises ValueError: If a reference is given and the log times have no start attribute
+    """
+    times = nxunits.convert(nx_log['time'][...], nx_log['time'].attrs.get('units'), 's')
+    values = nx_log['value'][...]
+    if reference is not None:
+        if 'start' not in nx_log['time'].attrs:
+            raise ValueError("{} has no start attribute, so its times cannot be measured from another "
+                             "reference".format(nx_log['time'].name))
+        times += NXevent_dataExamples._isotime_to_unixtime_in_seconds(nx_log['time'].attrs['start']) - reference
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        values = values[order]
+
+    if callable(condition):
+        accepted = np.asarray(condition(values), dtype=bool)
+    else:
+        low, high = condition
+        accepted = np.ones(len(values), dtype=bool)
+        if low is not None:
+            accepted &= values >= low
+        if high is not None:
+            accepted &= values <= high
+
+    # Runs of accepted values, each lasting until the next value
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], accepted.astype(np.int8), [0]))))
+    bounds = np.append(times, np.inf)
+    starts, ends = bounds[changes[::2]], bounds[changes[1::2]]
+    return starts[starts < ends], ends[starts < ends]
+
+
+def intersect_intervals(*intervals):
+    """
+    The time intervals common to every one of several sets of intervals
+
+    :param intervals: (starts, ends) of sorted, non overlapping, half open intervals
+    :return: Starts and ends of the intervals in all of them, everything for no intervals at all
+    """
+    if len(intervals) == 0:
+        return np.array([-np.inf]), np.array([np.inf])
+    # Sweep over the edges counting the sets each point is in, edges at the same time close before they open
+    edges = np.concatenate([np.concatenate((starts, ends)) for starts, ends in intervals])
+    steps = np.concatenate([np.concatenate((np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)))
+                            for starts, ends in intervals])
+    order = np.lexsort((steps, edges))
+    edges = edges[order]
+    inside = np.flatnonzero(np.cumsum(steps[order]) == len(intervals))
+    starts, ends = edges[inside], edges[inside + 1]
+    return starts[starts < ends], ends[starts < ends]
+
+
+def merge_event_banks(banks, batch_size=1 << 20, range_start=-np.inf, range_end=np.inf, max_events=CHUNK_EVENTS):
+    """
+    Merge the events of several NXevent_data groups (detector banks) into one stream in order of absolute time,
+    reading each bank a chunk of pulses at a time so that memory use does not depend on the number of events.
+
+    A heap holds the banks by the time of the last event read from them so far: every event up to the earliest
+    of those times can be merged, as no bank can still have an earlier one. Events with the same time come in
+    the order of their banks. Each bank is expected to be in time order chunk after chunk, see
+    NXevent_dataExamples.iter_events_by_time_range.
+
+    :param banks: NXevent_data groups, or NXevent_dataExamples of them
+    :param batch_size: Number of events in each batch generated
+    :param range_start: Only merge events from this time in seconds, measured from the same reference as the
+                        pulse times of the banks
+    :param range_end: Only merge events up to this time
+    :param max_events: Most events read at once from each bank
+    :return: Generator of (detection event times, detector ids, bank index) arrays of batch_size events,
+             the last batch shorter
+    """
+    streams = [(bank if isinstance(bank, NXevent_dataExamples) else NXevent_dataExamples(bank))
+               .iter_events_by_time_range(range_start, range_end, max_events) for bank in banks]
+    # Events read but not merged yet of each bank
+    buffers = [None] * len(streams)
+    heap = []
+
+    def refill(bank):
+        for times, detector_ids in streams[bank]:
+            if len(times) > 0:
+                buffers[bank] = (times, detector_ids)
+                heapq.heappush(heap, (times[-1], bank))
+                return
+        buffers[bank] = None
+
+    for bank in range(len(streams)):
+        refill(bank)
+
+    pending = []
+    n_pending = 0
+    while heap:
+        horizon, bank = heapq.heappop(heap)
+        pieces = []
+        for other, buffer in enumerate(buffers):
+            if buffer is None:
+                continue
+            n = np.searchsorted(buffer[0], horizon, side='right')
+            if n > 0:
+                pieces.append((buffer[0][:n], buffer[1][:n], np.full(n, other, dtype=np.int32)))
+                buffers[other] = (buffer[0][n:], buffer[1][n:])
+        refill(bank)
+        if len(pieces) == 0:
+            continue
+
+        # The pieces are each sorted, which the stable sort (a merge sort) takes advantage of
+        times, detector_ids, bank_ids = (np.concatenate(arrays) for arrays in zip(*pieces))
+        order = np.argsort(times, kind='stable')
+        pending.append((times[order], detector_ids[order], bank_ids[order]))
+        n_pending += len(times)
+        if n_pending >= batch_size:
+            merged = [np.concatenate(arrays) for arrays in zip(*pending)]
+            done = n_pending - n_pending % batch_size
+            for start in range(0, done, batch_size):
+                yield tuple(array[start:start + batch_size] for array in merged)
+            pending = [tuple(array[done:] for array in merged)]
+            n_pending -= done
+    if n_pending > 0:
+        yield tuple(np.concatenate(arrays) for arrays in zip(*pending))
+
+
 class _NXevent_dataFinder(object):
     """
     Finds NXevent_data groups in the file
@@ -168,7 +1029,7 @@ class _NXevent_dataFinder(object):
 
     def _visit_NXevent_data(self, name, obj):
         if "NX_class" in obj.attrs.keys():
-            if "NXevent_data" == str(obj.attrs["NX_class"], 'utf8'):
+            if "NXevent_data" == nxindex.decode(obj.attrs["NX_class"]):
                 self.hits.append(obj)
 
     def get_NXevent_data(self, nx_file, entry):
@@ -177,22 +1038,60 @@ class _NXevent_dataFinder(object):
         return self.hits
 
 
-def validate(nx_event_data):
+def validate(nx_event_data, content=False, max_bytes=DEFAULT_BUFFER_BYTES, sampling=None):
     """
     Checks that lengths of datasets which should be the same length as each other are.
 
     :param nx_event_data: An NXevent_data group which was found in the file
+    :param content: Also check the values of the index datasets, see validate_content
+    :param max_bytes: Upper bound on the size of each block read by the content checks
+    :param sampling: nxchunks.Sampling for the content checks, see validate_content
     """
     fails = []
 
     _check_datasets_have_same_length(nx_event_data, ['event_time_offset', 'event_id'], fails)
     _check_datasets_have_same_length(nx_event_data, ['event_time_zero', 'event_index'], fails)
     _check_datasets_have_same_length(nx_event_data, ['cue_timestamp_zero', 'cue_index'], fails)
+    if content and len(fails) == 0:
+        fails.extend(validate_content(nx_event_data, max_bytes, sampling))
 
     if len(fails) > 0:
         raise AssertionError('\n'.join(fails))
 
 
+def validate_content(nx_event_data, max_bytes=DEFAULT_BUFFER_BYTES, sampling=None):
+    """
+    Checks the values of the index datasets with nxchunks.reduce_dataset, so that memory use is bounded
+    by max_bytes however many events there are:
+    event_index and cue_index do not decrease and refer to events which exist, and event_time_zero and
+    cue_timestamp_zero do not decrease. When sampling, only the sampled blocks of large datasets are read,
+    and values are compared with the last value of the previous block read. Each dataset is read up to the
+    first block with a failure.
+
+    :param nx_event_data: An NXevent_data group with datasets of consistent lengths, see validate
+    :param max_bytes: Upper bound on the size of each block read
+    :param sampling: nxchunks.Sampling to use, defaults to the one given to set_sampling; False forces a full scan
+    :return: List of failure messages with the first offending index of each check, empty if the content is valid
+    """
+    fails = []
+    n_events = nx_event_data['event_id'].len() if 'event_id' in nx_event_data else None
+    # Pulses at the end may have no events, so event_index can be n_events, but each cue is of an event
+    limits = {'event_index': n_events, 'cue_index': None if n_events is None else n_events - 1}
+
+    for name in _existant_datasets(nx_event_data, ['event_index', 'event_time_zero', 'cue_index',
+                                                   'cue_timestamp_zero']):
+        limit = limits.get(name)
+        reduction = reduce_dataset(nx_event_data[name], max_bytes=max_bytes, sampling=sampling,
+                                   limits=None if limit is None else (0, limit), stop_at_failure=True)
+        if not reduction.monotonic:
+            fails.append("{} decreases at index {} in {}".format(name, reduction.first_decrease,
+                                                                 nx_event_data.name))
+        if not reduction.within_limits:
+            fails.append("{} at index {} refers to an event outside the {} events in {}".format(
+                name, reduction.first_outside_limits, n_events, nx_event_data.name))
+    return fails
+
+
 def _check_datasets_have_same_length(group, dataset_names, fails):
     """
     If all named datasets exist in group then check they have the same length
@@ -218,6 +1117,67 @@ def _existant_datasets(group, dataset_names):
     return list(compress(dataset_names, existant_dataset_mask))
 
 
+class NXevent_dataMonitor(object):
+    """
+    Validates an NXevent_data group incrementally while it is still being written in SWMR mode.
+
+    Each refresh only reads the part of event_index appended since the previous refresh, the
+    running state (number of pulses and events seen, last event_index value) carries over.
+    grew tells whether the last refresh found new data.
+    """
+
+    def __init__(self, nx_event_data):
+        self.nx_event_data = nx_event_data
+        self.n_pulses = 0
+        self.n_events = 0
+        self.last_event_index = None
+        self.grew = False
+
+    def refresh(self):
+        """
+        Refresh the datasets from the file and validate the newly appended data
+
+        :return: List of failure messages, empty if the new data is valid
+        """
+        fails = []
+        for dataset in self.nx_event_data.values():
+            if hasattr(dataset, 'refresh'):
+                dataset.refresh()
+
+        _check_datasets_have_same_length(self.nx_event_data, ['event_time_offset', 'event_id'], fails)
+        _check_datasets_have_same_length(self.nx_event_data, ['event_time_zero', 'event_index'], fails)
+        _check_datasets_have_same_length(self.nx_event_data, ['cue_timestamp_zero', 'cue_index'], fails)
+
+        previous_size = (self.n_pulses, self.n_events)
+        if 'event_id' in self.nx_event_data:
+            self.n_events = self.nx_event_data['event_id'].len()
+        if 'event_index' in self.nx_event_data:
+            n_pulses = self.nx_event_data['event_index'].len()
+            if n_pulses < self.n_pulses:
+                fails.append("event_index shrank from {} to {} entries in {}".format(
+                    self.n_pulses, n_pulses, self.nx_event_data.name))
+            elif n_pulses > self.n_pulses:
+                new_event_index = self.nx_event_data['event_index'][self.n_pulses:n_pulses]
+                if self.last_event_index is not None:
+                    new_event_index = np.append([self.last_event_index], new_event_index)
+                if np.any(np.diff(new_event_index.astype(np.int64)) < 0):
+                    fails.append("event_index decreases between entries {} and {} in {}".format(
+                        self.n_pulses, n_pulses, self.nx_event_data.name))
+                if new_event_index[-1] > self.n_events:
+                    fails.append("event_index refers to event {} but there are only {} events in {}".format(
+                        new_event_index[-1], self.n_events, self.nx_event_data.name))
+                self.last_event_index = new_event_index[-1]
+            self.n_pulses = n_pulses
+        self.grew = (self.n_pulses, self.n_events) != previous_size
+        return fails
+
+    def __str__(self):
+        return "NXevent_data group at " + self.nx_event_data.name + " with " + str(self.n_pulses) + \
+               " pulses and " + str(self.n_events) + " events so far"
+
+    __repr__ = __str__
+
+
 class recipe:
     """
         This is meant to help consumers of this feature to understand how to implement
@@ -231,6 +1191,10 @@ class recipe:
         self.entry = entrypath
         self.title = "NXevent_data"
 
+    def detect(self, index):
+        """Whether the entry has NXevent_data groups, without validating them"""
+        return index.has_class("NXevent_data")
+
     def process(self):
         nx_event_data = _NXevent_dataFinder()
         nx_event_data_list = nx_event_data.get_NXevent_data(self.file, self.entry)
@@ -238,7 +1202,20 @@ class recipe:
             raise AssertionError("No NXevent_data entries found")
         examples = []
         for nx_event_data_entry in nx_event_data_list:
-            validate(nx_event_data_entry)
+            # The index datasets are only read through when content checks were asked for, and then only the
+            # sampled blocks of large ones when sampling
+            validate(nx_event_data_entry, content=get_content_checks(), sampling=get_sampling())
             examples.append(NXevent_dataExamples(nx_event_data_entry))
 
         return examples
+
+    def monitor(self):
+        """
+        Incremental validation of the NXevent_data groups in a file opened in SWMR mode
+
+        :return: A monitor for each NXevent_data group, see NXevent_dataMonitor.refresh
+        """
+        nx_event_data_list = _NXevent_dataFinder().get_NXevent_data(self.file, self.entry)
+        if len(nx_event_data_list) == 0:
+            raise AssertionError("No NXevent_data entries found")
+        return [NXevent_dataMonitor(nx_event_data_entry) for nx_event_data_entry in nx_event_data_list]
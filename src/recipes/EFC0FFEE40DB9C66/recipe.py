@@ -13,6 +13,10 @@ class recipe:
         self.entry = entrypath
         self.title = "scan command available"
 
+    def detect(self, index):
+        """Whether the entry has a scan_command field"""
+        return index.has("scan_command")
+
     def process(self):
         try:
             scan_command = self.file[self.entry + "/scan_command"][0]
@@ -21,6 +21,20 @@ class recipe:
         self.entry = entrypath
         self.title = "@TITLE@"
 
+    def detect(self, index):
+        """
+        Recipes may implement this method to tell, from the metadata of the entry
+        alone, whether it appears to have this feature. It must not read any large
+        datasets; process still decides whether the feature is valid.
+
+        :param index: nxindex.EntryIndex of the entry, with its groups by path and NX_class
+        :return: True if the entry appears to have this feature
+        """
+
+        raise Exception("unedited template code found")
+
+        return False
+
     def process(self):
         """
         Recipes need to implement this method and return information which
@@ -33,3 +47,16 @@ class recipe:
         raise Exception("unedited template code found")
 
         return []
+
+    def summary(self, response):
+        """
+        Recipes may implement this method when process returns objects holding on
+        to the file (h5py groups, datasets or classes wrapping them). It should
+        describe them with plain data (str, numbers, lists and dicts), which is
+        what gets reported, cached and passed between processes.
+
+        :param response: the object returned by process
+        :return: JSON serialisable summary of response
+        """
+
+        return response
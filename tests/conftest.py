@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+
+# The helper modules and the recipes are imported the way nxfeature.py imports them
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "recipes"))
+
+
+@pytest.fixture
+def examples_dir():
+    return os.path.join(ROOT_DIR, "examples")
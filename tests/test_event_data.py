@@ -0,0 +1,565 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+import nxchunks
+import nxfeature
+import nxrepack
+
+recipe = importlib.import_module("ECB064453EDB096D.recipe")
+EVENT_DATA = 0xECB064453EDB096D
+
+
+def write_events(path, n_pulses=200, seed=0, name="entry/events", rate=30):
+    """
+    An NXevent_data group with pulses every 0.1 s, some of them empty, and their events up to 20 ms later
+    """
+    random = np.random.RandomState(seed)
+    events_per_pulse = random.poisson(rate, n_pulses)
+    events_per_pulse[random.choice(n_pulses, 10, replace=False)] = 0
+    n_events = int(events_per_pulse.sum())
+    with h5py.File(path, "a") as nx_file:
+        group = nx_file.create_group(name)
+        group.attrs["NX_class"] = "NXevent_data"
+        group.create_dataset("event_time_zero", data=np.arange(n_pulses) * 100000000 + 12345,
+                             dtype=np.int64).attrs["units"] = "ns"
+        group.create_dataset("event_index", data=np.cumsum(events_per_pulse) - events_per_pulse)
+        group.create_dataset("event_time_offset", data=random.uniform(0, 20000, n_events).astype(np.float32),
+                             chunks=(100,), maxshape=(None,)).attrs["units"] = "us"
+        group.create_dataset("event_id", data=random.randint(0, 64, n_events).astype(np.uint32), chunks=(100,),
+                             maxshape=(None,))
+
+
+@pytest.fixture(params=["synthetic", "example"])
+def event_data(request, tmp_path, examples_dir):
+    if request.param == "synthetic":
+        path, name = str(tmp_path / "events.nxs"), "entry/events"
+        write_events(path)
+    else:
+        path, name = os.path.join(examples_dir, "example_nxevent_data.nxs"), "raw_data_1/detector_1_events"
+    with h5py.File(path, "r") as nx_file:
+        yield nx_file[name]
+
+
+def brute_force(group):
+    """
+    Time in seconds from the pulse time reference, detector id and time of flight in us of every event
+    """
+    pulse_times = group["event_time_zero"][...] * (1e-9 if group["event_time_zero"].attrs["units"] == "ns" else 1.0)
+    event_index = group["event_index"][...]
+    offsets = group["event_time_offset"][...].astype(np.float64)
+    pulses = np.searchsorted(event_index, np.arange(len(offsets)), side="right") - 1
+    return pulse_times[pulses] + offsets * 1e-6, group["event_id"][...], offsets
+
+
+def time_ranges(group, n=20):
+    times = brute_force(group)[0]
+    starts = np.random.RandomState(1).uniform(times.min() - 0.05, times.max(), n)
+    return [(start, start + width) for start, width in zip(starts, np.random.RandomState(2).uniform(0, 0.4, n))]
+
+
+def by_time(times, detector_ids):
+    order = np.lexsort((detector_ids, times))
+    return times[order], detector_ids[order]
+
+
+def test_events_by_time_range(event_data):
+    all_times, all_ids, offsets = brute_force(event_data)
+    examples = recipe.NXevent_dataExamples(event_data)
+    for start, end in time_ranges(event_data):
+        selected = (all_times >= start) & (all_times <= end)
+        times, detector_ids = examples.get_events_by_time_range(start, end)
+        assert np.all(times[1:] >= times[:-1])
+        expected_times, expected_ids = by_time(all_times[selected], all_ids[selected])
+        times, detector_ids = by_time(times, detector_ids)
+        assert np.allclose(times, expected_times, rtol=0, atol=1e-9)
+        assert np.array_equal(detector_ids, expected_ids)
+
+
+def test_streamed_time_range_chunks_join_up(event_data):
+    examples = recipe.NXevent_dataExamples(event_data)
+    for start, end in time_ranges(event_data, 5):
+        times, detector_ids = examples.get_events_by_time_range(start, end)
+        chunks = list(examples.iter_events_by_time_range(start, end, max_events=40))
+        streamed = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.empty(0)
+        assert np.array_equal(np.sort(streamed), times)
+
+
+def test_time_range_queries_through_the_cues(tmp_path, examples_dir):
+    path = str(tmp_path / "events.nxs")
+    write_events(path, n_pulses=2000)
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        nxrepack.write_cues(group, group, 1.0)
+    with h5py.File(path, "r") as nx_file:
+        group = nx_file["entry/events"]
+        all_times, all_ids, offsets = brute_force(group)
+        bins = np.array([0, 5000, 20000])
+        examples = recipe.NXevent_dataExamples(group)
+        for start, end in time_ranges(group):
+            # Only the pulses between the cues around the range are read
+            pulse_times, pulse_starts = examples._cued_pulses(start, end)
+            assert len(pulse_times) <= 2000 * (end - start + 2.5) / 200
+            selected = (all_times >= start) & (all_times <= end)
+            times, detector_ids = by_time(*examples.get_events_by_time_range(start, end))
+            expected_times, expected_ids = by_time(all_times[selected], all_ids[selected])
+            assert np.allclose(times, expected_times, rtol=0, atol=1e-9)
+            assert np.array_equal(detector_ids, expected_ids)
+            histogram = examples.histogram_time_of_flight(bins, n_ids=64, range_start=start, range_end=end)
+            assert np.array_equal(histogram, brute_force_histogram(all_ids[selected], offsets[selected], bins, 64))
+        assert examples._event_index is None
+    # The cues of the example file are not at the times of its pulses, so its pulses are found through event_index
+    with h5py.File(os.path.join(examples_dir, "example_nxevent_data.nxs"), "r") as nx_file:
+        assert recipe.NXevent_dataExamples(nx_file["raw_data_1/detector_1_events"])._cued_pulses(3.0, 3.5) is None
+
+
+def test_take_rows_reads_only_windows_around_the_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.nxs")
+    write_events(path, n_pulses=2000)
+    monkeypatch.setattr(recipe, "DEFAULT_BUFFER_BYTES", 400)
+    with h5py.File(path, "r") as nx_file:
+        examples = recipe.NXevent_dataExamples(nx_file["entry/events"])
+        n_events = nx_file["entry/events/event_id"].len()
+        all_ids = nx_file["entry/events/event_id"][...]
+        read = []
+        read_rows = examples._read_rows
+
+        def recording_read_rows(dataset_name, start, stop):
+            read.append(stop - start)
+            return read_rows(dataset_name, start, stop)
+
+        monkeypatch.setattr(examples, "_read_rows", recording_read_rows)
+        rows = np.array([n_events - 1, 0, n_events - 1, 50, 1])
+        assert np.array_equal(examples._take_rows("event_id", rows), all_ids[rows])
+        assert sum(read) == 52
+        del read[:]
+        rows = np.random.RandomState(3).randint(0, n_events, 1000)
+        assert np.array_equal(examples._take_rows("event_id", rows), all_ids[rows])
+        assert max(read) <= 100
+
+
+def test_times_in_whole_nanoseconds(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        group["event_time_zero"].attrs["offset"] = "2017-09-28T15:06:48.123456789Z"
+        pulse_times = group["event_time_zero"][...]
+        offsets = group["event_time_offset"][...]
+        event_index = group["event_index"][...]
+        events = np.arange(0, len(offsets), 7)
+        pulses = np.searchsorted(event_index, events, side="right") - 1
+        expected = [1506611208123456789 + int(pulse_times[pulse]) + int(np.rint(np.float64(offsets[event]) * 1000))
+                    for event, pulse in zip(events, pulses)]
+        times = recipe.NXevent_dataExamples(group).get_times_neutron_detected(events, "ns", np.int64)
+    assert times.dtype == np.int64
+    assert list(times) == expected
+
+
+def test_pulse_time_offset_is_parsed_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    parsed = []
+    parse = recipe.NXevent_dataExamples._isotime_to_unixtime_in_nanoseconds
+    monkeypatch.setattr(recipe.NXevent_dataExamples, "_isotime_to_unixtime_in_nanoseconds",
+                        staticmethod(lambda isotime: parsed.append(isotime) or parse(isotime)))
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        group["event_time_zero"].attrs["offset"] = "2017-09-28T15:06:48.123456789Z"
+        examples = recipe.NXevent_dataExamples(group)
+        for events in ([0, 5], [7]):
+            examples.get_times_neutron_detected(events, "ns", np.int64)
+        assert examples.pulse_time_offset_ns == 1506611208123456789
+        assert examples.pulse_time_offset == pytest.approx(1506611208.123456789)
+    assert len(parsed) == 1
+
+
+def brute_force_histogram(detector_ids, offsets, bins, n_ids):
+    counts = np.zeros((n_ids, len(bins) - 1), dtype=np.int64)
+    for detector_id, offset in zip(detector_ids, offsets):
+        if bins[0] <= offset <= bins[-1]:
+            counts[detector_id, min(np.searchsorted(bins, offset, side="right") - 1, len(bins) - 2)] += 1
+    return counts
+
+
+@pytest.mark.parametrize("max_events", [recipe.CHUNK_EVENTS, 50])
+def test_histograms(event_data, max_events):
+    all_times, all_ids, offsets = brute_force(event_data)
+    n_ids = int(all_ids.max()) + 1
+    examples = recipe.NXevent_dataExamples(event_data)
+    bins = np.array([0, 1000, 2500, 5000, 5500, 12000, 15000])
+    expected = brute_force_histogram(all_ids, offsets, bins, n_ids)
+    # Without n_ids the histogram grows to the largest detector id counted in a bin
+    histogram = examples.histogram_time_of_flight(bins, max_events=max_events)
+    assert np.array_equal(histogram, expected[:len(histogram)])
+    assert histogram[-1].any() and not expected[len(histogram):].any()
+    assert np.array_equal(examples.histogram_event_ids(n_ids=200, max_events=max_events),
+                          np.bincount(all_ids, minlength=200))
+    for start, end in time_ranges(event_data, 5):
+        selected = (all_times >= start) & (all_times <= end)
+        histogram = examples.histogram_time_of_flight(bins, n_ids=n_ids, range_start=start, range_end=end,
+                                                      max_events=max_events)
+        assert np.array_equal(histogram, brute_force_histogram(all_ids[selected], offsets[selected], bins, n_ids))
+
+
+@pytest.mark.parametrize("isotime, seconds", [
+    ("2017-09-28T15:06:48", 1506611208.0),
+    (b"2017-09-28T15:06:48.044698", 1506611208.044698),
+    ("2017-09-28T15:06:48Z", 1506611208.0),
+    ("2017-09-28T16:06:48.5+01:00", 1506611208.5),
+    ("2017-09-28T12:36:48-0230", 1506611208.0),
+])
+def test_iso_times(isotime, seconds):
+    assert recipe.NXevent_dataExamples._isotime_to_unixtime_in_nanoseconds(isotime) == round(seconds * 1e6) * 1000
+    assert recipe.NXevent_dataExamples._isotime_to_unixtime_in_seconds(isotime) == pytest.approx(seconds, abs=1e-6)
+    with pytest.raises(ValueError):
+        recipe.NXevent_dataExamples._isotime_to_unixtime_in_seconds("28/09/2017 15:06")
+
+
+def brute_force_intervals(times, accepted):
+    """
+    Each accepted value holds from its time until the time of the next value, adjoining intervals merged
+    """
+    order = np.argsort(times, kind="stable")
+    bounds = list(np.asarray(times)[order]) + [np.inf]
+    intervals = []
+    for i, ok in enumerate(np.asarray(accepted)[order]):
+        if ok and bounds[i] < bounds[i + 1]:
+            if intervals and intervals[-1][1] == bounds[i]:
+                intervals[-1][1] = bounds[i + 1]
+            else:
+                intervals.append([bounds[i], bounds[i + 1]])
+    return intervals
+
+
+def test_log_intervals_of_example_log(examples_dir):
+    # The log rises steadily, so a condition on a range of values would give a single interval
+    def condition(values):
+        return np.floor(values * 1e4) % 2 == 0
+
+    with h5py.File(os.path.join(examples_dir, "example_nx_log.nxs"), "r") as nx_file:
+        log = nx_file["raw_data_1/example_log"]
+        times, values = log["time"][...].astype(np.float64), log["value"][...]
+        # Measured from a reference 0.044698 s before the start of the log, see its time@start
+        reference = recipe.NXevent_dataExamples._isotime_to_unixtime_in_seconds("2017-09-28T15:06:48")
+        starts, ends = recipe.log_intervals(log, condition, reference)
+    expected = brute_force_intervals(times + 0.044698, condition(values))
+    assert len(expected) > 1
+    assert np.allclose(starts, [start for start, end in expected], rtol=0, atol=1e-6)
+    assert np.allclose(ends, [end for start, end in expected], rtol=0, atol=1e-6)
+
+
+def test_events_in_log_intervals(event_data, tmp_path):
+    all_times, all_ids, offsets = brute_force(event_data)
+    random = np.random.RandomState(5)
+    with h5py.File(str(tmp_path / "log.nxs"), "w") as nx_file:
+        log = nx_file.create_group("log")
+        log.create_dataset("time", data=random.uniform(all_times.min() - 1, all_times.max(), 40)).attrs["units"] = "s"
+        log.create_dataset("value", data=random.uniform(0, 1, 40))
+        starts, ends = recipe.log_intervals(log, lambda values: values > 0.4)
+        expected = brute_force_intervals(log["time"][...], log["value"][...] > 0.4)
+    inside = np.zeros(len(all_times), dtype=bool)
+    for start, end in expected:
+        inside |= (all_times >= start) & (all_times < end)
+    assert 0 < inside.sum() < len(all_times)
+
+    examples = recipe.NXevent_dataExamples(event_data)
+    assert examples.count_events_in_intervals(starts, ends, max_events=50) == inside.sum()
+    chunks = list(examples.iter_events_in_intervals(starts, ends, max_events=50))
+    times = np.concatenate([chunk[0] for chunk in chunks])
+    assert np.allclose(np.sort(times), np.sort(all_times[inside]), rtol=0, atol=1e-9)
+
+
+def test_events_in_log_intervals_through_the_cues(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path, n_pulses=2000)
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        nxrepack.write_cues(group, group, 1.0)
+        log = nx_file.create_group("log")
+        log.create_dataset("time", data=np.linspace(50, 80, 31)).attrs["units"] = "s"
+        log.create_dataset("value", data=np.arange(31) % 3 == 0)
+    with h5py.File(path, "r") as nx_file:
+        group = nx_file["entry/events"]
+        all_times = brute_force(group)[0]
+        examples = recipe.NXevent_dataExamples(group)
+        starts, ends = examples.intervals_from_logs([(nx_file["log"], lambda values: values)])
+        # The last value holds for ever after, the cues still leave out the pulses before the first interval
+        assert np.isinf(ends[-1]) and len(examples._cued_pulses(starts[0], ends[-1])[0]) <= 1510
+        inside = np.zeros(len(all_times), dtype=bool)
+        for start, end in zip(starts, ends):
+            inside |= (all_times >= start) & (all_times < end)
+        assert examples.count_events_in_intervals(starts, ends, max_events=50) == inside.sum()
+        times = np.concatenate([chunk[0] for chunk in examples.iter_events_in_intervals(starts, ends)])
+        assert np.allclose(np.sort(times), np.sort(all_times[inside]), rtol=0, atol=1e-9)
+        assert examples._event_index is None
+
+
+def test_log_and_event_times_from_different_references_are_refused(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        log = nx_file.create_group("log")
+        log.create_dataset("time", data=[0.0, 1.0]).attrs["units"] = "s"
+        log.create_dataset("value", data=[1.0, 2.0])
+        conditions = [(log, (0, 1.5))]
+        assert len(recipe.NXevent_dataExamples(group).intervals_from_logs(conditions)[0]) == 1
+        group["event_time_zero"].attrs["offset"] = "2017-09-28T15:06:48Z"
+        with pytest.raises(ValueError):
+            recipe.NXevent_dataExamples(group).intervals_from_logs(conditions)
+        del group["event_time_zero"].attrs["offset"]
+        log["time"].attrs["start"] = "2017-09-28T15:06:48Z"
+        with pytest.raises(ValueError):
+            recipe.NXevent_dataExamples(group).intervals_from_logs(conditions)
+
+
+def write_bad_event_index(path):
+    write_events(path)
+    with h5py.File(path, "r+") as nx_file:
+        nx_file["entry"].attrs["NX_class"] = "NXentry"
+        event_index = nx_file["entry/events/event_index"]
+        event_index[150] = -1
+
+
+def test_content_checks_are_opt_in(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_bad_event_index(path)
+    without, = nxfeature.check_file(path, EVENT_DATA)
+    assert without.passed
+    with_content, = nxfeature.check_file(path, EVENT_DATA, content=True)
+    assert not with_content.passed
+    assert "event_index decreases at index 150" in with_content.message
+    results = list(nxfeature.iter_results([path, path], EVENT_DATA, cache=str(tmp_path / "cache")))
+    results += nxfeature.iter_results([path], EVENT_DATA, cache=str(tmp_path / "cache"), content=True)
+    assert [result.passed for result in results] == [True, True, False]
+
+
+def test_sampled_content_checks(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.nxs")
+    write_bad_event_index(path)
+    # Sample the 200 pulses of write_events in blocks of 10
+    monkeypatch.setattr(nxchunks, "SAMPLE_BLOCK_BYTES", 80)
+    monkeypatch.setattr(nxchunks.Sampling.__init__, "__defaults__", (0, 0))
+    full, = nxfeature.iter_results([path], EVENT_DATA, content=True)
+    assert not full.passed and full.coverage is None
+    sampled = [result for seed in range(12)
+               for result in nxfeature.iter_results([path], EVENT_DATA, sample=0.25, seed=seed, content=True)]
+    # Only the seeds which sample the block holding the bad value find it, and stop reading there
+    assert set(result.passed for result in sampled) == {True, False}
+    assert all(result.coverage == pytest.approx(0.25) for result in sampled if result.passed)
+    assert all(0 < result.coverage < 0.25 for result in sampled if not result.passed)
+
+
+def test_sample_option_runs_the_content_checks(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_bad_event_index(path)
+    command = [sys.executable, nxfeature.__file__, "-f", "{:X}".format(EVENT_DATA), path]
+    assert subprocess.run(command, stdout=subprocess.PIPE).returncode == 0
+    run = subprocess.run(command + ["--sample", "0.5"], stdout=subprocess.PIPE, universal_newlines=True)
+    assert run.returncode == 1
+    # The datasets are too small to sample, so they are read in full
+    assert "event_index decreases at index 150" in run.stdout
+    assert "sampled coverage 100.0%" in run.stdout
+
+
+def test_merge_event_banks(tmp_path):
+    path = str(tmp_path / "banks.nxs")
+    for bank, rate in enumerate([30, 0, 5, 30]):
+        write_events(path, seed=bank, name="entry/bank{}".format(bank), rate=rate)
+    with h5py.File(path, "r+") as nx_file:
+        banks = [nx_file["entry/bank{}".format(bank)] for bank in range(4)]
+        # Times in whole milliseconds, so that banks share detection times
+        for group in banks:
+            group["event_time_offset"][...] = np.round(group["event_time_offset"][...], -3)
+        all_times, all_ids, all_banks = (np.concatenate(arrays) for arrays in zip(
+            *[brute_force(group)[:2] + (np.full(len(group["event_id"]), bank),) for bank, group in enumerate(banks)]))
+        assert len(np.unique(all_times)) < len(all_times)
+        for start, end in [(-np.inf, np.inf), (3.0, 7.55)]:
+            selected = (all_times >= start) & (all_times <= end)
+            expected = np.lexsort((all_ids[selected], all_banks[selected], all_times[selected]))
+            batches = list(recipe.merge_event_banks(banks, batch_size=100, range_start=start, range_end=end,
+                                                    max_events=64))
+            assert all(len(batch[0]) == 100 for batch in batches[:-1])
+            times, detector_ids, bank_ids = (np.concatenate(arrays) for arrays in zip(*batches))
+            # Events at the same time come in the order of their banks
+            assert np.array_equal(times, all_times[selected][expected])
+            assert np.array_equal(bank_ids, all_banks[selected][expected])
+            order = np.lexsort((detector_ids, bank_ids, times))
+            assert np.array_equal(detector_ids[order], all_ids[selected][expected])
+
+
+def test_merge_event_banks_within_a_small_budget(tmp_path):
+    path = str(tmp_path / "banks.nxs")
+    for bank in range(2):
+        write_events(path, n_pulses=100, seed=bank, name="entry/bank{}".format(bank), rate=1000)
+    with h5py.File(path, "r") as nx_file:
+        banks = [nx_file["entry/bank{}".format(bank)] for bank in range(2)]
+        expected = [np.concatenate(arrays) for arrays in zip(*recipe.merge_event_banks(banks))]
+        merged = []
+
+        def merge(budget):
+            nxchunks.set_thread_memory_budget(budget)
+            try:
+                merged.extend(recipe.merge_event_banks(banks))
+            finally:
+                nxchunks.set_thread_memory_budget(None)
+
+        # The first bank can be granted the whole budget, which it must not keep while the next bank reads
+        budget = nxchunks.MemoryBudget(4 * 1024 ** 2)
+        thread = threading.Thread(target=merge, args=(budget,))
+        thread.daemon = True
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive()
+        assert budget.free == budget.total
+        for array, expected_array in zip((np.concatenate(arrays) for arrays in zip(*merged)), expected):
+            assert np.array_equal(array, expected_array)
+
+
+def cached_events(path, cache, name="entry/events", range_start=-np.inf, range_end=np.inf):
+    with h5py.File(path, "r") as nx_file:
+        examples = recipe.NXevent_dataExamples(nx_file[name], cache=cache)
+        times, detector_ids = examples.get_events_by_time_range(range_start, range_end)
+        return times, detector_ids, None if cache is None else cache.columns(examples)
+
+
+def test_cached_query_is_not_changed_by_an_uncached_one(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    cache = recipe.EventColumnCache(str(tmp_path / "cache"))
+    expected = cached_events(path, cache)
+    with h5py.File(path, "r") as nx_file:
+        examples = recipe.NXevent_dataExamples(nx_file["entry/events"], cache=cache)
+        chunks = examples.iter_events_by_time_range(-np.inf, np.inf, max_events=64)
+        first = next(chunks)
+        # Uncached queries while the cached one is part way through
+        examples.pulse_summary()
+        examples.histogram_event_ids()
+
+        def read_rows(dataset_name, start, stop):
+            raise AssertionError("the cached query read {} from the file".format(dataset_name))
+
+        monkeypatch.setattr(examples, "_read_rows", read_rows)
+        times, detector_ids = (np.concatenate(arrays) for arrays in zip(first, *chunks))
+    assert np.array_equal(times, expected[0])
+    assert np.array_equal(detector_ids, expected[1])
+
+
+@pytest.mark.parametrize("late_events", [False, True])
+def test_event_column_cache_gives_the_events_of_the_file(tmp_path, late_events):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    if late_events:
+        with h5py.File(path, "r+") as nx_file:
+            # The events of the first pulse after the second one starts, 0.1 s later
+            first = nx_file["entry/events/event_index"][1]
+            nx_file["entry/events/event_time_offset"][:first] += 150000
+    cache = recipe.EventColumnCache(str(tmp_path / "cache"))
+    for time_range in [(-np.inf, np.inf), (0.12, 0.35), (0.12, 0.35), (-np.inf, np.inf)]:
+        uncached = cached_events(path, None, range_start=time_range[0], range_end=time_range[1])
+        times, detector_ids, columns = cached_events(path, cache, range_start=time_range[0], range_end=time_range[1])
+        assert columns["sorted"] is not late_events
+        assert np.array_equal(times, uncached[0])
+        assert np.array_equal(detector_ids, uncached[1])
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_event_column_cache_decodes_a_changed_file_again(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    cache = recipe.EventColumnCache(str(tmp_path / "cache"))
+    before = cached_events(path, cache)
+    with h5py.File(path, "r+") as nx_file:
+        nx_file["entry/events/event_id"][...] = 7
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    times, detector_ids, columns = cached_events(path, cache)
+    assert np.array_equal(times, before[0])
+    assert np.all(detector_ids == 7)
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_event_column_cache_evicts_the_least_recently_used(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    for bank in range(3):
+        write_events(path, seed=bank, name="entry/bank{}".format(bank))
+    directory = str(tmp_path / "cache")
+    cached_events(path, recipe.EventColumnCache(directory), "entry/bank0")
+    entry, = os.listdir(directory)
+    entry_bytes = sum(os.path.getsize(os.path.join(directory, entry, file))
+                      for file in os.listdir(os.path.join(directory, entry)))
+    # Room for two entries of about the same size
+    cache = recipe.EventColumnCache(directory, max_bytes=int(2.5 * entry_bytes))
+
+    def used(bank):
+        time.sleep(0.01)
+        return cached_events(path, cache, "entry/bank{}".format(bank))
+
+    def cached_groups():
+        groups = set()
+        for entry in os.listdir(directory):
+            with open(os.path.join(directory, entry, "key.json")) as file:
+                groups.add(json.load(file)["key"]["group"])
+        return groups
+
+    used(1)
+    used(0)
+    assert cached_groups() == {"/entry/bank0", "/entry/bank1"}
+    used(2)
+    assert cached_groups() == {"/entry/bank0", "/entry/bank2"}
+
+
+def test_pulse_summary(event_data):
+    all_times, all_ids, offsets = brute_force(event_data)
+    pulse_times = all_times - offsets * 1e-6
+    event_index = event_data["event_index"][...]
+    n_pulses = len(event_index)
+    pulse_of_event = np.searchsorted(event_index, np.arange(len(all_ids)), side="right") - 1
+    # write_events leaves some pulses without events
+    counts = [int(np.count_nonzero(pulse_of_event == pulse)) for pulse in range(n_pulses)]
+
+    summary = recipe.NXevent_dataExamples(event_data).pulse_summary(rate_bin=0.5)
+    assert (summary.n_pulses, summary.n_events) == (n_pulses, len(all_ids))
+    assert list(summary.events_per_pulse) == counts
+    assert "events per pulse min {}, median {:.6g}, mean {:.6g}, max {}, {} empty pulses".format(
+        min(counts), np.median(counts), np.mean(counts), max(counts), counts.count(0)) in str(summary)
+    # The events of each pulse counted in the bin its pulse starts in
+    first_pulse_time = summary.pulse_times.min()
+    rate = {}
+    for event, pulse in enumerate(pulse_of_event):
+        rate_bin = int((summary.pulse_times[pulse] - first_pulse_time) // 0.5)
+        rate[rate_bin] = rate.get(rate_bin, 0) + 1 / 0.5
+    assert np.allclose(summary.count_rate, [rate.get(rate_bin, 0) for rate_bin in range(len(summary.count_rate))])
+    assert np.allclose(summary.pulse_times[pulse_of_event], pulse_times)
+
+
+def test_pulse_summary_counts_missing_pulses(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    with h5py.File(path, "r+") as nx_file:
+        group = nx_file["entry/events"]
+        # Drop pulses 50 to 52 and 120, and jitter pulse 10 by 1 ms
+        kept = np.setdiff1d(np.arange(200), [50, 51, 52, 120])
+        pulse_times = group["event_time_zero"][...]
+        pulse_times[10] += 1000000
+        event_index = group["event_index"][...]
+        del group["event_time_zero"], group["event_index"]
+        group.create_dataset("event_time_zero", data=pulse_times[kept]).attrs["units"] = "ns"
+        group.create_dataset("event_index", data=event_index[kept])
+        summary = recipe.NXevent_dataExamples(group).pulse_summary()
+    assert summary.period == pytest.approx(0.1)
+    assert list(summary.gaps) == [49, 116]
+    assert list(summary.missing_per_gap) == [3, 1]
+    assert summary.n_missing == 4
+    assert summary.jitter_max == pytest.approx(0.001)
+    assert summary.n_backwards == 0
+    assert "4 missing pulses in 2 gaps, the longest 0.4 s after pulse 49" in str(summary)
@@ -0,0 +1,79 @@
+import importlib
+import os
+import threading
+
+import h5py
+import numpy as np
+
+import nxchunks
+
+recipe = importlib.import_module("8CB1EBAE3B2DA51D.recipe")
+
+
+def read_off_file(filename):
+    with open(filename) as off_file:
+        lines = [line for line in off_file if not line.startswith("#")]
+    n_vertices, n_faces = [int(count) for count in lines[1].split()[:2]]
+    return np.loadtxt(lines[2:2 + n_vertices]), lines[2 + n_vertices:]
+
+
+def test_pixel_geometry_of_several_detectors_within_a_small_budget(tmp_path, examples_dir):
+    path = str(tmp_path / "two_detectors.nxs")
+    with h5py.File(os.path.join(examples_dir, "example_nx_geometry.nxs"), "r") as example:
+        with h5py.File(path, "w") as nx_file:
+            example.copy("raw_data_1", nx_file)
+            nx_file.copy("raw_data_1/instrument/detector_1", "raw_data_1/instrument/detector_3")
+
+    def output(off_filename, budget):
+        nxchunks.set_thread_memory_budget(budget)
+        try:
+            with h5py.File(path, "r") as nx_file:
+                recipe.NeXusOFF(nx_file["raw_data_1"]).output_shape_to_off_file(off_filename)
+        finally:
+            nxchunks.set_thread_memory_budget(None)
+
+    unlimited = str(tmp_path / "unlimited.off")
+    output(unlimited, None)
+    # Each pixel shape wants more than the whole budget, so holding one while the next waits never ends
+    budget = nxchunks.MemoryBudget(1000)
+    limited = str(tmp_path / "limited.off")
+    thread = threading.Thread(target=output, args=(limited, budget))
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert budget.free == budget.total
+
+    vertices, faces = read_off_file(limited)
+    expected_vertices, expected_faces = read_off_file(unlimited)
+    assert np.array_equal(vertices, expected_vertices)
+    assert faces == expected_faces
+
+
+def test_pixel_geometry_gives_its_memory_back_and_does_not_wait_forever(examples_dir, monkeypatch):
+    monkeypatch.setattr(recipe, "RESERVE_TIMEOUT", 0.1)
+    budget = nxchunks.MemoryBudget(1000)
+    # Held by someone else for the whole test
+    held = budget.reserve(1000)
+    shapes = []
+
+    def geometry():
+        nxchunks.set_thread_memory_budget(budget)
+        try:
+            with h5py.File(os.path.join(examples_dir, "example_nx_geometry.nxs"), "r") as nx_file:
+                nexus_off = recipe.NeXusOFF(nx_file["raw_data_1"])
+                for group in nexus_off.find_geometry_groups():
+                    shapes.append(nexus_off.get_geometry_from_group(group)[0].shape)
+        finally:
+            nxchunks.set_thread_memory_budget(None)
+
+    thread = threading.Thread(target=geometry)
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert len(shapes) > 0
+    # Nothing is kept once get_geometry_from_group returns
+    assert budget.free == 0
+    held.release()
+    assert budget.free == budget.total
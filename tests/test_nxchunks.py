@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import pytest
+
+import nxchunks
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    values = np.random.RandomState(0).uniform(-1, 1, 100000)
+    values[[17, 5000, 99999]] = np.nan
+    with h5py.File(str(tmp_path / "data.h5"), "w") as nx_file:
+        nx_file.create_dataset("chunked", data=values, chunks=(1000,), compression="gzip")
+        nx_file.create_dataset("contiguous", data=np.arange(20000, dtype=np.int32).reshape(200, 100))
+        nx_file.create_dataset("image", data=np.arange(60000, dtype=np.float32).reshape(30, 40, 50),
+                               chunks=(1, 40, 50))
+    with h5py.File(str(tmp_path / "data.h5"), "r") as nx_file:
+        yield nx_file, values
+
+
+def test_block_shape_is_whole_chunks_within_max_bytes(data_file):
+    nx_file, values = data_file
+    block = nxchunks.block_shape(nx_file["chunked"], max_bytes=20000)
+    assert block == (2000,)
+    block = nxchunks.block_shape(nx_file["image"], max_bytes=3 * 40 * 50 * 4)
+    assert block == (3, 40, 50)
+
+
+@pytest.mark.parametrize("name", ["chunked", "contiguous", "image"])
+@pytest.mark.parametrize("start, stop", [(0, None), (3, 17)])
+def test_chunk_slices_cover_each_element_once(data_file, name, start, stop):
+    nx_file, values = data_file
+    dset = nx_file[name]
+    seen = np.zeros(dset.shape, dtype=np.int64)
+    for selection in nxchunks.iter_chunk_slices(dset, max_bytes=4096, start=start, stop=stop):
+        seen[selection] += 1
+    expected = np.zeros(dset.shape, dtype=np.int64)
+    expected[start:stop] = 1
+    assert np.array_equal(seen, expected)
+
+
+def test_reduce_dataset_matches_numpy(data_file):
+    nx_file, values = data_file
+    reduction = nxchunks.reduce_dataset(nx_file["chunked"], max_bytes=8000, sampling=False)
+    assert reduction.count == len(values)
+    assert reduction.min == np.nanmin(values)
+    assert reduction.max == np.nanmax(values)
+    assert reduction.sum == pytest.approx(np.nansum(values))
+    assert reduction.coverage == 1.0
+
+
+def test_reduce_dataset_finds_first_decrease_and_value_outside_limits(tmp_path):
+    values = np.arange(10000)
+    values[6543] = 0
+    with h5py.File(str(tmp_path / "keys.h5"), "w") as nx_file:
+        dset = nx_file.create_dataset("keys", data=values, chunks=(100,))
+        reduction = nxchunks.reduce_dataset(dset, max_bytes=800, sampling=False, limits=(0, 5999))
+    assert not reduction.monotonic
+    assert reduction.first_decrease == 6543
+    assert not reduction.within_limits
+    assert reduction.first_outside_limits == 6000
+
+
+def test_reduce_dataset_finds_first_value_outside_limits_and_stops_there(tmp_path):
+    values = np.arange(10000, dtype=np.float64)
+    values[[4321, 8000]] = np.nan
+    with h5py.File(str(tmp_path / "times.h5"), "w") as nx_file:
+        dset = nx_file.create_dataset("times", data=values, chunks=(100,))
+        reduction = nxchunks.reduce_dataset(dset, max_bytes=800, sampling=False, limits=(0, 9999))
+        # a NaN is neither in order nor within the limits
+        assert (reduction.first_decrease, reduction.first_outside_limits) == (4321, 4321)
+        assert reduction.count == len(values)
+        reduction = nxchunks.reduce_dataset(dset, max_bytes=800, sampling=False, stop_at_failure=True)
+    assert reduction.failed and reduction.first_decrease == 4321
+    assert reduction.count == 4400
+
+
+def test_sampling_is_repeatable_and_reports_coverage(tmp_path):
+    # Blocks drawn are at least SAMPLE_BLOCK_BYTES, so the dataset has to span a few dozen of them
+    values = np.arange(4000000, dtype=np.float64)
+    with h5py.File(str(tmp_path / "large.h5"), "w") as nx_file:
+        dset = nx_file.create_dataset("large", data=values, chunks=(10000,))
+        sampling = nxchunks.Sampling(0.25, seed=3, min_bytes=0)
+        first = list(sampling.select(dset))
+        assert first == list(nxchunks.Sampling(0.25, seed=3, min_bytes=0).select(dset))
+        assert first != list(nxchunks.Sampling(0.25, seed=4, min_bytes=0).select(dset))
+        reduction = nxchunks.reduce_dataset(dset, sampling=sampling)
+    assert reduction.sum == sum(values[selection].sum() for selection in first)
+    assert sampling.coverage() == pytest.approx(reduction.count / float(len(values)))
+    assert 0.2 < sampling.coverage() < 0.3
+
+
+def test_sampling_reads_small_datasets_whole(data_file):
+    nx_file, values = data_file
+    assert nxchunks.Sampling(0.1).select(nx_file["chunked"]) is None
+    with pytest.raises(ValueError):
+        nxchunks.Sampling(0)
+
+
+@pytest.mark.parametrize("start, stop", [(0, None), (1234, 56789)])
+def test_read_parallel_matches_plain_read(data_file, start, stop):
+    nx_file, values = data_file
+    array = nxchunks.read_parallel(nx_file["chunked"], start, stop, workers=2, max_bytes=16000)
+    assert np.array_equal(array, values[start:stop], equal_nan=True)
+    array = nxchunks.read_parallel(nx_file["image"], 5, 25, workers=2, max_bytes=16000)
+    assert np.array_equal(array, nx_file["image"][5:25])
+    nxchunks.shutdown_pools()
+
+
+def test_read_parallel_splits_a_read_smaller_than_max_bytes_between_the_workers(data_file):
+    nx_file, values = data_file
+
+    class RecordingPool(ThreadPoolExecutor):
+        tasks = 0
+
+        def submit(self, *args, **kwargs):
+            RecordingPool.tasks += 1
+            return super(RecordingPool, self).submit(*args, **kwargs)
+
+    # 800 kB, far below the default max_bytes
+    with RecordingPool(max_workers=4) as pool:
+        array = nxchunks.read_parallel(nx_file["chunked"], workers=4, pool=pool)
+    assert isinstance(array, nxchunks.SharedArray)
+    assert RecordingPool.tasks > 1
+    assert np.array_equal(array, values, equal_nan=True)
+
+
+def test_memory_map_only_maps_contiguous_datasets(data_file):
+    nx_file, values = data_file
+    mapped = nxchunks.memory_map(nx_file["contiguous"])
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(mapped[10:20], nx_file["contiguous"][10:20])
+    assert isinstance(nxchunks.memory_map(nx_file["chunked"]), h5py.Dataset)
+
+
+def test_read_rows_maps_each_dataset_once(data_file):
+    nx_file, values = data_file
+    mapped = {}
+    rows = nxchunks.read_rows(nx_file, "contiguous", 10, 20, mapped=mapped)
+    assert np.array_equal(rows, nx_file["contiguous"][10:20])
+    assert isinstance(mapped["contiguous"], np.memmap)
+    first = mapped["contiguous"]
+    nxchunks.read_rows(nx_file, "contiguous", 0, 5, mapped=mapped)
+    assert mapped["contiguous"] is first
+    assert np.array_equal(nxchunks.read_rows(nx_file, "chunked", 3, 17, workers=2, mapped=mapped), values[3:17],
+                          equal_nan=True)
+    assert "chunked" not in mapped
+
+
+def test_memory_budget_grants_what_is_free():
+    budget = nxchunks.MemoryBudget(1000)
+    first = budget.reserve(800)
+    second = budget.reserve(500, minimum=100)
+    assert (first.nbytes, second.nbytes, budget.free) == (800, 200, 0)
+    first.release()
+    second.release()
+    assert budget.free == 1000
+
+
+def test_thread_memory_budget_replaces_the_process_budget():
+    process_budget = nxchunks.MemoryBudget(1000)
+    thread_budget = nxchunks.MemoryBudget(100)
+    nxchunks.set_memory_budget(process_budget)
+    try:
+        nxchunks.set_thread_memory_budget(thread_budget)
+        with nxchunks.reserve_memory(500, minimum=10) as reservation:
+            assert reservation.nbytes == 100
+        nxchunks.set_thread_memory_budget(None)
+        assert nxchunks.get_memory_budget() is process_budget
+    finally:
+        nxchunks.set_thread_memory_budget(None)
+        nxchunks.set_memory_budget(None)
+
+
+@pytest.mark.parametrize("size, nbytes", [("1000", 1000), ("512K", 512 * 1024), ("4G", 4 * 1024 ** 3),
+                                          ("1.5m", 3 * 512 * 1024), ("2MB", 2 * 1024 ** 2)])
+def test_parse_size(size, nbytes):
+    assert nxchunks.parse_size(size) == nbytes
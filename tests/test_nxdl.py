@@ -0,0 +1,135 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+import nxdl
+from nxschema import Attr, Dims, Dtype, SameLength
+
+NXDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definition xmlns="http://definition.nexusformat.org/nxdl/3.1" name="NXsmall" extends="NXobject" type="group">
+  <group type="NXentry">
+    <field name="title"/>
+    <field name="definition"/>
+    <group type="NXinstrument">
+      <group type="NXdetector">
+        <field name="data" type="NX_INT">
+          <dimensions rank="3">
+            <dim index="1" value="nFrames"/>
+            <dim index="2" value="nX"/>
+            <dim index="3" value="nY"/>
+          </dimensions>
+        </field>
+        <field name="distance" type="NX_FLOAT" recommended="true">
+          <attribute name="units" optional="false"/>
+        </field>
+      </group>
+    </group>
+    <group type="NXsample" name="sample" optional="true">
+      <field name="rotation_angle" type="NX_FLOAT">
+        <dimensions rank="1"><dim index="1" value="nFrames"/></dimensions>
+        <attribute name="units" optional="false"/>
+        <attribute name="vector"/>
+      </field>
+    </group>
+    <group type="NXmonitor" minOccurs="0">
+      <field name="data" type="NX_NUMBER">
+        <dimensions rank="1"><dim index="1" value="nFrames"/></dimensions>
+      </field>
+    </group>
+  </group>
+</definition>
+"""
+
+
+@pytest.fixture
+def nxdl_file(tmp_path):
+    path = str(tmp_path / "NXsmall.nxdl.xml")
+    with open(path, "w") as file:
+        file.write(NXDL)
+    return path
+
+
+def describe(checks):
+    described = []
+    for check in checks:
+        if isinstance(check, Dtype):
+            described.append(("Dtype",) + check.dtypes)
+        elif isinstance(check, Dims):
+            described.append(("Dims", check.dims))
+        elif isinstance(check, SameLength):
+            described.append(("SameLength", check.group))
+        elif isinstance(check, Attr):
+            described.append(("Attr", check.name))
+    return described
+
+
+def test_nxdl_table(nxdl_file):
+    name, table = nxdl.nxdl_table(nxdl_file)
+    assert name == "NXsmall"
+    rules = dict((item, (optional, describe(checks))) for item, (optional, checks) in table.items())
+    assert rules == {
+        "title": (False, []),
+        "definition": (False, []),
+        "instrument": (False, []),
+        "instrument/detector": (False, []),
+        "instrument/detector/data": (False, [("Dtype",) + tuple(nxdl._INTS), ("Dims", 3),
+                                             ("SameLength", "nFrames")]),
+        "instrument/detector/distance": (True, [("Dtype",) + tuple(nxdl._FLOATS), ("Attr", "units")]),
+        "sample": (True, []),
+        # inside an optional group
+        "sample/rotation_angle": (True, [("Dtype",) + tuple(nxdl._FLOATS), ("Dims", 1), ("SameLength", "nFrames"),
+                                         ("Attr", "units")]),
+        "monitor": (True, []),
+        "monitor/data": (True, [("Dtype",) + tuple(nxdl.NXDL_DTYPES["NX_NUMBER"]), ("Dims", 1),
+                                ("SameLength", "nFrames")]),
+    }
+
+
+def test_nxdl_without_an_entry(tmp_path):
+    path = str(tmp_path / "NXnothing.nxdl.xml")
+    with open(path, "w") as file:
+        file.write('<definition xmlns="http://definition.nexusformat.org/nxdl/3.1" name="NXnothing"/>')
+    with pytest.raises(ValueError):
+        nxdl.nxdl_table(path)
+
+
+def test_plan_of_the_definition(nxdl_file, tmp_path):
+    plan = nxdl.load_plan(nxdl_file, cache=None)
+    with h5py.File(str(tmp_path / "small.nxs"), "w") as nx_file:
+        entry = nx_file.create_group("entry")
+        entry["title"] = "small"
+        entry.create_dataset("instrument/detector/data", data=np.zeros((5, 2, 2), dtype=np.int32))
+        entry.create_dataset("sample/rotation_angle", data=np.linspace(0, 90, 4))
+        values, fails = plan.run(entry)
+    assert fails == [
+        "'NXsmall/definition' is missing from the NXsmall entry",
+        "'sample/rotation_angle' does not have the same nFrames as 'instrument/detector/data'",
+        "'/entry/sample/rotation_angle' does not have an attribute 'units'",
+    ]
+
+
+def test_load_plan_caches_until_the_file_or_the_generator_change(nxdl_file, tmp_path, monkeypatch):
+    cache = str(tmp_path / "cache")
+    compiled = []
+    compile_nxdl = nxdl.compile_nxdl
+
+    def counting_compile_nxdl(nxdl_file):
+        compiled.append(nxdl_file)
+        return compile_nxdl(nxdl_file)
+
+    monkeypatch.setattr(nxdl, "compile_nxdl", counting_compile_nxdl)
+    plan = nxdl.load_plan(nxdl_file, cache)
+    assert [item for item, optional, checks in nxdl.load_plan(nxdl_file, cache).rules] == plan.items
+    assert len(compiled) == 1 and len(os.listdir(cache)) == 1
+
+    with open(nxdl_file, "w") as file:
+        file.write(NXDL.replace('<field name="definition"/>', ''))
+    assert "definition" not in nxdl.load_plan(nxdl_file, cache).items
+    assert len(compiled) == 2
+
+    monkeypatch.setattr(nxdl, "GENERATOR_VERSION", nxdl.GENERATOR_VERSION + 1)
+    nxdl.load_plan(nxdl_file, cache)
+    nxdl.load_plan(nxdl_file, cache)
+    assert len(compiled) == 3 and len(os.listdir(cache)) == 3
@@ -0,0 +1,283 @@
+import asyncio
+import glob
+import importlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import pytest
+
+import nxchunks
+import nxfeature
+
+
+def keys(results):
+    return sorted((result.path, result.entry, result.feature, result.passed, result.message, result.coverage)
+                  for result in results)
+
+
+@pytest.fixture
+def paths(examples_dir):
+    return sorted(glob.glob(os.path.join(examples_dir, "*.nxs")))
+
+
+@pytest.fixture
+def checked(monkeypatch):
+    """
+    The paths given to check_file in this process
+    """
+    paths = []
+    check_file = nxfeature.check_file
+
+    def recording_check_file(path, *args, **kwargs):
+        paths.append(path)
+        return check_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(nxfeature, "check_file", recording_check_file)
+    return paths
+
+
+def test_workers_give_the_results_of_a_serial_run(paths):
+    serial = list(nxfeature.iter_results(paths, nxfeature.ALL_FEATURES, sample=0.5))
+    parallel = list(nxfeature.iter_results(paths, nxfeature.ALL_FEATURES, workers=3, sample=0.5))
+    assert keys(parallel) == keys(serial)
+    assert all(result.response is None for result in parallel)
+
+
+def test_cache_reuses_results_until_the_file_or_a_recipe_changes(tmp_path, examples_dir, monkeypatch, checked):
+    path = str(tmp_path / "example_nxevent_data.nxs")
+    shutil.copy(os.path.join(examples_dir, "example_nxevent_data.nxs"), path)
+    # The recipes are imported from where they are, the copy is only hashed for the cache key
+    recipes = str(tmp_path / "recipes")
+    shutil.copytree(nxfeature.RECIPE_DIR, recipes, symlinks=True)
+    monkeypatch.setattr(nxfeature, "RECIPE_DIR", recipes)
+    cache = str(tmp_path / "cache")
+
+    def run(workers=1, **options):
+        return keys(nxfeature.iter_results([path], nxfeature.ALL_FEATURES, workers, cache, **options))
+
+    first = run()
+    assert checked == [path]
+    assert run() == first
+    assert run(workers=2) == first
+    assert len(checked) == 1
+    assert run(sample=0.5) == first
+    assert len(checked) == 2
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert run() == first
+    assert len(checked) == 3
+
+    with open(os.path.join(recipes, "ECB064453EDB096D", "recipe.py"), "a") as recipe:
+        recipe.write("\n# edited\n")
+    assert run() == first
+    assert run() == first
+    assert len(checked) == 4
+
+
+def collect(results):
+    async def consume():
+        return [result async for result in results]
+
+    return asyncio.run(consume())
+
+
+def test_aiter_results_gives_the_results_of_iter_results(paths):
+    with ThreadPoolExecutor(3) as executor:
+        results = collect(nxfeature.aiter_results(paths, nxfeature.ALL_FEATURES, concurrency=4, sample=0.5,
+                                                  executor=executor))
+    assert keys(results) == keys(nxfeature.iter_results(paths, nxfeature.ALL_FEATURES, sample=0.5))
+
+
+def test_aiter_results_leaves_the_settings_of_the_executor_threads(paths):
+    with ThreadPoolExecutor(1) as executor:
+        collect(nxfeature.aiter_results(paths, nxfeature.ALL_FEATURES, sample=0.5, executor=executor, content=True))
+        assert executor.submit(nxchunks.get_sampling).result() is None
+        assert executor.submit(nxchunks.get_content_checks).result() is False
+
+
+def test_aiter_results_keeps_to_its_concurrency(paths, monkeypatch):
+    lock = threading.Lock()
+    running = [0, 0]
+    taken = []
+    check_file_cached = nxfeature._check_file_cached
+
+    def counting_check_file_cached(*args):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        try:
+            return check_file_cached(*args)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    def given_paths():
+        for path in paths:
+            taken.append(path)
+            yield path
+
+    async def consume(results):
+        seen = []
+        async for result in results:
+            seen.append(result)
+            # Paths are only taken from the iterable as files finish
+            assert len(taken) <= len(set(item.path for item in seen)) + 2
+        return seen
+
+    monkeypatch.setattr(nxfeature, "_check_file_cached", counting_check_file_cached)
+    with ThreadPoolExecutor(8) as executor:
+        results = asyncio.run(consume(nxfeature.aiter_results(given_paths(), nxfeature.ALL_FEATURES, concurrency=2,
+                                                              executor=executor)))
+    assert running == [0, 2]
+    assert taken == paths
+    assert set(result.path for result in results) == set(paths)
+
+
+def test_cancelling_aiter_results_cancels_the_queued_files(paths, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    check_file_cached = nxfeature._check_file_cached
+
+    def blocking_check_file_cached(path, *args):
+        calls.append(path)
+        started.set()
+        release.wait(10)
+        return check_file_cached(path, *args)
+
+    async def consume(executor):
+        async for result in nxfeature.aiter_results(paths, nxfeature.ALL_FEATURES, concurrency=3,
+                                                    executor=executor):
+            pass
+
+    async def cancel(executor):
+        task = asyncio.ensure_future(consume(executor))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    monkeypatch.setattr(nxfeature, "_check_file_cached", blocking_check_file_cached)
+    # One thread, so the second and third files wait in the queue of the executor
+    with ThreadPoolExecutor(1) as executor:
+        asyncio.run(cancel(executor))
+        release.set()
+    assert calls == paths[:1]
+
+
+EVENT_DATA = 0xECB064453EDB096D
+NXLOG = 0xB051F43BC680C13B
+
+
+def create_swmr_file(path):
+    """
+    A file being written in SWMR mode with an empty NXevent_data group and NXlog, open for writing
+    """
+    nx_file = h5py.File(path, "w", libver="latest")
+    entry = nx_file.create_group("entry")
+    entry.attrs["NX_class"] = np.bytes_(b"NXentry")
+    events = entry.create_group("events")
+    events.attrs["NX_class"] = np.bytes_(b"NXevent_data")
+    log = entry.create_group("log")
+    log.attrs["NX_class"] = np.bytes_(b"NXlog")
+    for group, names in [(events, ["event_time_zero", "event_index", "event_time_offset", "event_id"]),
+                         (log, ["time", "value"])]:
+        for name in names:
+            group.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(16,), dtype=np.int64)
+    nx_file.swmr_mode = True
+    return nx_file
+
+
+def append(dset, values):
+    start = dset.shape[0]
+    dset.resize((start + len(values),))
+    dset[start:] = values
+    dset.flush()
+
+
+def append_events(events, event_index, n_events):
+    append(events["event_time_zero"], np.arange(len(event_index)) + events["event_time_zero"].shape[0])
+    append(events["event_index"], event_index)
+    append(events["event_time_offset"], np.zeros(n_events))
+    append(events["event_id"], np.zeros(n_events))
+
+
+def test_swmr_monitors_validate_only_the_new_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "swmr.nxs")
+    writer = create_swmr_file(path)
+    events = writer["entry/events"]
+    reads = []
+    getitem = h5py.Dataset.__getitem__
+
+    def recording_getitem(dset, selection):
+        reads.append((dset.name.split("/")[-1], selection))
+        return getitem(dset, selection)
+
+    with h5py.File(path, "r", libver="latest", swmr=True) as reader:
+        monitor = importlib.import_module("ECB064453EDB096D.recipe").NXevent_dataMonitor(reader["entry/events"])
+        log_monitor = importlib.import_module("B051F43BC680C13B.recipe").NXlogMonitor(reader["entry/log"])
+        monkeypatch.setattr(h5py.Dataset, "__getitem__", recording_getitem)
+
+        def refresh(expected_reads):
+            del reads[:]
+            fails = monitor.refresh() + log_monitor.refresh()
+            assert reads == expected_reads
+            return fails
+
+        append_events(events, [0, 3, 5], 8)
+        assert refresh([("event_index", slice(0, 3))]) == []
+        assert monitor.grew and (monitor.n_pulses, monitor.n_events) == (3, 8)
+        append_events(events, [4], 0)
+        assert refresh([("event_index", slice(3, 4))]) == [
+            "event_index decreases between entries 3 and 4 in /entry/events"]
+        # The decrease is reported once, only the new pulses are read afterwards
+        append_events(events, [9, 12], 4)
+        assert refresh([("event_index", slice(4, 6))]) == []
+        assert refresh([]) == []
+        assert not monitor.grew and not log_monitor.grew
+
+        append(writer["entry/log/time"], [1, 2])
+        assert refresh([]) == ["The first dimension of the value dataset should have the same size as the time "
+                               "dataset in /entry/log"]
+        assert log_monitor.grew and log_monitor.n_entries == 2
+        append(writer["entry/log/value"], [5, 6])
+        assert refresh([]) == []
+    writer.close()
+
+
+def test_follow_swmr_stops_when_the_file_stops_growing(tmp_path, capsys):
+    path = str(tmp_path / "swmr.nxs")
+    writer = create_swmr_file(path)
+    events = writer["entry/events"]
+
+    def write():
+        for event_index, n_events in [([0, 3], 3), ([2], 1), ([4], 2)]:
+            time.sleep(0.05)
+            append_events(events, event_index, n_events)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    discoverers = [(path, nxfeature.make_discoverer(path, [EVENT_DATA, NXLOG], swmr=True))]
+    failed = nxfeature.follow_swmr(discoverers, 0.01, idle_refreshes=30)
+    thread.join()
+    writer.close()
+    assert failed
+    output = capsys.readouterr().out
+    assert "event_index decreases between entries 2 and 3 in /entry/events" in output
+    assert "with 4 pulses and 6 events so far" in output
+
+    # Once the file is complete the command line stops after the idle refreshes asked for, failing on the
+    # decrease found in the first refresh
+    run = subprocess.run([sys.executable, nxfeature.__file__, "-t", "--swmr", "0.01", "--swmr-idle", "3", path],
+                         stdout=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert run.returncode == 1
+    assert "event_index decreases between entries 0 and 4 in /entry/events" in run.stdout
@@ -0,0 +1,85 @@
+import h5py
+import numpy as np
+import pytest
+
+import nxrepack
+from test_event_data import recipe, write_events
+
+
+@pytest.fixture
+def repacked(tmp_path):
+    source = str(tmp_path / "events.nxs")
+    write_events(source)
+    with h5py.File(source, "r+") as nx_file:
+        nx_file["entry"].attrs["NX_class"] = "NXentry"
+        nx_file["entry/events/event_time_zero"].attrs["offset"] = "2017-09-28T15:06:48Z"
+        nx_file["entry/title"] = "not an event dataset"
+    dest = str(tmp_path / "repacked.nxs")
+    assert nxrepack.repack_file(source, dest, chunk_bytes=1024, compression="gzip", cue_interval=1.0,
+                                max_bytes=4096) == ["/entry/events"]
+    with h5py.File(source, "r") as source_file, h5py.File(dest, "r") as dest_file:
+        yield source_file["entry/events"], dest_file["entry/events"]
+
+
+def test_repacked_events_are_the_same(repacked):
+    source, dest = repacked
+    assert dest.file["entry"].attrs["NX_class"] == "NXentry"
+    assert "title" not in dest.file["entry"]
+    for name in ("event_time_zero", "event_index", "event_time_offset", "event_id"):
+        assert np.array_equal(dest[name][...], source[name][...])
+        assert dest[name].dtype == source[name].dtype
+        assert dict(dest[name].attrs) == dict(source[name].attrs)
+        assert dest[name].chunks == (1024 // dest[name].dtype.itemsize,)
+        assert dest[name].compression == "gzip"
+    for start, end in [(2.0, 2.3), (-np.inf, np.inf)]:
+        times, detector_ids = recipe.NXevent_dataExamples(dest).get_events_by_time_range(start, end)
+        expected_times, expected_ids = recipe.NXevent_dataExamples(source).get_events_by_time_range(start, end)
+        assert np.array_equal(times, expected_times)
+        assert np.array_equal(detector_ids, expected_ids)
+
+
+def test_cues_point_at_the_first_pulse_with_events_of_each_interval(repacked):
+    source, dest = repacked
+    pulse_times = source["event_time_zero"][...] * 1e-9
+    event_index = source["event_index"][...]
+    n_events = source["event_id"].len()
+    expected = []
+    for pulse in range(len(pulse_times)):
+        if event_index[pulse] >= n_events:
+            continue
+        if not expected or (pulse_times[pulse] - pulse_times[expected[0]]) // 1.0 != \
+                (pulse_times[expected[-1]] - pulse_times[expected[0]]) // 1.0:
+            expected.append(pulse)
+    assert len(expected) == 20
+    assert np.array_equal(dest["cue_timestamp_zero"][...], source["event_time_zero"][expected])
+    assert np.array_equal(dest["cue_index"][...], event_index[expected])
+    assert dict(dest["cue_timestamp_zero"].attrs) == dict(source["event_time_zero"].attrs)
+    # Every cue is the first event of its pulse, and the cues are in order
+    assert np.all(np.isin(dest["cue_index"][...], event_index))
+    assert np.all(np.diff(dest["cue_index"][...]) > 0)
+    assert recipe.validate_content(dest) == []
+
+
+def test_repack_into_itself_is_refused(tmp_path):
+    path = str(tmp_path / "events.nxs")
+    write_events(path)
+    with pytest.raises(ValueError):
+        nxrepack.repack_file(path, path)
+
+
+def test_repack_group_under_the_root(tmp_path):
+    source = str(tmp_path / "events.nxs")
+    write_events(source, name="events")
+    with h5py.File(source, "r+") as nx_file:
+        nx_file["link"] = nx_file["events/event_id"]
+        nx_file["title"] = "not an event dataset"
+    dest = str(tmp_path / "repacked.nxs")
+    assert nxrepack.repack_file(source, dest, whole_file=True, chunk_bytes=1024, cue_interval=1.0) == ["/events"]
+    with h5py.File(source, "r") as source_file, h5py.File(dest, "r") as dest_file:
+        assert sorted(dest_file) == ["events", "link", "title"]
+        assert dest_file["link"] == dest_file["events/event_id"]
+        assert dest_file["title"][()] == source_file["title"][()]
+        for name in ("event_time_zero", "event_index", "event_time_offset", "event_id"):
+            assert np.array_equal(dest_file["events"][name][...], source_file["events"][name][...])
+        assert "cue_index" in dest_file["events"]
+        assert recipe.validate_content(dest_file["events"]) == []
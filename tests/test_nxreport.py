@@ -0,0 +1,122 @@
+import csv
+import glob
+import os
+from xml.etree import ElementTree
+
+import pytest
+
+import nxfeature
+import nxreport
+from nxfeature import FeatureResult
+
+
+@pytest.fixture
+def results():
+    return [
+        FeatureResult("run 1.nxs", "entry", 0xB051F43BC680C13B, "NXlog", True, "3 logs, <all> \"fine\" & sorted",
+                      coverage=0.5, summary={"logs": ["a", "b"]}),
+        FeatureResult("run 1.nxs", "entry", 0x3930676423686820, "Title", False, "no title,\nat all\x01",
+                      "AssertionError", "Traceback ..."),
+        FeatureResult("broken.nxs", None, None, None, False, "unable to open file", "OSError", "Traceback ..."),
+        FeatureResult("run 1.nxs", "entry", 0xDEADBEEF, None, False, "no recipe for feature DEADBEEF",
+                      "ImportError", "Traceback ..."),
+    ]
+
+
+def write(writer_class, filename, results):
+    with writer_class(filename) as writer:
+        for result in results:
+            writer.write(result)
+
+
+def test_jsonl_round_trip(tmp_path, results):
+    filename = str(tmp_path / "report.jsonl")
+    write(nxreport.JSONLinesWriter, filename, results)
+    assert list(nxreport.read_report(filename)) == [result.to_dict() for result in results]
+
+
+def test_junit_round_trip(tmp_path, results):
+    filename = str(tmp_path / "report.xml")
+    write(nxreport.JUnitWriter, filename, results)
+    suite = ElementTree.parse(filename).getroot().find("testsuite")
+    assert (suite.get("tests"), suite.get("failures"), suite.get("errors")) == ("4", "1", "2")
+
+    passed, failed, unreadable, unknown_feature = nxreport.read_report(filename)
+    assert passed == dict(results[0].to_dict(), coverage=None, summary=None)
+    # characters XML cannot hold are replaced
+    assert failed == dict(results[1].to_dict(), message="no title,\nat all?", stack=None)
+    assert unreadable == results[2].to_dict()
+    assert unknown_feature == results[3].to_dict()
+
+
+def test_csv_escaping(tmp_path, results):
+    filename = str(tmp_path / "report.csv")
+    write(nxreport.CSVWriter, filename, results)
+    with open(filename, encoding="utf8", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == list(nxreport.CSVWriter.COLUMNS)
+    assert rows[1][:3] == ["run 1.nxs", "entry", "B051F43BC680C13B"]
+    assert rows[2][-1] == "no title,\nat all\x01"
+    assert rows[3][:3] == ["broken.nxs", "", ""]
+    assert rows[4][:4] == ["run 1.nxs", "entry", "00000000DEADBEEF", ""]
+    assert len(rows) == 5
+
+
+@pytest.mark.parametrize("keep", [0, 2])
+def test_truncated_jsonl_is_refused(tmp_path, results, keep):
+    filename = str(tmp_path / "report.jsonl")
+    write(nxreport.JSONLinesWriter, filename, results)
+    with open(filename, encoding="utf8") as file:
+        lines = file.readlines()
+    with open(filename, "w", encoding="utf8") as file:
+        file.writelines(lines[:keep])
+    with pytest.raises(ValueError):
+        list(nxreport.read_jsonl(filename))
+    merged = list(nxfeature.merge_reports([filename]))
+    assert len(merged) == keep + 1
+    assert merged[-1].entry is None and not merged[-1].passed
+
+
+def test_jsonl_with_a_wrong_count_is_refused(tmp_path, results):
+    filename = str(tmp_path / "report.jsonl")
+    write(nxreport.JSONLinesWriter, filename, results)
+    with open(filename, encoding="utf8") as file:
+        lines = file.readlines()
+    with open(filename, "w", encoding="utf8") as file:
+        file.writelines(lines[:1] + lines[-1:])
+    with pytest.raises(ValueError):
+        list(nxreport.read_jsonl(filename))
+
+
+@pytest.mark.parametrize("balance_size", [False, True])
+def test_shards_partition_the_paths(examples_dir, balance_size):
+    paths = sorted(glob.glob(os.path.join(examples_dir, "*.nxs")))
+    shards = [nxfeature.shard_paths(paths, index, 3, balance_size) for index in range(3)]
+    assert sorted(path for shard in shards for path in shard) == paths
+    # every shard is given the paths in its own order
+    assert nxfeature.shard_paths(paths[::-1], 1, 3, balance_size) == shards[1][::-1]
+
+
+def test_merged_shards_give_the_results_of_the_whole_run(tmp_path, examples_dir):
+    def keys(results):
+        return sorted((result.path, result.entry, result.feature, result.passed, result.message)
+                      for result in results)
+
+    paths = sorted(glob.glob(os.path.join(examples_dir, "*.nxs")))
+    reports = []
+    for index in range(3):
+        writer_class = nxreport.JUnitWriter if index == 0 else nxreport.JSONLinesWriter
+        reports.append(str(tmp_path / "shard{}.report".format(index)))
+        write(writer_class, reports[-1],
+              nxfeature.iter_results(nxfeature.shard_paths(paths, index, 3), nxfeature.ALL_FEATURES))
+    whole = list(nxfeature.iter_results(paths, nxfeature.ALL_FEATURES))
+    assert keys(nxfeature.merge_reports(reports)) == keys(whole)
+
+
+def test_merged_junit_report_keeps_a_feature_without_recipe_failing(tmp_path, results):
+    # a shard exits with an error on a feature whose recipe cannot be loaded, so its merge has to as well
+    filename = str(tmp_path / "shard.xml")
+    write(nxreport.JUnitWriter, filename, results[3:])
+    merged, = nxfeature.merge_reports([filename])
+    assert not merged.passed
+    assert (merged.entry, merged.feature) == ("entry", 0xDEADBEEF)
@@ -0,0 +1,98 @@
+import h5py
+import numpy as np
+import pytest
+
+from nxschema import compile_schema, Attr, Custom, Dims, Dtype, Include, InRange, IsScalar, SameLength, Shape
+
+
+@pytest.fixture
+def group(tmp_path):
+    with h5py.File(str(tmp_path / "schema.h5"), "w") as nx_file:
+        group = nx_file.create_group("entry")
+        group.create_dataset("data/data", data=np.zeros((10, 4, 4), dtype=np.uint16))
+        group.create_dataset("data/image_key", data=np.array([0, 0, 1, 2, 0, 0, 0, 0, 0, 5]))
+        group.create_dataset("data/rotation_angle", data=np.linspace(0, 180, 9))
+        group.create_dataset("title", data="a title")
+        group["data/rotation_angle"].attrs["units"] = "degree"
+        yield group
+
+
+def test_passing_plan_includes_values(group):
+    plan = compile_schema({
+        "data/data": [Include(), Dtype("uint16"), Dims(3), Shape((10, 4, 4))],
+        "title": [IsScalar(), Dtype(h5py.string_dtype())],
+        "data": [Include()],
+    })
+    values, fails = plan.run(group)
+    assert fails == []
+    assert sorted(values) == ["data", "data/data"]
+    assert values["data/data"].name == "/entry/data/data"
+
+
+def test_failures_are_in_table_order(group):
+    plan = compile_schema({
+        "missing": [Dtype("int8")],
+        "data/image_key": [InRange(0, 3), Dims(2)],
+        "data/rotation_angle": [Attr("units", value="deg"), SameLength()],
+        "data/data": [SameLength(), Dtype("float64", message="'{item}' is {dtype}")],
+        "optional": (True, [Dtype("int8")]),
+        "data": [Dims(1)],
+    }, missing="'{item}' is missing from {name}")
+    values, fails = plan.run(group)
+    assert fails == [
+        "'missing' is missing from /entry",
+        "'data/image_key' has values outside of the normal range 0 to 3",
+        "/entry/data/image_key has dims 1, expected 2",
+        "attribute 'units' of /entry/data/rotation_angle has value degree, expected deg",
+        "'data/data' does not have the same number of frames as 'data/rotation_angle'",
+        "'data/data' is uint16",
+        "'data' is not a dataset",
+    ]
+
+
+def test_custom_checks_run_in_table_order(group):
+    calls = []
+
+    def check(context, parent, item, values, fails):
+        context[item] = len(context)
+        calls.append((item, context[item], parent.name))
+        if item == "title":
+            fails.append("custom failure")
+
+    plan = compile_schema({"title": [check], "data/data": [Custom(check)], "nothing": (True, [check])})
+    values, fails = plan.run(group)
+    assert calls == [("title", 0, "/entry"), ("data/data", 1, "/entry")]
+    assert fails == ["custom failure"]
+
+
+def test_min_occurs(group):
+    plan = compile_schema({"title": {"minOccurs": 1, "checks": []}, "name": {"minOccurs": 0, "checks": []}})
+    assert plan.run(group) == ({}, [])
+    with pytest.raises(ValueError):
+        compile_schema({"title": {"minOccurs": 2, "checks": []}})
+
+
+def test_empty_datasets_fail_the_dataset_checks(group):
+    group.create_dataset("data/empty", data=h5py.Empty("f"))
+    group["data/empty"].attrs["units"] = "degree"
+    plan = compile_schema({
+        "data/empty": [Include(), Dtype("float32"), Dims(1), Shape((10,)), SameLength(), InRange(0, 1),
+                       Attr("units")],
+        "data/data": [SameLength()],
+    })
+    values, fails = plan.run(group)
+    assert fails == ["'data/empty' is an empty dataset"] * 5
+    assert values["data/empty"].name == "/entry/data/empty"
+
+
+def test_is_scalar_reads_no_values(group, monkeypatch):
+    def read(self, selection):
+        raise AssertionError("{} was read".format(self.name))
+
+    monkeypatch.setattr(h5py.Dataset, "__getitem__", read)
+    plan = compile_schema({"title": [IsScalar(False)], "data/data": [IsScalar()], "data/image_key": [IsScalar(False)]})
+    values, fails = plan.run(group)
+    assert fails == [
+        "/entry/title == scalar is True, expected False",
+        "/entry/data/data == scalar is False, expected True",
+    ]
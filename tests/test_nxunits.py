@@ -0,0 +1,69 @@
+import math
+
+import h5py
+import numpy as np
+import pytest
+
+import nxunits
+
+
+@pytest.mark.parametrize("from_units, to_units, factor", [
+    ("s", "ms", 1000), ("us", "ns", 1000), ("ns", "s", 1e-9), ("minutes", "second", 60), ("h", "min", 60),
+    ("mm", "m", 1e-3), ("angstrom", "nm", 0.1), ("µm", "um", 1), ("deg", "rad", math.pi / 180),
+])
+def test_scale_factor(from_units, to_units, factor):
+    assert float(nxunits.scale_factor(from_units, to_units)) == pytest.approx(factor)
+
+
+def test_whole_factors_are_exact_integers():
+    assert nxunits.scale_factor("us", "ns") == 1000
+    assert isinstance(nxunits.scale_factor("us", "ns"), int)
+
+
+@pytest.mark.parametrize("units", [b"ms", np.bytes_(b"ms"), np.array([b"ms"]), np.array(["ms"]), " ms "])
+def test_units_attributes_written_any_way(units):
+    assert nxunits.units_string(units) == "ms"
+    assert nxunits.convert(3, units, "s") == pytest.approx(0.003)
+
+
+def test_convert_arrays():
+    values = np.arange(5, dtype=np.float32)
+    result = nxunits.convert(values, "ms", "us")
+    assert result.dtype == np.float64
+    assert np.array_equal(result, values * 1000.0)
+    assert np.array_equal(values, np.arange(5))
+
+
+def test_convert_to_integer_timestamps_rounds():
+    result = nxunits.convert(np.array([1.0000000004, 2.5e-9]), "s", "ns", dtype=np.int64)
+    assert result.dtype == np.int64
+    assert list(result) == [1000000000, 2]
+    assert list(nxunits.convert(np.array([1, 2], dtype=np.int64), "us", "ns", dtype=np.int64)) == [1000, 2000]
+
+
+def test_convert_in_place():
+    values = np.array([1.0, 2.0])
+    result = nxunits.convert(values, "s", "ms", copy=False)
+    assert result is values
+    assert list(values) == [1000.0, 2000.0]
+
+
+@pytest.mark.parametrize("from_units, to_units", [("s", "m"), ("furlong", "m"), ("K", "degC")])
+def test_unsupported_conversions_raise(from_units, to_units):
+    with pytest.raises(ValueError):
+        nxunits.scale_factor(from_units, to_units)
+
+
+def test_units_must_be_strings():
+    with pytest.raises(ValueError):
+        nxunits.units_string(3)
+
+
+def test_dataset_units(tmp_path):
+    with h5py.File(str(tmp_path / "units.h5"), "w") as nx_file:
+        nx_file.create_dataset("time", data=[1.0]).attrs["units"] = np.bytes_(b"ns")
+        nx_file.create_dataset("bare", data=[1.0])
+        assert nxunits.dataset_units(nx_file["time"]) == "ns"
+        assert nxunits.dataset_units(nx_file["bare"], default="s") == "s"
+        with pytest.raises(KeyError):
+            nxunits.dataset_units(nx_file["bare"])
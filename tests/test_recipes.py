@@ -0,0 +1,60 @@
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+import h5py
+import pytest
+
+import nxfeature
+import nxindex
+
+EXAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                         "examples", "*.nxs")))
+
+
+@pytest.mark.parametrize("path", EXAMPLES, ids=os.path.basename)
+def test_detect_agrees_with_process(path):
+    disagree = []
+    with h5py.File(path, "r") as nx_file:
+        for entry in nx_file:
+            if not isinstance(nx_file[entry], h5py.Group):
+                continue
+            index = nxindex.EntryIndex(nx_file, entry)
+            entry_features = nxfeature.InsaneEntryWithFeatures(nx_file, entry, [])
+            for feature in nxfeature.recipe_features():
+                recipe = entry_features.feature_recipe(feature)
+                detected = bool(recipe.detect(index))
+                try:
+                    recipe.process()
+                    passed = True
+                except Exception:
+                    passed = False
+                if detected != passed:
+                    disagree.append("{}[{}] {:0>16X} detect {} process {}".format(
+                        os.path.basename(path), entry, feature, detected, passed))
+    assert disagree == []
+
+
+@pytest.mark.parametrize("path", EXAMPLES, ids=os.path.basename)
+def test_detect_file_reports_no_errors(path):
+    errors = []
+    nxfeature.detect_file(path, errors=errors)
+    assert errors == []
+
+
+def test_write_features_needs_detect(tmp_path, examples_dir):
+    path = str(tmp_path / "example_nx_log.nxs")
+    shutil.copy(os.path.join(examples_dir, "example_nx_log.nxs"), path)
+    command = [sys.executable, nxfeature.__file__, "--write-features", path]
+    run = subprocess.run(command, stderr=subprocess.PIPE, universal_newlines=True)
+    assert run.returncode == 2
+    assert "--write-features changes the files given, so it needs --detect" in run.stderr
+    with open(path, "rb") as nx_file, open(os.path.join(examples_dir, "example_nx_log.nxs"), "rb") as example:
+        assert nx_file.read() == example.read()
+
+    assert subprocess.run(command + ["--detect"], stdout=subprocess.PIPE).returncode == 0
+    detected = nxfeature.detect_file(path)
+    with h5py.File(path, "r") as nx_file:
+        assert [(entry, list(nx_file[entry]["features"][...])) for entry, features in detected] == detected